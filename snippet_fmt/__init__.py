@@ -32,26 +32,58 @@ Format and validate code snippets in reStructuredText files.
 
 # stdlib
 import contextlib
+import copy
 import os
 import re
 import textwrap
-from typing import Dict, Iterator, List, Match, NamedTuple, Optional
+from typing import (
+		IO,
+		TYPE_CHECKING,
+		Any,
+		Callable,
+		Dict,
+		Iterable,
+		Iterator,
+		List,
+		Mapping,
+		NamedTuple,
+		Optional,
+		Tuple,
+		Union
+		)
 
 # 3rd party
-import click
-import entrypoints  # type: ignore[import-untyped]
-import tokenize_rt  # type: ignore[import-untyped]
-from consolekit.terminal_colours import ColourTrilean, resolve_color_default
-from consolekit.utils import coloured_diff
 from domdf_python_tools.paths import PathPlus
-from domdf_python_tools.stringlist import StringList
 from domdf_python_tools.typing import PathLike
-from formate.utils import syntaxerror_for_file
 
 # this package
-import snippet_fmt.docstring
+import snippet_fmt.cache
+from snippet_fmt.budget import SnippetTimeout, call_with_timeout
+from snippet_fmt.cache import Cache, SnippetCache
 from snippet_fmt.config import SnippetFmtConfigDict
-from snippet_fmt.formatters import Formatter, format_ini, format_json, format_python, format_toml, noformat
+from snippet_fmt.formatters import (
+		Formatter,
+		format_ini,
+		format_json,
+		format_many,
+		format_python,
+		format_toml,
+		get_capabilities,
+		noformat,
+		supports_batching
+		)
+from snippet_fmt.profiling import profiler
+from snippet_fmt.registry import formatter_registry
+from snippet_fmt.scanner import CodeBlockSpan, DirectiveScanner, LineIndex
+from snippet_fmt.session import FormattingSession
+
+if TYPE_CHECKING:
+	# 3rd party
+	import tokenize_rt  # type: ignore[import-untyped]
+	from consolekit.terminal_colours import ColourTrilean
+
+	# this package
+	from snippet_fmt.docstring import DocstringToken
 
 __author__: str = "Dominic Davis-Foster"
 __copyright__: str = "2021 Dominic Davis-Foster"
@@ -71,6 +103,12 @@ __all__ = (
 
 TRAILING_NL_RE = re.compile(r'\n+\Z', re.MULTILINE)
 
+# Whitespace at the end of a line.
+_trailing_ws = re.compile(r"[^\S\n]\n")
+
+# ASCII whitespace other than spaces, tabs and newlines.
+_unusual_ws = "\r\x0b\x0c\x1c\x1d\x1e\x1f"
+
 
 class CodeBlockError(NamedTuple):
 	"""
@@ -84,6 +122,129 @@ class CodeBlockError(NamedTuple):
 	exc: Exception
 
 
+@contextlib.contextmanager
+def _syntaxerror_for_file(filename: PathLike) -> Iterator[None]:
+	# Equivalent to ``formate.utils.syntaxerror_for_file``, without importing ``formate``.
+	try:
+		yield
+	except SyntaxError as e:
+		if e.filename == "<unknown>":
+			e.filename = os.fspath(filename)
+
+		raise e
+
+
+def _splice(source: str, replacements: Iterable[Tuple[int, int, str]]) -> str:
+	# Replace the given ``(start, end, text)`` spans, which must be in order and not overlap.
+	# The source is returned unchanged (not copied) if there are no replacements.
+
+	parts = []
+	last_end = 0
+
+	for start, end, text in replacements:
+		parts.append(source[last_end:start])
+		parts.append(text)
+		last_end = end
+
+	if not parts:
+		return source
+
+	parts.append(source[last_end:])
+	return ''.join(parts)
+
+
+def _normalise_whitespace(source: str) -> str:
+	# Strips trailing whitespace from each line, and ensures the source ends with a single newline.
+	# The source is returned unchanged (not copied) if that's already the case.
+
+	if not source:
+		return source
+
+	if not _has_trailing_whitespace(source):
+		if source.endswith('\n') and not source.endswith("\n\n") and source != '\n':
+			return source
+
+		# Only the end of the source needs changing.
+		source = source.rstrip()
+		return source + '\n' if source else source
+
+	lines = [line.rstrip() for line in source.split('\n')]
+	while lines and not lines[-1]:
+		lines.pop()
+
+	lines.append('')
+	return '\n'.join(lines)
+
+
+def _has_trailing_whitespace(source: str) -> bool:
+	# Returns whether any line of the source ending with a newline has trailing whitespace.
+	# Searching for the usual ASCII cases with :meth:`str.find` is much faster than the regular expression.
+
+	if source.isascii() and not any(char in source for char in _unusual_ws):
+		return " \n" in source or "\t\n" in source
+
+	return _trailing_ws.search(source) is not None
+
+
+def _strip_trailing_whitespace(source: str) -> str:
+	# Strips trailing whitespace from each line of source ending with a newline.
+	# The source is returned unchanged (not copied) if there isn't any.
+
+	if not _has_trailing_whitespace(source):
+		return source
+
+	return '\n'.join(line.rstrip() for line in source.split('\n'))
+
+
+def _last_unindented_line(chunk: str, at_line_start: bool) -> Optional[int]:
+	# Returns the offset of the start of the last line in the chunk which begins with a non-whitespace character.
+	# A newline at the very end of the chunk doesn't start a line, as the rest of the line hasn't been read yet.
+
+	end = len(chunk) - 1
+
+	while True:
+		newline = chunk.rfind('\n', 0, end)
+		if newline == -1:
+			return 0 if at_line_start and not chunk[0].isspace() else None
+		if not chunk[newline + 1].isspace():
+			return newline + 1
+		end = newline
+
+
+def _iter_pieces(fp: IO[str], chunk_size: int) -> Iterator[Tuple[str, bool]]:
+	# Yields the text of the file in pieces, each ending just before a line which isn't indented or blank,
+	# along with whether it's the last piece.
+	# A code block can't continue past such a line, so each piece can be reformatted on its own.
+
+	parts: List[str] = []
+	at_line_start = True
+
+	while True:
+		chunk = fp.read(chunk_size)
+		if not chunk:
+			yield ''.join(parts), True
+			return
+
+		cut = _last_unindented_line(chunk, at_line_start)
+		at_line_start = chunk.endswith('\n')
+
+		if cut is None or not (cut or parts):
+			parts.append(chunk)
+			continue
+
+		parts.append(chunk[:cut])
+		yield ''.join(parts), False
+		parts = [chunk[cut:]]
+
+
+def _dedent_block(block: CodeBlockSpan) -> str:
+	# Equivalent to ``textwrap.dedent(block.code)`` for code without trailing whitespace,
+	# as every line of code is either blank or starts with the indentation of the first line.
+
+	prefix = block.indent + block.body_indent
+	return block.code[len(prefix):].replace('\n' + prefix, '\n')
+
+
 # TODO: reformatter for docstrings
 
 
@@ -91,11 +252,15 @@ class Reformatter:
 	"""
 	Base class for reformatters.
 
-	:param source: The file content.
+	:param source: The file content, or a function which returns it.
+		The function is called the first time the content is needed.
 	:param filename: The file being formatted, for display in error messages.
 	:param config: The ``snippet_fmt`` configuration, parsed from a TOML file (or similar).
+	:param session: State shared with other reformatters using the same configuration.
+		If not given, a new :class:`~.FormattingSession` is created.
 
 	.. versionadded:: 0.2.0
+	.. versionchanged:: 0.4.0  Added the ``session`` argument, and ``source`` may be a function returning the content.
 	"""
 
 	#: The filename being reformatted, as a POSIX-style path.
@@ -106,29 +271,74 @@ class Reformatter:
 
 	errors: List[CodeBlockError]
 
-	def __init__(self, source: str, filename: str, config: SnippetFmtConfigDict):
+	#: State shared with other reformatters using the same configuration.
+	#:
+	#: .. versionadded:: 0.4.0
+	session: FormattingSession
+
+	#: Cache of formatted code snippets. Set to :py:obj:`None` to always call the formatter.
+	#:
+	#: Only the results of formatters declared as :attr:`~.FormatterCapabilities.pure`
+	#: (and not :attr:`~.FormatterCapabilities.cost` ``'cheap'``) are cached.
+	#:
+	#: .. versionadded:: 0.4.0
+	snippet_cache: Optional[SnippetCache] = snippet_fmt.cache.snippet_cache
+
+	#: Stop at the first code block which is changed, leaving the rest of the file as it is.
+	#:
+	#: This is useful when only checking whether the file would be changed.
+	#:
+	#: .. versionadded:: 0.4.0
+	fail_fast: bool = False
+
+	def __init__(
+			self,
+			source: Union[str, Callable[[], str]],
+			filename: str,
+			config: SnippetFmtConfigDict,
+			session: Optional[FormattingSession] = None,
+			):
 		self.filename = filename
 		self.config = config
-		self._unformatted_source = source
+
+		# The file content, once known, and the function to call to read it otherwise.
+		self._source: Optional[str] = None
+		self._read_source: Optional[Callable[[], str]] = None
+
+		if isinstance(source, str):
+			self._source = source
+		else:
+			self._read_source = source
+
 		self._reformatted_source: Optional[str] = None
 		self.errors = []
+		self._line_index: Optional[LineIndex] = None
+
+		# The ``(start, end, text)`` replacements made to the source, if nothing else was changed.
+		self._replacements: Optional[List[Tuple[int, int, str]]] = None
+
+		# Results from formatters implementing ``format_many``, keyed by language and dedented code.
+		self._batched: Dict[Tuple[Optional[str], str], Union[str, Exception]] = {}
 
-		self._formatters: Dict[str, Formatter] = {
-				"bash": noformat,
-				"python": format_python,
-				"python3": format_python,
-				"pycon": format_python,
-				"toml": format_toml,
-				"ini": format_ini,
-				"json": format_json,
-				}
-		self.load_extra_formatters()
+		if session is None:
+			session = FormattingSession(config)
+
+		self.session = session
+
+	@property
+	def _unformatted_source(self) -> str:
+		if self._source is None:
+			assert self._read_source is not None
+			self._source = self._read_source()
+
+		return self._source
 
 	def compile_regex(self) -> re.Pattern:
 		"""
 		Compile the regular expression for finding directives.
 
 		.. versionadded:: 0.2.0
+		.. versionchanged:: 0.4.0  No longer used by :meth:`~.Reformatter.run`; see :meth:`~.compile_scanner`.
 		"""
 
 		directives = '|'.join(self.config["directives"])
@@ -144,6 +354,15 @@ class Reformatter:
 				re.MULTILINE,
 				)
 
+	def compile_scanner(self) -> DirectiveScanner:
+		"""
+		Returns the scanner for finding directives.
+
+		.. versionadded:: 0.4.0
+		"""
+
+		return self.session.scanner
+
 	def run(self) -> bool:
 		"""
 		Run the reformatter.
@@ -151,18 +370,103 @@ class Reformatter:
 		:return: Whether the file was changed.
 		"""
 
-		content = StringList(self._unformatted_source)
-		content.blankline(ensure_single=True)
+		content = _normalise_whitespace(self._unformatted_source)
+		self._reformatted_source = self._substitute_blocks(content)
 
-		pattern = self.compile_regex()
+		if content is not self._unformatted_source:
+			# More than just the code blocks changed.
+			self._replacements = None
 
-		self._reformatted_source = pattern.sub(self.process_match, str(content))
+			# The offsets of any errors are into the normalised source, which has the same lines.
+			self._line_index = LineIndex(content)
 
 		for error in self.errors:
 			self.report_error(error)
 
 		return self._reformatted_source != self._unformatted_source
 
+	def _substitute_blocks(self, content: str) -> str:
+		# Replace each code block which was changed by the formatter.
+		# The content is returned unchanged (not copied) if none of the code blocks were changed.
+
+		blocks: Iterable[CodeBlockSpan] = self.compile_scanner().iter_blocks(content)
+
+		if profiler.enabled:
+			# Scanning is otherwise interleaved with formatting, so would be counted as part of it.
+			with profiler.span("scan", filename=self.filename):
+				blocks = list(blocks)
+
+		if self._uses_batching():
+			blocks = list(blocks)
+			self._format_batches(blocks)
+
+		replacements = []
+
+		for block in blocks:
+			reformatted = self._process_block(block)
+			if reformatted is not None:
+				replacements.append((block.start, block.end, reformatted))
+
+				if self.fail_fast:
+					break
+
+		self._replacements = replacements
+		return _splice(content, replacements)
+
+	def _uses_batching(self) -> bool:
+		# Returns whether the formatter for any of the configured languages supports batching.
+		# If not, the code blocks don't need to be kept in memory to format them up front.
+
+		get_formatter = self.session.get_formatter
+		return any(supports_batching(get_formatter(lang)[0]) for lang in self.session.compiled.languages)
+
+	def _format_batches(self, blocks: Iterable[CodeBlockSpan]) -> None:
+		# Format the code blocks for languages whose formatters support batching, with one call per language.
+		# The results are used by :meth:`~._call_formatter` as each block is processed.
+
+		batches: Dict[Optional[str], Dict[str, None]] = {}
+
+		for block in blocks:
+			formatter, lang_config = self.session.get_formatter(block.lang)
+			if not supports_batching(formatter):
+				continue
+
+			code = _dedent_block(block)
+			budget = self.session.get_budget(block.lang)
+			if budget.max_size is not None and len(code) > budget.max_size:
+				# Left for :meth:`~._call_formatter` to report.
+				continue
+
+			if (block.lang, code) not in self._batched:
+				batches.setdefault(block.lang, {})[code] = None
+
+		for lang, codes in batches.items():
+			formatter, lang_config = self.session.get_formatter(lang)
+			timeout = self.session.get_budget(lang).batch_timeout
+			code_list = list(codes)
+
+			try:
+				with profiler.span("format_many", lang, self.filename):
+					if self.snippet_cache is None or not self._should_cache(lang, formatter):
+						results = call_with_timeout(timeout, format_many, formatter, code_list, **lang_config)
+					else:
+						assert lang is not None
+						results = call_with_timeout(
+								timeout,
+								self.snippet_cache.format_many,
+								lang,
+								self._config_hash(lang, formatter, lang_config),
+								code_list,
+								formatter,
+								lang_config,
+								)
+			except SnippetTimeout:
+				# Leave each snippet to be formatted on its own, so only the slow ones are skipped.
+				continue
+
+			for code, result in zip(code_list, results):
+				self._batched[(lang, code)] = result
+
 	def report_error(self, error: CodeBlockError) -> None:
 		"""
 		Print the error message.
@@ -172,57 +476,111 @@ class Reformatter:
 		.. versionadded:: 0.2.0
 		"""
 
-		lineno = self._unformatted_source[:error.offset].count('\n') + 1
+		# 3rd party
+		import click
+
+		lineno = self.line_index.lineno(error.offset)
 		click.echo(f"{self.filename}:{lineno}: {error.exc.__class__.__name__}: {error.exc}", err=True)
 
-	def process_match(self, match: Match[str]) -> str:
+	@property
+	def line_index(self) -> LineIndex:
 		"""
-		Process a :meth:`re.Match <re.Match.expand>` for a single code block.
+		Maps character offsets in the source being reformatted to line numbers.
+
+		It is created the first time it is needed, and reused for every error reported in the source.
+
+		.. versionadded:: 0.4.0
+		"""
+
+		if self._line_index is None:
+			self._line_index = LineIndex(self._unformatted_source)
+
+		return self._line_index
+
+	def process_match(self, match: CodeBlockSpan) -> str:
+		"""
+		Process a single code block.
 
 		:param match:
+
+		.. versionchanged:: 0.4.0  Takes a :class:`~.CodeBlockSpan` rather than a :class:`re.Match`.
 		"""
 
-		lang = match.group("lang")
+		reformatted = self._process_block(match)
 
-		if lang in self.config["languages"]:
-			lang_config = self.config["languages"][lang]
-			# TODO: show warning if not found and in "strict" mode
-			formatter = self._formatters.get(lang.lower(), noformat)
-		else:
-			lang_config = {}
-			formatter = noformat
+		if reformatted is None:
+			return match.source[match.start:match.end]
+
+		return reformatted
+
+	def _process_block(self, block: CodeBlockSpan) -> Optional[str]:
+		# Returns the reformatted code block, or :py:obj:`None` if the formatter didn't change it.
+
+		lang = block.lang
+		formatter, lang_config = self.session.get_formatter(lang)
+
+		code = reformatted = _dedent_block(block)
+
+		with self._collect_error(block):
+			with _syntaxerror_for_file(self.filename), profiler.span("format", lang, self.filename):
+				reformatted = self._call_formatter(lang, formatter, code, lang_config)
 
-		trailing_ws_match = TRAILING_NL_RE.search(match["code"])
+		if reformatted == code or reformatted.rstrip() == code.rstrip():
+			# Indenting the code again would give back the original text, as trailing whitespace is discarded.
+			return None
+
+		trailing_ws_match = TRAILING_NL_RE.search(block.code)
 		assert trailing_ws_match
 		trailing_ws = trailing_ws_match.group()
-		code = textwrap.dedent(match["code"])
-
-		with self._collect_error(match):
-			with syntaxerror_for_file(self.filename):
-				code = formatter(code, **lang_config)
 
-		code = textwrap.indent(code, match["indent"] + match["body_indent"])
-		return f'{match["before"]}{code.rstrip()}{trailing_ws}'
+		reformatted = textwrap.indent(reformatted, block.indent + block.body_indent)
+		return f'{block.before}{reformatted.rstrip()}{trailing_ws}'
 
 	def get_diff(self) -> str:
 		"""
 		Returns the diff between the original and reformatted file content.
 		"""
 
+		# this package
+		from snippet_fmt._diff import colour_diff, span_opcodes, unified_diff
+
 		# Based on yapf
 		# Apache 2.0 License
 
-		after = self.to_string().split('\n')
-		before = self._unformatted_source.split('\n')
-		return coloured_diff(
-				before,
-				after,
-				os.fspath(self.filename),
-				os.fspath(self.filename),
-				"(original)",
-				"(reformatted)",
-				lineterm='',
-				)
+		with profiler.span("get_diff", filename=self.filename):
+			after = self.to_string().split('\n')
+			before = self._unformatted_source.split('\n')
+
+			# Only the lines which were replaced need to be compared.
+			opcodes = None
+			if self._replacements is not None:
+				opcodes = span_opcodes(before, after, self._changed_lines())
+
+			return colour_diff(unified_diff(before, after, os.fspath(self.filename), opcodes=opcodes))
+
+	def _changed_lines(self) -> List[Tuple[int, int, int, int]]:
+		# Returns the (0-based) ranges of lines which may differ, before and after the replacements.
+
+		assert self._replacements is not None
+
+		source = self._unformatted_source
+		line_index = self.line_index
+		spans = []
+		shift = 0
+
+		for start, end, text in self._replacements:
+			a_start = line_index.lineno(start) - 1
+			a_end = line_index.lineno(end)
+
+			if source[end - 1:end] == '\n' and text.endswith('\n'):
+				# The line after the replacement is unchanged.
+				a_end -= 1
+
+			b_end = a_end + shift + text.count('\n') - source.count('\n', start, end)
+			spans.append((a_start, a_end, a_start + shift, b_end))
+			shift = b_end - a_end
+
+		return spans
 
 	def to_string(self) -> str:
 		"""
@@ -234,27 +592,75 @@ class Reformatter:
 
 		return self._reformatted_source
 
+	def _call_formatter(
+			self,
+			lang: Optional[str],
+			formatter: Formatter,
+			code: str,
+			lang_config: Mapping[str, Any],
+			) -> str:
+		batched = self._batched.get((lang, code))
+		if batched is not None:
+			if isinstance(batched, Exception):
+				# The exception may be modified by the caller (e.g. to set the filename).
+				raise copy.copy(batched)
+			return batched
+
+		budget = self.session.get_budget(lang)
+		budget.check_size(code)
+
+		if self.snippet_cache is None or not self._should_cache(lang, formatter):
+			return call_with_timeout(budget.timeout, formatter, code, **lang_config)
+
+		assert lang is not None
+
+		config_hash = self._config_hash(lang, formatter, lang_config)
+		return call_with_timeout(
+				budget.timeout,
+				self.snippet_cache.format,
+				lang,
+				config_hash,
+				code,
+				formatter,
+				lang_config,
+				)
+
+	@staticmethod
+	def _should_cache(lang: Optional[str], formatter: Formatter) -> bool:
+		# Only pure formatters can be cached, and cheap ones are quicker to call again than to look up.
+		if lang is None:
+			return False
+
+		capabilities = get_capabilities(formatter)
+		return capabilities.pure and capabilities.cost != "cheap"
+
+	def _config_hash(self, lang: str, formatter: Formatter, lang_config: Mapping[str, Any]) -> str:
+		assert self.snippet_cache is not None
+
+		config_hashes = self.session.config_hashes
+		if lang not in config_hashes:
+			config_hashes[lang] = self.snippet_cache.config_hash(formatter, lang_config)
+
+		return config_hashes[lang]
+
 	@contextlib.contextmanager
-	def _collect_error(self, match: Match[str]) -> Iterator[None]:
+	def _collect_error(self, match: CodeBlockSpan) -> Iterator[None]:
 		try:
 			yield
 		except Exception as e:
-			self.errors.append(CodeBlockError(match.start(), e))
+			self.errors.append(CodeBlockError(match.start, e))
 
 	def load_extra_formatters(self) -> None:
 		"""
 		Load custom formatters defined via entry points.
-		"""
 
-		group = "snippet_fmt.formatters"
+		.. versionchanged:: 0.4.0
+
+			The entry points are loaded once per process by :data:`~snippet_fmt.registry.formatter_registry`,
+			and the formatter for each language is looked up when the configuration is compiled.
+		"""
 
-		for distro_config, _ in entrypoints.iter_files_distros():
-			if group in distro_config:
-				for name, epstr in distro_config[group].items():
-					with contextlib.suppress(entrypoints.BadEntryPoint, ImportError):  # pylint: disable=W8205
-						# TODO: show warning for bad entry point if verbose, or "strict"?
-						ep = entrypoints.EntryPoint.from_string(epstr, name)
-						self._formatters[name] = ep.load()
+		formatter_registry.load_extra()
 
 
 class RSTReformatter(Reformatter):
@@ -263,36 +669,204 @@ class RSTReformatter(Reformatter):
 
 	:param filename: The filename to reformat.
 	:param config: The ``snippet_fmt`` configuration, parsed from a TOML file (or similar).
+	:param session: State shared with other reformatters using the same configuration.
+
+	.. versionchanged:: 0.4.0
+
+		* Added the ``session`` argument.
+		* Files which don't contain any of the configured directives are skipped without being decoded.
 	"""
 
 	#: The filename being reformatted.
 	file_to_format: PathPlus
 
-	def __init__(self, filename: PathLike, config: SnippetFmtConfigDict):
+	#: Whether the file was found not to contain any of the configured directives,
+	#: in which case :meth:`~.run` returns :py:obj:`False` straight away.
+	#:
+	#: .. versionadded:: 0.4.0
+	prefiltered: bool
+
+	#: The number of characters to read from the file at a time in :meth:`~.run_streaming`.
+	#:
+	#: .. versionadded:: 0.4.0
+	chunk_size: int = 1024 * 1024
+
+	def __init__(
+			self,
+			filename: PathLike,
+			config: SnippetFmtConfigDict,
+			session: Optional[FormattingSession] = None,
+			):
 		self.file_to_format = PathPlus(filename)
-		super().__init__(self.file_to_format.read_text(), self.file_to_format.as_posix(), config)
+
+		if session is None:
+			session = FormattingSession(config)
+
+		self.prefiltered = not session.scanner.file_has_markers(self.file_to_format)
+
+		self._skipped = False
+
+		# The file is only read when needed, which it isn't if it was prefiltered.
+		super().__init__(self._read_file, self.file_to_format.as_posix(), config, session)
+
+	def _read_file(self) -> str:
+		with profiler.span("read", filename=self.filename):
+			return self.file_to_format.read_text()
+
+	def run(self) -> bool:
+		"""
+		Run the reformatter.
+
+		:return: Whether the file was changed.
+		"""
+
+		if self.prefiltered:
+			self._skipped = True
+			return False
+
+		return super().run()
+
+	def to_string(self) -> str:
+		"""
+		Return the reformatted file as a string.
+		"""
+
+		if self._skipped:
+			# Unchanged, as there was nothing to reformat.
+			return self._unformatted_source
+
+		return super().to_string()
 
 	def to_file(self) -> None:
 		"""
 		Write the reformatted source to the original file.
 		"""
 
-		self.file_to_format.write_text(self.to_string())
+		with profiler.span("to_file", filename=self.filename):
+			self.file_to_format.write_text(self.to_string())
+
+	def run_streaming(self, write: bool = True) -> bool:
+		"""
+		Run the reformatter over the file a piece at a time, rather than reading it all into memory.
+
+		The file is split before each line which isn't indented, as code blocks can't continue past them.
+		The reformatted pieces are written to a temporary file, which replaces the original at the end.
+		The memory needed therefore depends on the size of the largest code block
+		(or other indented section) rather than the size of the file.
+
+		The reformatted source isn't kept, so :meth:`~.to_string`, :meth:`~.to_file`
+		and :meth:`~.get_diff` can't be used afterwards.
+
+		:param write: Whether to replace the file if it was changed.
+
+		:return: Whether the file was changed.
+
+		.. versionadded:: 0.4.0
+		"""
+
+		if self.prefiltered:
+			self._skipped = True
+			return False
+
+		# stdlib
+		import tempfile
+
+		changed = False
+		first_line = 1
+		offset = 0
+		output: Optional[IO[str]] = None
+
+		if write:
+			fd, output_filename = tempfile.mkstemp(
+					prefix=f".{self.file_to_format.name}.",
+					suffix=".tmp",
+					dir=self.file_to_format.parent,
+					)
+			output = open(fd, 'w', encoding="UTF-8", newline='\n')  # noqa: SIM115
+
+		try:
+			with self.file_to_format.open(encoding="UTF-8") as fp:
+				for piece, last in _iter_pieces(fp, self.chunk_size):
+					content = _normalise_whitespace(piece) if last else _strip_trailing_whitespace(piece)
+
+					r = _PieceReformatter(content, self.filename, self.config, self.session, first_line)
+					r.fail_fast = self.fail_fast
+					reformatted = r._substitute_blocks(content)
+
+					for error in r.errors:
+						self.errors.append(CodeBlockError(offset + error.offset, error.exc))
+						r.report_error(error)
+
+					if reformatted != piece:
+						changed = True
+						if self.fail_fast and output is None:
+							break
+
+					if output is not None:
+						output.write(reformatted)
+
+					first_line += piece.count('\n')
+					offset += len(content)
+
+			if output is not None:
+				output.close()
+				if changed:
+					os.chmod(output_filename, self.file_to_format.stat().st_mode)
+					os.replace(output_filename, self.file_to_format)
+
+		finally:
+			if output is not None:
+				output.close()
+				if os.path.exists(output_filename):
+					os.unlink(output_filename)
+
+		return changed
+
+
+class _PieceReformatter(Reformatter):
+	# Reformats part of a file, for :meth:`RSTReformatter.run_streaming`.
+
+	def __init__(
+			self,
+			source: str,
+			filename: str,
+			config: SnippetFmtConfigDict,
+			session: FormattingSession,
+			first_line: int,
+			):
+		super().__init__(source, filename, config, session)
+		self.first_line = first_line
+
+	def report_error(self, error: CodeBlockError) -> None:  # noqa: D102
+
+		# 3rd party
+		import click
+
+		lineno = self.line_index.lineno(error.offset)
+		click.echo(
+				f"{self.filename}:{lineno+self.first_line-1}: {error.exc.__class__.__name__}: {error.exc}",
+				err=True,
+				)
 
 
 class DocstringReformatter(Reformatter):
 	"""
 	Reformat code snippets in a docstring from a Python file.
 
-	:param token: The docstring token to format.
+	:param token: The docstring to format, from :func:`snippet_fmt.docstring.find_docstrings`.
 	:param filename: The filename being reformated.
 	:param config: The ``snippet_fmt`` configuration, parsed from a TOML file (or similar).
+	:param session: State shared with other reformatters using the same configuration.
 
 	.. versionadded:: 0.2.0
+	.. versionchanged:: 0.4.0
+
+		* Added the ``session`` argument.
+		* ``token`` is a :class:`~snippet_fmt.docstring.DocstringToken` rather than a ``tokenize_rt`` token.
 	"""
 
-	#: The docstring token being reformatted.
-	token: tokenize_rt.Token
+	#: The docstring being reformatted.
+	token: "DocstringToken"
 
 	#: Letters before the string e.g. ``f``, ``u``, ``r``, ``fr``
 	prefix_char: str
@@ -303,15 +877,24 @@ class DocstringReformatter(Reformatter):
 	#: The docstring's indentation.
 	indent: str
 
-	def __init__(self, token: tokenize_rt.Token, filename: PathLike, config: SnippetFmtConfigDict):
+	def __init__(
+			self,
+			token: "DocstringToken",
+			filename: PathLike,
+			config: SnippetFmtConfigDict,
+			session: Optional[FormattingSession] = None,
+			):
 		self.token = token
 
+		# this package
+		import snippet_fmt.docstring
+
 		prefix_char, quote_char, indent, docstring = snippet_fmt.docstring.get_parts(token.src)
 		self.prefix_char = prefix_char
 		self.quote_char = quote_char
 		self.indent = indent
 
-		super().__init__(docstring, PathPlus(filename).as_posix(), config)
+		super().__init__(docstring, PathPlus(filename).as_posix(), config, session)
 
 	def report_error(self, error: CodeBlockError) -> None:
 		"""
@@ -320,7 +903,10 @@ class DocstringReformatter(Reformatter):
 		:param error:
 		"""
 
-		lineno = self._unformatted_source[:error.offset].count('\n') + 1
+		# 3rd party
+		import click
+
+		lineno = self.line_index.lineno(error.offset)
 		click.echo(
 				f"{self.filename}:{lineno+self.token.line-1}: {error.exc.__class__.__name__}: {error.exc}",
 				err=True,
@@ -331,6 +917,9 @@ class DocstringReformatter(Reformatter):
 		Returns the diff between the original and reformatted file content.
 		"""
 
+		# this package
+		import snippet_fmt.docstring
+
 		after = self.to_string().split('\n')
 		return snippet_fmt.docstring.diff(
 				self.token,
@@ -361,11 +950,14 @@ class DocstringReformatter(Reformatter):
 
 		return ''.join(parts)
 
-	def to_token(self) -> tokenize_rt.Token:
+	def to_token(self) -> "tokenize_rt.Token":
 		"""
 		Return the docstring as a token for ``tokenize_rt``.
 		"""
 
+		# 3rd party
+		import tokenize_rt  # type: ignore[import-untyped]
+
 		return tokenize_rt.Token(
 				name="STRING",
 				src=self.to_string(),
@@ -373,13 +965,16 @@ class DocstringReformatter(Reformatter):
 				utf8_byte_offset=self.token.utf8_byte_offset,
 				)
 
-	def run(self) -> bool:
+	def get_normalised_source(self) -> str:
 		"""
-		Run the reformatter.
+		Returns the content of the docstring with the blank lines at the end normalised, ready for reformatting.
 
-		:return: Whether the file was changed.
+		.. versionadded:: 0.4.0
 		"""
 
+		# 3rd party
+		from domdf_python_tools.stringlist import StringList
+
 		content = StringList(self._unformatted_source)
 		if len(self.quote_char) == 3:
 			# Allow at most 2 newlines (1 clear line and the triple quote on its own line)
@@ -389,9 +984,17 @@ class DocstringReformatter(Reformatter):
 				content.blankline(ensure_single=True)
 				content.blankline()
 
-		pattern = self.compile_regex()
+		return str(content)
+
+	def run(self) -> bool:
+		"""
+		Run the reformatter.
+
+		:return: Whether the file was changed.
+		"""
 
-		self._reformatted_source = pattern.sub(self.process_match, str(content))
+		with profiler.span("docstring", filename=self.filename):
+			self._reformatted_source = self._substitute_blocks(self.get_normalised_source())
 
 		for error in self.errors:
 			self.report_error(error)
@@ -405,10 +1008,27 @@ class PyReformatter(RSTReformatter):
 
 	:param filename: The filename to reformat.
 	:param config: The ``snippet_fmt`` configuration, parsed from a TOML file (or similar).
+	:param session: State shared with other reformatters using the same configuration.
 
 	.. versionadded:: 0.2.0
+	.. versionchanged:: 0.4.0  Added the ``session`` argument.
 	"""
 
+	#: The reformatters for the docstrings changed by :meth:`~.run`, in order.
+	#: Each can be used to show a diff of just that docstring.
+	#:
+	#: .. versionadded:: 0.4.0
+	changed_docstrings: List["DocstringReformatter"]
+
+	def __init__(
+			self,
+			filename: PathLike,
+			config: SnippetFmtConfigDict,
+			session: Optional[FormattingSession] = None,
+			):
+		super().__init__(filename, config, session)
+		self.changed_docstrings = []
+
 	def run(self) -> bool:
 		"""
 		Run the reformatter.
@@ -416,38 +1036,66 @@ class PyReformatter(RSTReformatter):
 		:return: Whether the file was changed.
 		"""
 
-		original_tokens = snippet_fmt.docstring.get_tokens(self._unformatted_source)
-		tokens: List[tokenize_rt.Token] = []
+		self.changed_docstrings = []
+
+		if self.prefiltered:
+			self._skipped = True
+			return False
 
-		file_ret = 0
+		# this package
+		import snippet_fmt.docstring
 
-		for token in original_tokens:
+		source = self._unformatted_source
+
+		try:
+			with profiler.span("find_docstrings", filename=self.filename):
+				tokens = snippet_fmt.docstring.find_docstrings(source)
+		except (SyntaxError, ValueError) as e:
+			# Reported against the start of the line containing the error.
+			offset = self.line_index.offset(getattr(e, "lineno", None) or 1)
+			self.errors.append(CodeBlockError(offset, e))
+			self.report_error(self.errors[-1])
+			self._reformatted_source = source
+			return False
 
-			if token.name == "DOCSTRING":
+		docstrings: List[DocstringReformatter] = [
+				DocstringReformatter(token, self.filename, self.config, self.session)
+				for token in tokens
 				# Must have at least one newline to have snippets
-				if token.src.find('\n') > -1:
-					r = DocstringReformatter(token, self.file_to_format, self.config)
+				if '\n' in token.src
+				]
 
-					with syntaxerror_for_file(self.filename):
-						if r.run():
-							token = r.to_token()
-							file_ret = True
+		# Formatters which support batching are called once for all the docstrings in the file.
+		if self._uses_batching():
+			scanner = self.compile_scanner()
+			self._format_batches(block for r in docstrings for block in scanner.iter_blocks(r.get_normalised_source()))
 
-			tokens.append(token)
+		replacements = []
 
-		self._reformatted_source = tokenize_rt.tokens_to_src(tokens)
-		if file_ret:
-			assert tokenize_rt.tokens_to_src(tokens) != self._unformatted_source
-			return True
-		else:
-			assert tokenize_rt.tokens_to_src(tokens) == self._unformatted_source
-			return False
+		for r in docstrings:
+			r._batched = self._batched
+			r.fail_fast = self.fail_fast
+
+			with _syntaxerror_for_file(self.filename):
+				if r.run():
+					replacements.append((r.token.offset, r.token.end, r.to_string()))
+					self.changed_docstrings.append(r)
+
+			self.errors.extend(r.errors)
+
+			if self.fail_fast and replacements:
+				break
+
+		self._replacements = replacements
+		self._reformatted_source = _splice(source, replacements)
+		return bool(replacements)
 
 
 def reformat_file(
 		filename: PathLike,
 		config: SnippetFmtConfigDict,
-		colour: ColourTrilean = None,
+		colour: "ColourTrilean" = None,
+		cache: Optional[Cache] = None,
 		) -> int:
 	"""
 	Reformat the given reStructuredText file, and show the diff if changes were made.
@@ -455,15 +1103,29 @@ def reformat_file(
 	:param filename: The filename to reformat.
 	:param config: The ``snippet-fmt`` configuration, parsed from a TOML file (or similar).
 	:param colour: Whether to force coloured output on (:py:obj:`True`) or off (:py:obj:`False`).
+	:param cache: A cache of files known to be correctly formatted.
+		If given, the file is skipped if it is in the cache, and added to the cache if unchanged.
+		:meth:`Cache.write() <snippet_fmt.cache.Cache.write>` must be called to save the cache.
+
+	.. versionchanged:: 0.4.0  Added the ``cache`` argument.
 	"""
 
+	if cache is not None and cache.is_clean(filename):
+		return False
+
 	r = RSTReformatter(filename, config)
 
 	ret = r.run()
 
 	if ret:
+		# 3rd party
+		import click
+		from consolekit.terminal_colours import resolve_color_default
+
 		click.echo(r.get_diff(), color=resolve_color_default(colour))
 		r.to_file()
+	elif cache is not None and not r.errors:
+		cache.mark_clean(filename)
 
 	return ret
 
@@ -471,7 +1133,8 @@ def reformat_file(
 def reformat_docstrings(
 		filename: PathLike,
 		config: SnippetFmtConfigDict,
-		colour: ColourTrilean = None,
+		colour: "ColourTrilean" = None,
+		cache: Optional[Cache] = None,
 		) -> int:
 	"""
 	Reformat docstrings in the given Python file, and show the diff if changes were made.
@@ -479,37 +1142,34 @@ def reformat_docstrings(
 	:param filename: The filename to reformat.
 	:param config: The ``snippet-fmt`` configuration, parsed from a TOML file (or similar).
 	:param colour: Whether to force coloured output on (:py:obj:`True`) or off (:py:obj:`False`).v
+	:param cache: A cache of files known to be correctly formatted.
+		If given, the file is skipped if it is in the cache, and added to the cache if unchanged.
+		:meth:`Cache.write() <snippet_fmt.cache.Cache.write>` must be called to save the cache.
 
 	:rtype:
 
 	.. versionadded:: 0.2.0
+	.. versionchanged:: 0.4.0  Added the ``cache`` argument.
 	"""
 
-	file = PathPlus(filename)
-	source = file.read_text()
-
-	original_tokens = snippet_fmt.docstring.get_tokens(source)
-	tokens: List[tokenize_rt.Token] = []
-
-	file_ret = 0
-
-	for token in original_tokens:
+	if cache is not None and cache.is_clean(filename):
+		return False
 
-		if token.name == "DOCSTRING":
-			r = DocstringReformatter(token, file, config)
+	# 3rd party
+	import click
+	from consolekit.terminal_colours import resolve_color_default
 
-			with syntaxerror_for_file(file.name):
-				if r.run():
-					token = r.to_token()
-					click.echo(r.get_diff(), color=resolve_color_default(colour))
-					file_ret = True
+	# The docstrings share one session, and formatters which support batching are called once for the whole file.
+	r = PyReformatter(filename, config)
 
-		tokens.append(token)
+	if r.run():
+		for docstring in r.changed_docstrings:
+			click.echo(docstring.get_diff(), color=resolve_color_default(colour))
 
-	if file_ret:
-		file.write_text(tokenize_rt.tokens_to_src(tokens))
-		assert tokenize_rt.tokens_to_src(tokens) != source
+		r.to_file()
 		return True
 	else:
-		assert tokenize_rt.tokens_to_src(tokens) == source
+		if cache is not None and not r.errors:
+			cache.mark_clean(r.file_to_format)
+
 		return False
@@ -28,22 +28,60 @@ CLI entry point.
 
 # stdlib
 import sys
-from typing import Iterable, List, Optional
+from typing import Iterable, List, NoReturn, Optional
 
 # 3rd party
 import click
 from consolekit import click_command
 from consolekit.options import MultiValueOption, colour_option, flag_option, verbose_option
-from consolekit.terminal_colours import ColourTrilean, resolve_color_default
-from consolekit.tracebacks import handle_tracebacks, traceback_option
+from consolekit.terminal_colours import ColourTrilean, Fore, resolve_color_default
+from consolekit.tracebacks import TracebackHandler, handle_tracebacks, traceback_option
 from domdf_python_tools.typing import PathLike
 
-# this package
-from snippet_fmt import PyReformatter
-
 __all__ = ("main", )
 
 
+class _SyntaxTracebackHandler(TracebackHandler):
+	# Equivalent to ``formate.utils.SyntaxTracebackHandler``, without importing ``formate`` for every run.
+
+	@staticmethod
+	def handle_SyntaxError(e: SyntaxError) -> NoReturn:  # noqa: D102
+		click.echo(Fore.RED(f"Fatal: {e.__class__.__name__}: {e}"), err=True)
+		sys.exit(126)
+
+	@staticmethod
+	def handle_HookNotFoundError(e: Exception) -> NoReturn:  # noqa: D102
+		click.echo(Fore.RED(f"Fatal: Hook not found: {e}"), err=True)
+		sys.exit(126)
+
+
+@click.option(
+		"--trace-file",
+		metavar="FILENAME",
+		type=click.STRING,
+		help="Write a timeline of the run to the given file, in the Chrome trace event format.",
+		default=None,
+		)
+@flag_option(
+		"--profile",
+		"profile",
+		help="Show how long each step took, by step, by language and by file.",
+		)
+@flag_option(
+		"--no-cache",
+		"no_cache",
+		help="Don't use cached results for files and code snippets which were checked previously.",
+		)
+@flag_option(
+		"--fail-fast",
+		"fail_fast",
+		help="Stop after the first file which needs reformatting. With --check, also stop at the first code block.",
+		)
+@flag_option(
+		"--check",
+		"check",
+		help="Don't write the files back, just report which files would be reformatted.",
+		)
 @flag_option("--diff", "show_diff", help="Show a diff of changes made")
 @traceback_option()
 @colour_option()
@@ -56,6 +94,15 @@ __all__ = ("main", )
 		cls=MultiValueOption,
 		help="Patterns for files to exclude from formatting.",
 		)
+@click.option(
+		"-j",
+		"--jobs",
+		metavar="N",
+		type=click.STRING,
+		help="The number of files to reformat in parallel, or 'auto' to use one process per CPU.",
+		default='1',
+		show_default=True,
+		)
 @click.option(
 		"-c",
 		"--config-file",
@@ -74,6 +121,12 @@ def main(
 		verbose: bool = False,
 		show_traceback: bool = False,
 		show_diff: bool = False,
+		jobs: str = '1',
+		no_cache: bool = False,
+		check: bool = False,
+		fail_fast: bool = False,
+		profile: bool = False,
+		trace_file: Optional[str] = None,
 		) -> None:
 	"""
 	Reformat code snippets in the given reStructuredText files.
@@ -81,15 +134,17 @@ def main(
 
 	# stdlib
 	import fnmatch
+	import os
 	import re
 
 	# 3rd party
 	from domdf_python_tools.paths import PathPlus
-	from formate.utils import SyntaxTracebackHandler
 
 	# this package
-	from snippet_fmt import RSTReformatter
+	from snippet_fmt._runner import iter_results, resolve_jobs
+	from snippet_fmt.cache import Cache, get_cache_dir
 	from snippet_fmt.config import load_toml
+	from snippet_fmt.profiling import format_report, profiler, write_trace
 
 	retv = 0
 
@@ -98,6 +153,19 @@ def main(
 	except FileNotFoundError:
 		raise click.UsageError(f"Config file '{config_file}' not found")
 
+	try:
+		num_jobs = resolve_jobs(jobs)
+	except ValueError:
+		raise click.BadOptionUsage("jobs", f"Invalid value for '--jobs': {jobs!r} is not a positive integer or 'auto'.")
+
+	if no_cache:
+		cache, snippet_db = None, None
+	else:
+		cache, snippet_db = Cache.read(config), os.fspath(get_cache_dir() / "snippets.sqlite3")
+
+	paths: List[PathPlus] = []
+	prefiltered = 0
+
 	for path in filename:
 		for pattern in exclude or []:
 			if re.match(fnmatch.translate(pattern), str(path)):  # pylint: disable=loop-invariant-statement
@@ -111,27 +179,63 @@ def main(
 
 			continue
 
-		if path.suffix == ".rst":
-			r = RSTReformatter(path, config=config)
-		else:
-			assert path.suffix == ".py"
-			r = PyReformatter(path, config=config)
+		if cache is not None and cache.is_clean(path):
+			if verbose >= 2:
+				click.echo(f"Skipping {path} as it is unchanged since it was last checked")
+
+			continue
+
+		paths.append(path)
+
+	if profile or trace_file:
+		profiler.clear()
+		profiler.enabled = True
+
+	results = iter_results(paths, config, show_diff, num_jobs, snippet_db, check=check, fail_fast=fail_fast)
+
+	try:
+		with handle_tracebacks(show_traceback, cls=_SyntaxTracebackHandler):
+			for result in results:
+				if cache is not None and result.clean:
+					cache.mark_clean(result.path)
+
+				prefiltered += result.prefiltered
+
+				if result.messages:
+					click.echo(result.messages, err=True, nl=False)
+
+				if result.changed:
+					if verbose:
+						click.echo(f"{'Would reformat' if check else 'Reformatting'} {result.path}")
+					if result.diff is not None:
+						click.echo(result.diff, color=resolve_color_default(colour))
+
+				elif verbose >= 2:
+					click.echo(f"Checking {result.path}")
+
+				retv |= result.changed
 
-		with handle_tracebacks(show_traceback, cls=SyntaxTracebackHandler):
-			ret_for_file = r.run()
+				if fail_fast and result.changed:
+					break
+	finally:
+		# Don't start on any files which haven't been reached yet.
+		results.close()
 
-		if ret_for_file:
-			if verbose:
-				click.echo(f"Reformatting {path}")
-			if show_diff:
-				click.echo(r.get_diff(), color=resolve_color_default(colour))
+		# Keep the progress made so far, even if a later file failed.
+		if cache is not None:
+			cache.write()
 
-			r.to_file()
+		if profile or trace_file:
+			profiler.enabled = False
+			spans = profiler.take()
 
-		elif verbose >= 2:
-			click.echo(f"Checking {path}")
+			if profile:
+				click.echo(format_report(spans), err=True, nl=False)
+			if trace_file:
+				write_trace(spans, trace_file)
 
-		retv |= ret_for_file
+	if verbose and prefiltered:
+		click.echo(f"Skipped {prefiltered} file{'s' if prefiltered != 1 else ''} without any code blocks")
 
 	sys.exit(retv)
 
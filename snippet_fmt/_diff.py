@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+#
+#  _diff.py
+"""
+Construct unified diffs of the changes made by the reformatters.
+"""
+#
+#  Copyright © 2026 Dominic Davis-Foster <dominic@davis-foster.co.uk>
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+#  EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+#  MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+#  IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+#  DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+#  OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE
+#  OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+
+# stdlib
+import difflib
+import re
+from collections import Counter
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+# 3rd party
+from domdf_python_tools.stringlist import StringList
+
+__all__ = ("colour_diff", "span_opcodes", "unified_diff")
+
+#: An opcode, in the format returned by :meth:`difflib.SequenceMatcher.get_opcodes`.
+Opcode = Tuple[str, int, int, int, int]
+
+
+def unified_diff(
+		a: Sequence[str],
+		b: Sequence[str],
+		filename: str,
+		offset: int = 0,
+		opcodes: Optional[List[Opcode]] = None,
+		) -> Iterator[str]:
+	"""
+	Compare two sequences of lines, and generate the delta as a unified diff.
+
+	The output is the same as :func:`difflib.unified_diff` with ``lineterm=''``,
+	labelling the two sides ``(original)`` and ``(reformatted)``.
+
+	:param a:
+	:param b:
+	:param filename:
+	:param offset: The number of lines before ``a`` and ``b`` in the file, which is added to the line numbers.
+	:param opcodes: The differences between ``a`` and ``b``, if already known.
+		Otherwise, they are found with :class:`difflib.SequenceMatcher`.
+	"""
+
+	difflib._check_types(a, b, filename)  # type: ignore[attr-defined]
+
+	if opcodes is None:
+		matcher = difflib.SequenceMatcher(None, a, b)
+	else:
+		# The grouping is done from the opcodes alone, which the matcher caches.
+		matcher = difflib.SequenceMatcher(None)
+		matcher.opcodes = opcodes
+
+	started = False
+	for group in matcher.get_grouped_opcodes(3):
+		if not started:
+			started = True
+			yield f"--- {filename}\t(original)"
+			yield f"+++ {filename}\t(reformatted)"
+
+		first, last = group[0], group[-1]
+		file1_range = difflib._format_range_unified(  # type: ignore[attr-defined]
+			first[1] + offset,
+			last[2] + offset,
+		)
+		file2_range = difflib._format_range_unified(  # type: ignore[attr-defined]
+			first[3] + offset,
+			last[4] + offset,
+		)
+		yield f'@@ -{file1_range} +{file2_range} @@'
+
+		for tag, i1, i2, j1, j2 in group:
+			if tag == "equal":
+				for line in a[i1:i2]:
+					yield ' ' + line
+				continue
+
+			if tag in {"replace", "delete"}:
+				for line in a[i1:i2]:
+					yield '-' + line
+
+			if tag in {"replace", "insert"}:
+				for line in b[j1:j2]:
+					yield '+' + line
+
+
+def colour_diff(diff: Iterable[str]) -> str:
+	"""
+	Colour the lines of a unified diff, and join them into a string.
+
+	The output is the same as :func:`consolekit.utils.coloured_diff`.
+
+	:param diff: The lines of the diff.
+	"""
+
+	# 3rd party
+	from consolekit import terminal_colours
+
+	buf = StringList()
+
+	for line in diff:
+		if line.startswith('+'):
+			buf.append(terminal_colours.Fore.GREEN(line))
+		elif line.startswith('-'):
+			buf.append(terminal_colours.Fore.RED(line))
+		else:
+			buf.append(line)
+
+	buf.blankline(ensure_single=True)
+
+	return str(buf)
+
+
+def span_opcodes(
+		a: Sequence[str],
+		b: Sequence[str],
+		spans: Sequence[Tuple[int, int, int, int]],
+		) -> Optional[List[Opcode]]:
+	"""
+	Find the differences between ``a`` and ``b``, which are the same outside the given spans of lines.
+
+	Each span is given as ``(a_start, a_end, b_start, b_end)``, in order.
+
+	The result is the same as :meth:`difflib.SequenceMatcher.get_opcodes` gives for the whole of ``a`` and ``b``,
+	but only the lines in the spans are compared with each other.
+	The unchanged lines between the spans are matched up the same way as the :class:`~difflib.SequenceMatcher`
+	would match them, which is possible as long as none of the lines which could be matched elsewhere
+	are in longer runs than the unchanged lines. If that isn't the case :py:obj:`None` is returned.
+
+	:param a:
+	:param b:
+	:param spans:
+	"""
+
+	# Lines which can't start a match, as :class:`difflib.SequenceMatcher` considers them too common in ``b``.
+	b_counts = Counter(b)
+	popular: Set[str] = set()
+	if len(b) >= 200:
+		ntest = len(b) // 100 + 1
+		popular = {line for line, count in b_counts.items() if count > ntest}
+
+	# Each run of unchanged lines is a match on the diagonal where ``j = i + shift``.
+	gaps: List[Tuple[int, int, int]] = []
+	i = j = 0
+
+	trimmed_spans = []
+
+	for a_start, a_end, b_start, b_end in spans:
+		if a_start < i or b_start - a_start != j - i:
+			return None
+
+		# Lines at the start and end of the span which are the same either side are unchanged too.
+		while a_start < a_end and b_start < b_end and a[a_start] == b[b_start]:
+			a_start += 1
+			b_start += 1
+		while a_start < a_end and b_start < b_end and a[a_end - 1] == b[b_end - 1]:
+			a_end -= 1
+			b_end -= 1
+
+		trimmed_spans.append((a_start, a_end, b_start, b_end))
+		gaps.append((i, a_start, j - i))
+		i, j = a_end, b_end
+
+	if len(a) - i != len(b) - j:
+		return None
+	gaps.append((i, len(a), j - i))
+
+	# The longest run of lines in ``a`` which could match lines in ``b`` other than the unchanged line opposite them.
+	# That is, lines which aren't popular and either were changed or appear more than once.
+	ambiguous = _longest_ambiguous_run(a, trimmed_spans, b_counts, popular)
+	is_popular = bytes(map(popular.__contains__, a))
+
+	matching_blocks: List[Tuple[int, int, int]] = []
+	queue = [(0, len(a), 0, len(b), 0, len(gaps))]
+
+	while queue:
+		alo, ahi, blo, bhi, g_lo, g_hi = queue.pop()
+
+		best: Optional[Tuple[int, int, int, int, int]] = None
+		for g in range(g_lo, g_hi):
+			gap_start, gap_end, shift = gaps[g]
+			start = max(gap_start, alo, blo - shift)
+			end = min(gap_end, ahi, bhi - shift)
+			if start >= end:
+				continue
+
+			# The matcher extends the match for as long as the lines are the same.
+			while start > alo and start + shift > blo and a[start - 1] == b[start - 1 + shift]:
+				start -= 1
+			while end < ahi and end + shift < bhi and a[end] == b[end + shift]:
+				end += 1
+
+			run, run_start = _longest_run(is_popular, start, end)
+			if best is None or (run, -run_start) > (best[0], -best[1]):
+				best = (run, run_start, start, end, g)
+
+		if best is None:
+			# Only changed lines, which are compared in the same way as the matcher would.
+			matcher = difflib.SequenceMatcher(None, a[alo:ahi], b[blo:bhi], autojunk=False)
+			for line in popular.intersection(matcher.b2j):
+				del matcher.b2j[line]
+
+			for block in matcher.get_matching_blocks()[:-1]:
+				matching_blocks.append((block[0] + alo, block[1] + blo, block[2]))
+
+			continue
+
+		run, _, start, end, g = best
+
+		if run <= ambiguous:
+			if run or ambiguous:
+				# The matcher might prefer to match lines elsewhere.
+				return None
+
+			# Nothing can start a match, so the matcher only matches the lines at the start.
+			size = 0
+			while alo + size < ahi and blo + size < bhi and a[alo + size] == b[blo + size]:
+				size += 1
+
+			if size:
+				matching_blocks.append((alo, blo, size))
+				if alo + size < ahi and blo + size < bhi:
+					queue.append((alo + size, ahi, blo + size, bhi, g_lo, g_hi))
+
+			continue
+
+		shift = gaps[g][2]
+		matching_blocks.append((start, start + shift, end - start))
+
+		if alo < start and blo < start + shift:
+			queue.append((alo, start, blo, start + shift, g_lo, g))
+		if end < ahi and end + shift < bhi:
+			queue.append((end, ahi, end + shift, bhi, g + 1, g_hi))
+
+	matching_blocks.sort()
+
+	# Merge adjacent blocks, as :meth:`difflib.SequenceMatcher.get_matching_blocks` does.
+	merged: List[Tuple[int, int, int]] = []
+	for block in matching_blocks:
+		if merged and merged[-1][0] + merged[-1][2] == block[0] and merged[-1][1] + merged[-1][2] == block[1]:
+			merged[-1] = (merged[-1][0], merged[-1][1], merged[-1][2] + block[2])
+		else:
+			merged.append(block)
+
+	matcher = difflib.SequenceMatcher(None)
+	matcher.matching_blocks = [difflib.Match(*block) for block in merged]
+	matcher.matching_blocks.append(difflib.Match(len(a), len(b), 0))
+	return matcher.get_opcodes()
+
+
+_not_popular_run = re.compile(b"\x00+")
+_ambiguous_run = re.compile(b"\x01+")
+
+
+def _longest_run(is_popular: bytes, start: int, end: int) -> Tuple[int, int]:
+	# Returns the length and start of the first longest run of lines in ``start:end`` which aren't popular.
+
+	flags = is_popular[start:end]
+	longest = max(map(len, _not_popular_run.findall(flags)), default=0)
+	return longest, start + flags.find(b"\x00" * longest)
+
+
+def _longest_ambiguous_run(
+		a: Sequence[str],
+		spans: Sequence[Tuple[int, int, int, int]],
+		b_counts: Dict[str, int],
+		popular: Set[str],
+		) -> int:
+	# Returns the length of the longest run of lines in ``a`` which could be matched with a line in ``b``
+	# other than the one in the same place.
+
+	repeated = {line for line, count in b_counts.items() if count > 1 and line not in popular}
+	is_ambiguous = bytearray(map(repeated.__contains__, a))
+
+	for a_start, a_end, *_ in spans:
+		# Changed lines can be matched if they're anywhere in ``b``.
+		is_ambiguous[a_start:a_end] = (line in b_counts and line not in popular for line in a[a_start:a_end])
+
+	return max(map(len, _ambiguous_run.findall(is_ambiguous)), default=0)
@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+#
+#  _runner.py
+"""
+Run reformatters over many files, optionally in a pool of worker processes.
+"""
+#
+#  Copyright © 2026 Dominic Davis-Foster <dominic@davis-foster.co.uk>
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+#  EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+#  MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+#  IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+#  DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+#  OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE
+#  OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+# stdlib
+import collections
+import contextlib
+import itertools
+import multiprocessing
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+from io import StringIO
+from typing import Any, Callable, Deque, Generator, NamedTuple, Optional, Sequence
+
+# 3rd party
+from domdf_python_tools.paths import PathPlus
+
+# this package
+from snippet_fmt import PyReformatter, RSTReformatter
+from snippet_fmt.cache import snippet_cache
+from snippet_fmt.config import CompiledConfig, SnippetFmtConfigDict
+from snippet_fmt.formatters import format_python, formate_config_cache, get_capabilities
+from snippet_fmt.profiling import Span, profiler
+from snippet_fmt.session import FormattingSession
+
+__all__ = ("FileResult", "format_path", "iter_results", "resolve_jobs")
+
+#: Each worker process should have at least this many files to process,
+#: otherwise the cost of starting the process outweighs the benefit.
+MIN_FILES_PER_WORKER = 4
+
+#: reStructuredText files at least this large are reformatted a piece at a time
+#: (see :meth:`RSTReformatter.run_streaming() <snippet_fmt.RSTReformatter.run_streaming>`),
+#: unless a diff is requested.
+STREAMING_THRESHOLD = 16 * 1024 * 1024
+
+
+class FileResult(NamedTuple):
+	"""
+	The outcome of reformatting a single file.
+	"""
+
+	#: The file which was reformatted.
+	path: PathPlus
+
+	#: Whether the file was changed.
+	changed: bool
+
+	#: The diff of the changes, if requested and the file was changed.
+	diff: Optional[str]
+
+	#: Error messages written while reformatting the file, if they were captured.
+	messages: str
+
+	#: Whether the file is unchanged and no errors were found, so it can be cached.
+	clean: bool
+
+	#: Whether the file was skipped as it doesn't contain any of the configured directives.
+	prefiltered: bool = False
+
+	#: The steps timed while reformatting the file in a worker process, if profiling is enabled.
+	#: :func:`~.iter_results` adds them to :data:`~snippet_fmt.profiling.profiler` in the main process.
+	spans: Sequence[Span] = ()
+
+
+def format_path(
+		path: PathPlus,
+		config: SnippetFmtConfigDict,
+		show_diff: bool = False,
+		capture: bool = False,
+		session: Optional[FormattingSession] = None,
+		check: bool = False,
+		fail_fast: bool = False,
+		claim: Optional[Callable[[], bool]] = None,
+		) -> FileResult:
+	"""
+	Reformat the given file, writing the changes back to it.
+
+	:param path: The reStructuredText or Python file to reformat.
+	:param config: The ``snippet_fmt`` configuration, parsed from a TOML file (or similar).
+	:param show_diff: Whether to construct a diff of the changes.
+	:param capture: Whether to capture error messages rather than printing them immediately.
+	:param session: State shared with other files reformatted with the same configuration.
+	:param check: Only check whether the file would be changed, without writing it.
+	:param fail_fast: When checking, stop at the first code block which would be changed.
+	:param claim: If given, called once the file is known to need changing, before it is written.
+		If it returns :py:obj:`False` the file is left as it is, and isn't reported as changed.
+	"""
+
+	stderr = StringIO()
+
+	with profiler.span("file", filename=path.as_posix()):
+		with contextlib.redirect_stderr(stderr) if capture else contextlib.nullcontext():
+			r: RSTReformatter
+
+			if path.suffix == ".rst":
+				r = RSTReformatter(path, config=config, session=session)
+			else:
+				assert path.suffix == ".py"
+				r = PyReformatter(path, config=config, session=session)
+
+			# The rest of the file only needs reformatting if it's going to be written back.
+			r.fail_fast = check and fail_fast
+
+			# Unless the whole file is needed for the diff, large files aren't read into memory all at once.
+			# Streaming writes the file as it goes, before it's known whether it can be claimed.
+			streaming = (
+					path.suffix == ".rst" and not show_diff and claim is None
+					and path.stat().st_size >= STREAMING_THRESHOLD
+					)
+
+			if streaming:
+				changed = r.run_streaming(write=not check)
+			else:
+				changed = r.run()
+
+		diff = None
+
+		# The file still isn't clean if it's left as it is.
+		clean = not (changed or r.errors)
+
+		if changed and claim is not None and not claim():
+			changed = False
+
+		if changed and not streaming:
+			if show_diff:
+				diff = r.get_diff()
+
+			if not check:
+				r.to_file()
+
+	return FileResult(
+			path,
+			changed,
+			diff,
+			stderr.getvalue(),
+			clean=clean,
+			prefiltered=r.prefiltered,
+			)
+
+
+def resolve_jobs(jobs: str) -> int:
+	"""
+	Convert the value of the ``--jobs`` option into a number of processes.
+
+	:param jobs: A positive integer, or ``'auto'`` to use one process per CPU.
+	"""
+
+	if jobs == "auto":
+		return os.cpu_count() or 1
+
+	num_jobs = int(jobs)
+	if num_jobs < 1:
+		raise ValueError("The number of jobs must be at least 1")
+
+	return num_jobs
+
+
+_worker_config: Optional[SnippetFmtConfigDict] = None
+_worker_show_diff: bool = False
+_worker_check: bool = False
+_worker_fail_fast: bool = False
+_worker_session: Optional[FormattingSession] = None
+_worker_failed: Optional[Any] = None
+
+
+def _init_worker(
+		compiled: CompiledConfig,
+		show_diff: bool,
+		snippet_db: Optional[str],
+		check: bool = False,
+		fail_fast: bool = False,
+		profile: bool = False,
+		failed: Optional[Any] = None,
+		) -> None:
+	global _worker_config, _worker_show_diff, _worker_check, _worker_fail_fast, _worker_session, _worker_failed
+
+	# Forked workers inherit the spans the main process recorded before the pool started,
+	# which would otherwise be sent back with the first result as if the worker had recorded them.
+	profiler.clear()
+	profiler.enabled = profile
+
+	_worker_config = config = compiled.to_dict()
+	_worker_show_diff = show_diff
+	_worker_check = check
+	_worker_fail_fast = fail_fast
+	_worker_session = FormattingSession(compiled)
+	_worker_failed = failed
+
+	if snippet_db is not None:
+		snippet_cache.open(snippet_db)
+
+	# Import the formatters and ``formate`` hooks up front,
+	# rather than the first time each worker sees a code block.
+	with contextlib.suppress(Exception):  # pylint: disable=W8205
+		for language, lang_config in config["languages"].items():
+			if not lang_config.get("reformat", False):
+				continue
+			if compiled.get_formatter(language)[0] is not format_python:
+				continue
+
+			formate_config_cache.pipeline(lang_config.get("config-file", "formate.toml"))
+
+
+def _process_safe(compiled: CompiledConfig) -> bool:
+	# Returns whether all the configured formatters can be used in worker processes.
+	return all(get_capabilities(compiled.get_formatter(language)[0]).process_safe for language in compiled.languages)
+
+
+def _claim_failure() -> bool:
+	# Returns whether this is the first file found to need changing by any of the workers.
+	assert _worker_failed is not None
+
+	with _worker_failed.get_lock():
+		if _worker_failed.value:
+			return False
+
+		_worker_failed.value = 1
+		return True
+
+
+def _format_in_worker(path: PathPlus) -> Optional[FileResult]:
+	# Returns :py:obj:`None` if the file was left alone, as another worker failed fast first.
+
+	assert _worker_config is not None
+
+	if _worker_failed is not None and _worker_failed.value:
+		return None
+
+	claimed = []
+
+	def claim() -> bool:
+		claimed.append(_claim_failure())
+		return claimed[-1]
+
+	result = format_path(
+			path,
+			_worker_config,
+			show_diff=_worker_show_diff,
+			capture=True,
+			session=_worker_session,
+			check=_worker_check,
+			fail_fast=_worker_fail_fast,
+			claim=None if _worker_failed is None else claim,
+			)
+
+	if claimed and not claimed[-1]:
+		return None
+
+	if profiler.enabled:
+		# Passed back to the main process along with the result.
+		result = result._replace(spans=profiler.take())
+
+	return result
+
+
+def iter_results(
+		paths: Sequence[PathPlus],
+		config: SnippetFmtConfigDict,
+		show_diff: bool = False,
+		jobs: int = 1,
+		snippet_db: Optional[str] = None,
+		check: bool = False,
+		fail_fast: bool = False,
+		) -> Generator[FileResult, None, None]:
+	"""
+	Reformat the given files, yielding the results in the same order as ``paths``.
+
+	If there are enough files to make it worthwhile, they are reformatted in a pool of up to ``jobs`` processes.
+	Otherwise, or if any of the configured formatters isn't declared as
+	:attr:`~snippet_fmt.formatters.FormatterCapabilities.process_safe`,
+	they are reformatted one after another in the current process.
+
+	Closing the iterator early cancels any files which haven't started being reformatted.
+	With ``fail_fast``, the worker processes stop once any of them finds a file which would be changed,
+	and only that file is changed and yielded, along with the unchanged files before it.
+
+	If :data:`~snippet_fmt.profiling.profiler` is enabled, the steps timed in worker processes
+	are added to it as each result is yielded, so it holds the spans for every file.
+
+	:param paths:
+	:param config: The ``snippet_fmt`` configuration, parsed from a TOML file (or similar).
+	:param show_diff: Whether to construct a diff of the changes.
+	:param jobs: The maximum number of worker processes.
+	:param snippet_db: An SQLite database to store formatted snippets in, shared between processes.
+	:param check: Only check whether the files would be changed, without writing them.
+	:param fail_fast: Stop at the first file which would be changed. When checking, also stop at the first
+		code block in the file which would be changed.
+	"""
+
+	compiled = CompiledConfig(config)
+	workers = min(jobs, len(paths) // MIN_FILES_PER_WORKER)
+
+	if workers > 1 and not _process_safe(compiled):
+		workers = 1
+
+	if workers <= 1:
+		if snippet_db is not None:
+			snippet_cache.open(snippet_db)
+
+		session = FormattingSession(compiled)
+
+		try:
+			for path in paths:
+				yield format_path(
+						path,
+						config,
+						show_diff=show_diff,
+						session=session,
+						check=check,
+						fail_fast=fail_fast,
+						)
+		finally:
+			snippet_cache.close()
+
+		return
+
+	# Set by the first worker to find a file which would be changed, so the others leave their files alone.
+	failed = multiprocessing.Value('b', 0) if fail_fast else None
+
+	# The database is only opened in the worker processes, as SQLite connections can't be shared across a fork.
+	executor = ProcessPoolExecutor(
+			max_workers=workers,
+			initializer=_init_worker,
+			initargs=(compiled, show_diff, snippet_db, check, fail_fast, profiler.enabled, failed),
+			)
+
+	# Only a few files are handed to the workers at a time, so closing the iterator stops the work promptly.
+	remaining = iter(paths)
+	pending: Deque["Future[Optional[FileResult]]"] = collections.deque()
+
+	try:
+		for path in itertools.islice(remaining, workers * 2):
+			pending.append(executor.submit(_format_in_worker, path))
+
+		while pending:
+			result = pending.popleft().result()
+
+			for path in itertools.islice(remaining, 1):
+				pending.append(executor.submit(_format_in_worker, path))
+
+			if result is None:
+				continue
+
+			profiler.spans.extend(result.spans)
+			yield result
+	finally:
+		for future in pending:
+			future.cancel()
+
+		executor.shutdown(wait=True)
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+#
+#  budget.py
+"""
+Limits on the size of code snippets and the time taken to format them.
+
+.. versionadded:: 0.4.0
+"""
+#
+#  Copyright © 2026 Dominic Davis-Foster <dominic@davis-foster.co.uk>
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+#  EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+#  MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+#  IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+#  DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+#  OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE
+#  OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+# stdlib
+import contextlib
+import signal
+import threading
+from typing import Any, Callable, Iterator, Mapping, NamedTuple, Optional, TypeVar
+
+__all__ = ("BUDGET_KEYS", "SnippetBudget", "SnippetTimeout", "SnippetTooLarge", "call_with_timeout")
+
+#: The options which set a :class:`~.SnippetBudget`,
+#: either for a single language or, at the top level of the configuration, for all languages.
+BUDGET_KEYS = ("max-size", "timeout")
+
+_T = TypeVar("_T")
+
+
+class SnippetTooLarge(Exception):
+	"""
+	Raised when a code snippet is larger than its language's :attr:`~.SnippetBudget.max_size`.
+	"""
+
+
+class SnippetTimeout(Exception):
+	"""
+	Raised when formatting a code snippet takes longer than its language's :attr:`~.SnippetBudget.timeout`.
+	"""
+
+
+class _Interrupted(BaseException):
+	# Raised from the signal handler. Derives from BaseException so formatters don't catch it by accident.
+	pass
+
+
+class SnippetBudget(NamedTuple):
+	"""
+	Limits on the code snippets for a language.
+	Snippets which exceed a limit are left unchanged, and reported as an error.
+	"""
+
+	#: The maximum length of a snippet, in characters.
+	max_size: Optional[int] = None
+
+	#: The maximum time, in seconds, to spend formatting a snippet.
+	timeout: Optional[float] = None
+
+	@classmethod
+	def from_config(cls, lang_config: Mapping[str, Any]) -> "SnippetBudget":
+		"""
+		Returns the budget from the given language-specific configuration.
+
+		:param lang_config:
+		"""
+
+		max_size = lang_config.get("max-size")
+		timeout = lang_config.get("timeout")
+
+		return cls(
+				None if max_size is None else int(max_size),
+				None if timeout is None else float(timeout),
+				)
+
+	@property
+	def batch_timeout(self) -> Optional[float]:
+		"""
+		The maximum time, in seconds, to spend formatting several snippets together.
+
+		This is only a little longer than :attr:`~.timeout`, so a snippet which hangs is given up on quickly.
+		If a batch runs out of time its snippets are formatted one at a time, each with the full :attr:`~.timeout`.
+
+		.. versionadded:: 0.4.0
+		"""
+
+		if self.timeout is None:
+			return None
+
+		return self.timeout * 1.5
+
+	def check_size(self, code: str) -> None:
+		"""
+		Raise :exc:`~.SnippetTooLarge` if the given code is longer than :attr:`~.max_size`.
+
+		:param code:
+		"""
+
+		if self.max_size is not None and len(code) > self.max_size:
+			raise SnippetTooLarge(
+					f"Skipped code block of {len(code)} characters, as it exceeds the limit of {self.max_size}"
+					)
+
+
+def call_with_timeout(timeout: Optional[float], func: Callable[..., _T], *args: Any, **kwargs: Any) -> _T:
+	r"""
+	Call ``func``, raising :exc:`~.SnippetTimeout` if it takes longer than ``timeout`` seconds.
+
+	In the main thread of a process (including worker processes) on platforms with :func:`signal.setitimer`,
+	``func`` is interrupted when the time runs out. Otherwise it is run in a separate thread,
+	which is abandoned when the time runs out.
+
+	:param timeout: The time limit, in seconds. :py:obj:`None` for no limit.
+	:param func:
+	:param \*args: Positional arguments to pass to ``func``.
+	:param \*\*kwargs: Keyword arguments to pass to ``func``.
+	"""
+
+	if timeout is None:
+		return func(*args, **kwargs)
+
+	if _can_use_alarm():
+		with _alarm(timeout):
+			return func(*args, **kwargs)
+
+	result: list = []
+	error: list = []
+
+	def target() -> None:
+		try:
+			result.append(func(*args, **kwargs))
+		except BaseException as e:  # pylint: disable=W8205
+			error.append(e)
+
+	thread = threading.Thread(target=target, name="snippet-fmt-watchdog", daemon=True)
+	thread.start()
+	thread.join(timeout)
+
+	if thread.is_alive():
+		raise _timeout_error(timeout)
+	if error:
+		raise error[0]
+
+	return result[0]
+
+
+def _can_use_alarm() -> bool:
+	# The timer can only be used from the main thread, and not if something else is already using it.
+	return (
+			hasattr(signal, "setitimer") and threading.current_thread() is threading.main_thread()
+			and signal.getitimer(signal.ITIMER_REAL)[0] == 0
+			)
+
+
+def _timeout_error(timeout: float) -> SnippetTimeout:
+	return SnippetTimeout(f"Skipped code block, as formatting it took longer than {timeout:g} seconds")
+
+
+def _raise_interrupted(signum: int, frame: Any) -> None:
+	raise _Interrupted
+
+
+@contextlib.contextmanager
+def _alarm(timeout: float) -> Iterator[None]:
+	previous = signal.signal(signal.SIGALRM, _raise_interrupted)
+
+	try:
+		try:
+			signal.setitimer(signal.ITIMER_REAL, timeout)
+			yield
+		finally:
+			signal.setitimer(signal.ITIMER_REAL, 0)
+	except _Interrupted:
+		raise _timeout_error(timeout) from None
+	finally:
+		signal.signal(signal.SIGALRM, signal.SIG_DFL if previous is None else previous)
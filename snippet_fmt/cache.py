@@ -0,0 +1,661 @@
+#!/usr/bin/env python3
+#
+#  cache.py
+"""
+Caches of files which are known to be correctly formatted, and of formatted snippets.
+
+The caches are stored in the user's cache directory, or the directory given by the
+``SNIPPET_FMT_CACHE_DIR`` environment variable.
+A separate file cache is used for each combination of ``snippet-fmt`` version, configuration,
+``formate`` configuration and installed formatters, so changing any of these invalidates the cache.
+The index of installed entry points is cached there too.
+
+.. versionadded:: 0.4.0
+"""
+#
+#  Copyright © 2026 Dominic Davis-Foster <dominic@davis-foster.co.uk>
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+#  EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+#  MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+#  IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+#  DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+#  OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE
+#  OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+# stdlib
+import copy
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple, Union
+
+# 3rd party
+from domdf_python_tools.paths import PathPlus
+from domdf_python_tools.typing import PathLike
+
+# this package
+from snippet_fmt.config import SnippetFmtConfigDict
+from snippet_fmt.formatters import Formatter, format_many
+
+__all__ = (
+		"Cache",
+		"EntryPointRecord",
+		"SnippetCache",
+		"get_cache_dir",
+		"get_cache_key",
+		"get_entry_points",
+		"get_tool_versions",
+		"snippet_cache",
+		)
+
+#: Entry point groups which can change the output of ``snippet-fmt``.
+ENTRY_POINT_GROUPS = ("snippet_fmt.formatters", "formate_hooks", "formate-hooks")
+
+
+def get_cache_dir() -> PathPlus:
+	"""
+	Returns the directory the cache is stored in.
+
+	This is the ``SNIPPET_FMT_CACHE_DIR`` environment variable if set,
+	or a version-specific directory in the user's cache directory otherwise.
+	"""
+
+	# this package
+	from snippet_fmt import __version__
+
+	if os.environ.get("SNIPPET_FMT_CACHE_DIR"):
+		return PathPlus(os.environ["SNIPPET_FMT_CACHE_DIR"])
+
+	if sys.platform == "win32":
+		base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~/AppData/Local")
+		return PathPlus(base, "snippet-fmt", "Cache", __version__)
+	elif sys.platform == "darwin":
+		return PathPlus(os.path.expanduser("~/Library/Caches"), "snippet-fmt", __version__)
+	else:
+		base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+		return PathPlus(base, "snippet-fmt", __version__)
+
+
+def _hash_file(filename: PathLike) -> Optional[str]:
+	try:
+		return hashlib.sha256(PathPlus(filename).read_bytes()).hexdigest()
+	except OSError:
+		return None
+
+
+def _formate_config_files(config: SnippetFmtConfigDict) -> List[str]:
+	files = set()
+
+	for lang_config in config["languages"].values():
+		if lang_config.get("reformat", False):
+			files.add(os.path.abspath(lang_config.get("config-file", "formate.toml")))
+
+	return sorted(files)
+
+
+#: An entry point, as a ``(group, name, object reference, distribution name, distribution version)`` tuple.
+EntryPointRecord = Tuple[str, str, str, str, str]
+
+# The entry points and tool versions found the last time, and the value of ``sys.path`` they were found with.
+_entry_points: Optional[Tuple[Tuple[str, ...], List[EntryPointRecord], Dict[str, str]]] = None
+
+
+def _sys_path_fingerprint() -> str:
+	# Installing or removing a distribution changes the modification time of its parent directory.
+	entries = []
+
+	for entry in sys.path:
+		try:
+			mtime = os.stat(entry or os.curdir).st_mtime_ns
+		except OSError:
+			mtime = None
+
+		entries.append((os.path.abspath(entry), mtime))
+
+	data = {"executable": sys.executable, "path": entries}
+	return hashlib.sha256(json.dumps(data).encode("UTF-8")).hexdigest()
+
+
+def _normalise_name(name: str) -> str:
+	return name.lower().replace('_', '-')
+
+
+def _scan_entry_points() -> Tuple[List[EntryPointRecord], Dict[str, str]]:
+	# Returns the entry points, and the versions of the tools wrapped by ``formate`` hooks.
+
+	# 3rd party
+	import entrypoints  # type: ignore[import-untyped]
+
+	records = []
+	versions: Dict[str, str] = {}
+
+	for distro_config, distro in entrypoints.iter_files_distros():
+		# The first distribution found with a given name is the one which is imported.
+		versions.setdefault(_normalise_name(distro.name), distro.version or '')
+
+		for group in ENTRY_POINT_GROUPS:
+			if group in distro_config:
+				for name, epstr in distro_config[group].items():
+					records.append((group, name, epstr, distro.name, distro.version or ''))
+
+	# Hooks such as ``isort`` and ``yapf`` are provided by ``formate``, but named after the tool they run.
+	hooks = {_normalise_name(record[1]) for record in records if record[0] != "snippet_fmt.formatters"}
+	tools = {name: versions[name] for name in sorted(hooks) if name in versions}
+
+	return records, tools
+
+
+def get_entry_points(cache_dir: Optional[PathLike] = None) -> List[EntryPointRecord]:
+	"""
+	Returns the ``snippet-fmt`` formatter and ``formate`` hook entry points of the distributions on :py:obj:`sys.path`,
+	in the order the distributions are found.
+
+	Scanning the installed distributions is slow, so the result is cached in memory until :py:obj:`sys.path` changes,
+	and on disk keyed by a fingerprint of the :py:obj:`sys.path` entries and their modification times.
+
+	:param cache_dir: The directory to store the index in. Defaults to :func:`~.get_cache_dir`.
+	"""
+
+	return _read_index(cache_dir)[0]
+
+
+def get_tool_versions(cache_dir: Optional[PathLike] = None) -> Dict[str, str]:
+	"""
+	Returns a mapping of the names of the tools run by ``formate`` hooks (such as ``isort`` and ``yapf``)
+	to their installed versions.
+
+	The tools are found from the distributions named after the hooks,
+	and cached along with the entry points (see :func:`~.get_entry_points`).
+
+	:param cache_dir: The directory to store the index in. Defaults to :func:`~.get_cache_dir`.
+	"""
+
+	return _read_index(cache_dir)[1]
+
+
+def _read_index(cache_dir: Optional[PathLike] = None) -> Tuple[List[EntryPointRecord], Dict[str, str]]:
+	global _entry_points
+
+	path = tuple(sys.path)
+	if _entry_points is not None and _entry_points[0] == path:
+		return _entry_points[1], _entry_points[2]
+
+	if cache_dir is None:
+		cache_dir = get_cache_dir()
+
+	index_file = PathPlus(cache_dir) / f"entry_points.{_sys_path_fingerprint()[:32]}.json"
+
+	try:
+		index = json.loads(index_file.read_text())
+		records = [(e[0], e[1], e[2], e[3], e[4]) for e in index["entry_points"]]
+		tools = {str(name): str(version) for name, version in index["tools"].items()}
+	except (OSError, ValueError, TypeError, IndexError, KeyError, AttributeError):
+		records, tools = _scan_entry_points()
+
+		try:
+			index_file.parent.maybe_make(parents=True)
+
+			with tempfile.NamedTemporaryFile(
+					mode='w',
+					dir=index_file.parent,
+					prefix=index_file.name,
+					suffix=".tmp",
+					delete=False,
+					) as fp:
+				json.dump({"entry_points": records, "tools": tools}, fp)
+
+			os.replace(fp.name, index_file)
+		except OSError:
+			pass
+
+	_entry_points = (path, records, tools)
+	return records, tools
+
+
+def _entry_points_fingerprint() -> List[EntryPointRecord]:
+	return sorted(get_entry_points())
+
+
+def _versions_fingerprint() -> Dict[str, Any]:
+	# The versions of everything which could change the output of a formatter.
+
+	# this package
+	from snippet_fmt import __version__
+
+	return {"snippet_fmt": __version__, "entry_points": _entry_points_fingerprint(), "tools": get_tool_versions()}
+
+
+def get_cache_key(config: SnippetFmtConfigDict) -> str:
+	"""
+	Returns a key identifying everything, other than the file itself, which affects how a file is reformatted.
+
+	The key covers the ``snippet-fmt`` version, the configuration, the content of any ``formate``
+	configuration files it references, the installed formatter and ``formate`` hook entry points,
+	and the versions of the tools the hooks run.
+
+	:param config: The ``snippet_fmt`` configuration, parsed from a TOML file (or similar).
+	"""
+
+	key_data = {
+			"versions": _versions_fingerprint(),
+			"config": config,
+			"formate": {filename: _hash_file(filename) for filename in _formate_config_files(config)},
+			}
+
+	return hashlib.sha256(json.dumps(key_data, sort_keys=True, default=str).encode("UTF-8")).hexdigest()
+
+
+class Cache:
+	"""
+	Records files which have been checked and found to be correctly formatted.
+
+	:param key: The cache key, from :func:`~.get_cache_key`.
+	:param cache_dir: The directory to store the cache in. Defaults to :func:`~.get_cache_dir`.
+	"""
+
+	#: The file the cache is stored in.
+	cache_file: PathPlus
+
+	def __init__(self, key: str, cache_dir: Optional[PathLike] = None):
+		if cache_dir is None:
+			cache_dir = get_cache_dir()
+
+		self.cache_file = PathPlus(cache_dir) / f"cache.{key[:32]}.json"
+
+		# Mapping of absolute filenames to (mtime, size, sha256 hash)
+		self._entries: Dict[str, Tuple[float, int, str]] = {}
+		self._changed = False
+
+	@classmethod
+	def read(cls, config: SnippetFmtConfigDict, cache_dir: Optional[PathLike] = None) -> "Cache":
+		"""
+		Read the cache for the given configuration.
+
+		A missing or corrupt cache file results in an empty cache.
+
+		:param config: The ``snippet_fmt`` configuration, parsed from a TOML file (or similar).
+		:param cache_dir: The directory to store the cache in. Defaults to :func:`~.get_cache_dir`.
+		"""
+
+		cache = cls(get_cache_key(config), cache_dir)
+
+		try:
+			entries = json.loads(cache.cache_file.read_text())
+		except (OSError, ValueError):
+			return cache
+
+		if isinstance(entries, dict):
+			for filename, entry in entries.items():
+				if isinstance(entry, list) and len(entry) == 3:
+					cache._entries[filename] = (entry[0], entry[1], entry[2])
+
+		return cache
+
+	def is_clean(self, filename: PathLike) -> bool:
+		"""
+		Returns whether the given file is known to be correctly formatted.
+
+		:param filename:
+		"""
+
+		path = os.path.abspath(filename)
+		entry = self._entries.get(path)
+		if entry is None:
+			return False
+
+		try:
+			st = os.stat(path)
+		except OSError:
+			return False
+
+		if st.st_size != entry[1]:
+			return False
+		if st.st_mtime == entry[0]:
+			return True
+
+		# The file has been touched, but the content may be the same.
+		if _hash_file(path) != entry[2]:
+			return False
+
+		self._entries[path] = (st.st_mtime, st.st_size, entry[2])
+		self._changed = True
+		return True
+
+	def mark_clean(self, filename: PathLike) -> None:
+		"""
+		Record that the given file is correctly formatted.
+
+		:param filename:
+		"""
+
+		path = os.path.abspath(filename)
+
+		file_hash = _hash_file(path)
+		if file_hash is None:
+			return
+
+		st = os.stat(path)
+		self._entries[path] = (st.st_mtime, st.st_size, file_hash)
+		self._changed = True
+
+	def write(self) -> None:
+		"""
+		Write the cache to disk, if it has changed.
+		"""
+
+		if not self._changed:
+			return
+
+		self.cache_file.parent.maybe_make(parents=True)
+
+		with tempfile.NamedTemporaryFile(
+				mode='w',
+				dir=self.cache_file.parent,
+				prefix=self.cache_file.name,
+				suffix=".tmp",
+				delete=False,
+				) as fp:
+			json.dump(self._entries, fp)
+
+		os.replace(fp.name, self.cache_file)
+		self._changed = False
+
+
+class SnippetCache:
+	"""
+	Content-addressed cache of the results of formatting individual code snippets.
+
+	Results are keyed on the language, a hash of the language's configuration (see :meth:`~.config_hash`)
+	and the dedented snippet. Both the formatted code and any exception raised by the formatter are cached.
+
+	Recently used results are kept in memory, and optionally in an SQLite database
+	which is shared between processes and runs.
+
+	:param maxsize: The maximum number of results to keep in memory.
+	:param filename: The SQLite database to store results in, if any.
+	:param max_file_size: The size, in bytes, above which the least recently used results
+		are evicted from the SQLite database.
+	"""
+
+	#: The number of results found in the cache.
+	hits: int
+
+	#: The number of results which had to be computed.
+	misses: int
+
+	def __init__(
+			self,
+			maxsize: int = 4096,
+			filename: Optional[PathLike] = None,
+			max_file_size: int = 64 * 1024 * 1024,
+			):
+		self.maxsize = maxsize
+		self.max_file_size = max_file_size
+		self.hits = 0
+		self.misses = 0
+
+		self._memory: "OrderedDict[str, Tuple[bool, Any]]" = OrderedDict()
+		self._db: Optional[sqlite3.Connection] = None
+
+		if filename is not None:
+			self.open(filename)
+
+	def open(self, filename: PathLike) -> None:
+		"""
+		Store results in the given SQLite database, in addition to in memory.
+
+		:param filename:
+		"""
+
+		self.close()
+
+		PathPlus(filename).parent.maybe_make(parents=True)
+		db = sqlite3.connect(os.fspath(filename), timeout=30, isolation_level=None)
+
+		try:
+			db.execute("PRAGMA journal_mode=WAL")
+			db.execute("PRAGMA synchronous=NORMAL")
+			db.execute(
+					"CREATE TABLE IF NOT EXISTS snippets "
+					"(key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)"
+					)
+		except sqlite3.Error:
+			db.close()
+			return
+
+		self._db = db
+		self.evict()
+
+	def close(self) -> None:
+		"""
+		Evict old results from the SQLite database, if any, and close it.
+		"""
+
+		if self._db is not None:
+			self.evict()
+			self._db.close()
+			self._db = None
+
+	def clear(self) -> None:
+		"""
+		Remove all results held in memory.
+		"""
+
+		self._memory.clear()
+
+	def evict(self) -> None:
+		"""
+		Remove the least recently used results from the SQLite database until it is below ``max_file_size``.
+		"""
+
+		if self._db is None:
+			return
+
+		try:
+			total_size = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM snippets").fetchone()[0]
+			if total_size <= self.max_file_size:
+				return
+
+			to_free = total_size - (self.max_file_size * 3 // 4)
+			freed = 0
+			keys = []
+			for key, size in self._db.execute("SELECT key, size FROM snippets ORDER BY accessed"):
+				keys.append((key, ))
+				freed += size
+				if freed >= to_free:
+					break
+
+			self._db.executemany("DELETE FROM snippets WHERE key = ?", keys)
+		except sqlite3.Error:
+			pass
+
+	@staticmethod
+	def config_hash(formatter: Formatter, lang_config: Mapping[str, Any]) -> str:
+		"""
+		Returns a hash of the formatter and the configuration for a language.
+
+		If reformatting is enabled the content of the ``formate`` configuration file is included too.
+		The versions of ``snippet-fmt``, the installed formatters and ``formate`` hooks,
+		and the tools they run are included, so results from before an upgrade aren't reused.
+
+		:param formatter:
+		:param lang_config: The language-specific configuration.
+		"""
+
+		config_data = {
+				"formatter": f"{getattr(formatter, '__module__', '')}.{getattr(formatter, '__qualname__', formatter)}",
+				"config": dict(lang_config),
+				"versions": _versions_fingerprint(),
+				}
+
+		if lang_config.get("reformat", False):
+			config_data["formate"] = _hash_file(lang_config.get("config-file", "formate.toml"))
+
+		return hashlib.sha256(json.dumps(config_data, sort_keys=True, default=str).encode("UTF-8")).hexdigest()
+
+	def format(
+			self,
+			language: str,
+			config_hash: str,
+			code: str,
+			formatter: Formatter,
+			lang_config: Mapping[str, Any],
+			) -> str:
+		r"""
+		Format the given code, or return the cached result of formatting identical code.
+
+		If the formatter raised an exception, a copy of that exception is raised again.
+
+		:param language: The language of the code snippet.
+		:param config_hash: The return value of :meth:`~.config_hash` for the language.
+		:param code: The dedented code snippet.
+		:param formatter: The formatter for the language.
+		:param lang_config: The language-specific configuration.
+		"""
+
+		key = self._key(language, config_hash, code)
+
+		result = self._get(key)
+
+		if result is None:
+			self.misses += 1
+
+			try:
+				result = (True, formatter(code, **lang_config))
+			except Exception as e:
+				result = (False, e)
+
+			self._set(key, result)
+		else:
+			self.hits += 1
+
+		ok, value = result
+		if ok:
+			return value
+		else:
+			# The exception may be modified by the caller (e.g. to set the filename).
+			raise copy.copy(value)
+
+	def format_many(
+			self,
+			language: str,
+			config_hash: str,
+			codes: Sequence[str],
+			formatter: Formatter,
+			lang_config: Mapping[str, Any],
+			) -> List[Union[str, Exception]]:
+		"""
+		Format the given code snippets, reusing the cached results of formatting identical code.
+
+		The snippets which aren't in the cache are passed to :func:`snippet_fmt.formatters.format_many` in a single call.
+
+		:param language: The language of the code snippets.
+		:param config_hash: The return value of :meth:`~.config_hash` for the language.
+		:param codes: The dedented code snippets.
+		:param formatter: The formatter for the language.
+		:param lang_config: The language-specific configuration.
+
+		:returns: For each snippet, in order, either the reformatted code or a copy of the exception
+			raised when formatting it.
+
+		.. versionadded:: 0.4.0
+		"""
+
+		keys = [self._key(language, config_hash, code) for code in codes]
+		found: Dict[str, Tuple[bool, Any]] = {}
+		missing: Dict[str, str] = {}
+
+		for key, code in zip(keys, codes):
+			if key in found or key in missing:
+				continue
+
+			result = self._get(key)
+			if result is None:
+				missing[key] = code
+			else:
+				found[key] = result
+
+		self.hits += len(codes) - len(missing)
+		self.misses += len(missing)
+
+		if missing:
+			new_results = format_many(formatter, list(missing.values()), **lang_config)
+			for key, value in zip(missing, new_results):
+				found[key] = result = (not isinstance(value, Exception), value)
+				self._set(key, result)
+
+		return [value if ok else copy.copy(value) for ok, value in map(found.__getitem__, keys)]
+
+	@staticmethod
+	def _key(language: str, config_hash: str, code: str) -> str:
+		return hashlib.sha256('\0'.join([language, config_hash, code]).encode("UTF-8", "surrogatepass")).hexdigest()
+
+	def _get(self, key: str) -> Optional[Tuple[bool, Any]]:
+		if key in self._memory:
+			self._memory.move_to_end(key)
+			return self._memory[key]
+
+		if self._db is None:
+			return None
+
+		try:
+			row = self._db.execute("SELECT value FROM snippets WHERE key = ?", (key, )).fetchone()
+			if row is None:
+				return None
+
+			result = pickle.loads(row[0])
+			self._db.execute("UPDATE snippets SET accessed = ? WHERE key = ?", (time.time(), key))
+		except (sqlite3.Error, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+			return None
+
+		self._remember(key, result)
+		return result
+
+	def _set(self, key: str, result: Tuple[bool, Union[str, Exception]]) -> None:
+		self._remember(key, result)
+
+		if self._db is None:
+			return
+
+		try:
+			value = pickle.dumps(result)
+			pickle.loads(value)  # Some exceptions can be pickled but not unpickled
+		except Exception:  # pylint: disable=W8205
+			return
+
+		try:
+			self._db.execute(
+					"INSERT OR REPLACE INTO snippets (key, value, size, accessed) VALUES (?, ?, ?, ?)",
+					(key, value, len(value) + len(key), time.time()),
+					)
+		except sqlite3.Error:
+			pass
+
+	def _remember(self, key: str, result: Tuple[bool, Any]) -> None:
+		self._memory[key] = result
+		self._memory.move_to_end(key)
+
+		while len(self._memory) > self.maxsize:
+			self._memory.popitem(last=False)
+
+
+#: The snippet cache shared by all reformatters in this process, unless they are given another.
+snippet_cache = SnippetCache()
@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+#
+#  command.py
+"""
+Formatters which run external commands.
+
+.. versionadded:: 0.4.0
+"""
+#
+#  Copyright © 2026 Dominic Davis-Foster <dominic@davis-foster.co.uk>
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+#  EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+#  MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+#  IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+#  DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+#  OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE
+#  OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+# stdlib
+import atexit
+import os
+import shlex
+import subprocess
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import IO, Any, Dict, List, Mapping, Optional, Sequence, Tuple, Union
+
+# this package
+from snippet_fmt.formatters import FormatterCapabilities
+
+__all__ = ("CommandError", "CommandFormatter", "WorkerPool")
+
+
+class CommandError(Exception):
+	"""
+	Raised when an external command fails to format a code snippet.
+	"""
+
+
+class _WorkerCrashed(Exception):
+	# The worker process exited, or replied with something other than the expected protocol.
+	pass
+
+
+class _Worker:
+	# A long-lived worker process, speaking the protocol described in :class:`~.WorkerPool`.
+
+	def __init__(self, argv: Sequence[str]):
+		self.process = subprocess.Popen(
+				argv,
+				stdin=subprocess.PIPE,
+				stdout=subprocess.PIPE,
+				stderr=subprocess.DEVNULL,
+				)
+
+	def request(self, code: str) -> str:
+		stdin: IO[bytes] = self.process.stdin  # type: ignore[assignment]
+		stdout: IO[bytes] = self.process.stdout  # type: ignore[assignment]
+
+		data = code.encode("UTF-8")
+
+		try:
+			stdin.write(b"%d\n" % len(data))
+			stdin.write(data)
+			stdin.flush()
+			header = stdout.readline()
+		except OSError as e:
+			raise _WorkerCrashed(str(e)) from e
+
+		status, _, length = header.decode("ascii", "replace").partition(' ')
+		if status not in {"ok", "error"} or not length.strip().isdigit():
+			raise _WorkerCrashed(f"Unexpected reply {header!r}")
+
+		payload = stdout.read(int(length))
+		if len(payload) != int(length):
+			raise _WorkerCrashed("Incomplete reply")
+
+		text = payload.decode("UTF-8", "replace")
+		if status == "error":
+			raise CommandError(text)
+
+		return text
+
+	def alive(self) -> bool:
+		return self.process.poll() is None
+
+	def close(self, timeout: float = 1) -> None:
+		# Closing stdin asks the worker to exit; it is killed if it doesn't.
+		try:
+			self.process.stdin.close()  # type: ignore[union-attr]
+			self.process.wait(timeout)
+		except (OSError, subprocess.TimeoutExpired):
+			self.process.kill()
+			self.process.wait()
+		finally:
+			self.process.stdout.close()  # type: ignore[union-attr]
+
+
+class WorkerPool:
+	"""
+	A pool of long-lived worker processes running the same command.
+
+	Each code snippet is sent to an idle worker as its length in bytes, in ASCII decimal,
+	followed by a newline and the UTF-8 encoded code.
+	The worker replies with ``ok`` or ``error``, a space, the length of the reply in bytes and a newline,
+	followed by either the reformatted code or an error message.
+	Workers exit when their standard input is closed.
+
+	Workers are started as needed, up to ``max_workers`` at once, and reused for later snippets.
+	If a worker exits unexpectedly it is replaced, and the snippet is tried again once.
+
+	:param argv: The command to run.
+	:param max_workers: The maximum number of snippets to format at once.
+	"""
+
+	#: The number of worker processes started so far.
+	started: int
+
+	def __init__(self, argv: Sequence[str], max_workers: int = 1):
+		if max_workers < 1:
+			raise ValueError("'max_workers' must be at least 1")
+
+		self.argv = tuple(argv)
+		self.max_workers = max_workers
+		self.started = 0
+
+		self._lock = threading.Lock()
+		self._reset()
+		_pools.add(self)
+
+	def _reset(self) -> None:
+		# Called on creation, and in a forked child, as the parent's workers belong to the parent.
+		self._pid = os.getpid()
+		self._idle: List[_Worker] = []
+		self._slots = threading.BoundedSemaphore(self.max_workers)
+
+	def __repr__(self) -> str:
+		return f"<{self.__class__.__name__}({list(self.argv)!r}, max_workers={self.max_workers})>"
+
+	def run(self, code: str) -> str:
+		"""
+		Format the given code with one of the workers.
+
+		:param code:
+
+		:raises CommandError: If the worker reports an error, or crashes twice.
+		"""
+
+		with self._lock:
+			if self._pid != os.getpid():
+				self._reset()
+
+		with self._slots:
+			for attempt in range(2):
+				worker = self._checkout()
+
+				try:
+					result = worker.request(code)
+				except _WorkerCrashed as e:
+					worker.close(timeout=0)
+					if attempt:
+						raise CommandError(f"{self.argv[0]} exited unexpectedly ({e})") from None
+					continue
+				except CommandError:
+					self._checkin(worker)
+					raise
+				except BaseException:
+					# The worker may be part way through a reply, so can't be reused.
+					worker.close(timeout=0)
+					raise
+
+				self._checkin(worker)
+				return result
+
+		raise AssertionError("unreachable")  # pragma: no cover
+
+	def _checkout(self) -> _Worker:
+		with self._lock:
+			while self._idle:
+				worker = self._idle.pop()
+				if worker.alive():
+					return worker
+				worker.close(timeout=0)
+
+			self.started += 1
+
+		try:
+			return _Worker(self.argv)
+		except OSError as e:
+			raise CommandError(f"Unable to run {self.argv[0]!r}: {e}") from None
+
+	def _checkin(self, worker: _Worker) -> None:
+		if worker.alive():
+			with self._lock:
+				self._idle.append(worker)
+		else:
+			worker.close(timeout=0)
+
+	def close(self) -> None:
+		"""
+		Stop the idle worker processes.
+		"""
+
+		with self._lock:
+			idle, self._idle = self._idle, []
+
+		if self._pid == os.getpid():
+			for worker in idle:
+				worker.close()
+
+
+_pools: "weakref.WeakSet[WorkerPool]" = weakref.WeakSet()
+
+
+@atexit.register
+def _close_pools() -> None:
+	for pool in list(_pools):
+		pool.close()
+
+
+class CommandFormatter:
+	"""
+	Formats code snippets with an external command.
+
+	By default the command is run once per snippet, with the code on its standard input.
+	It should write the reformatted code to standard output, or exit with a non-zero status if the code is invalid.
+
+	If ``persistent`` is :py:obj:`True` the command is instead started once and kept running,
+	with snippets sent to it using the protocol described in :class:`~.WorkerPool`.
+
+	:param command: The command to run, either as a list of arguments or a string to split with :func:`shlex.split`.
+	:param persistent: Whether the command is a long-lived worker.
+	:param max_workers: The maximum number of snippets to format at once.
+	:param pure: Whether the command's output depends only on the code, so the results can be cached.
+	"""
+
+	#: The command to run.
+	command: Tuple[str, ...]
+
+	#: The pool of worker processes, if the command is a long-lived worker.
+	pool: Optional[WorkerPool]
+
+	def __init__(
+			self,
+			command: Union[str, Sequence[str]],
+			persistent: bool = False,
+			max_workers: int = 1,
+			pure: bool = False,
+			):
+		if isinstance(command, str):
+			command = shlex.split(command)
+
+		if not command:
+			raise ValueError("The command must not be empty")
+		if max_workers < 1:
+			raise ValueError("'max_workers' must be at least 1")
+
+		self.command = tuple(command)
+		self.persistent = persistent
+		self.max_workers = max_workers
+		self.capabilities = FormatterCapabilities(pure=pure, thread_safe=True, process_safe=True)
+
+		if persistent:
+			self.pool = WorkerPool(self.command, max_workers)
+			self._slots = None
+		else:
+			self.pool = None
+			self._slots = threading.BoundedSemaphore(max_workers)
+
+	def __repr__(self) -> str:
+		# Also used by :meth:`snippet_fmt.cache.SnippetCache.config_hash`, so must include everything which affects the output.
+		return f"{self.__class__.__name__}({list(self.command)!r}, persistent={self.persistent})"
+
+	@classmethod
+	def from_config(cls, lang_config: Mapping[str, Any]) -> "CommandFormatter":
+		"""
+		Returns the formatter for a language with a :tconf:`command` in its configuration.
+
+		Formatters are reused for identical configurations, so their worker processes are shared between files.
+
+		:param lang_config: The language-specific configuration.
+		"""
+
+		command = lang_config["command"]
+		key = (
+				command if isinstance(command, str) else tuple(command),
+				bool(lang_config.get("persistent", False)),
+				int(lang_config.get("max-workers", 1)),
+				bool(lang_config.get("pure", False)),
+				)
+
+		with _instances_lock:
+			if key not in _instances:
+				_instances[key] = cls(*key)
+			return _instances[key]
+
+	def __call__(self, code: str, **config: Any) -> str:
+		r"""
+		Check the syntax of, and reformat, the given code.
+
+		:param code: The code to check and reformat.
+		:param \*\*config: The language-specific configuration.
+
+		:returns: The reformatted code if the ``reformat`` option is enabled, otherwise the original code.
+		"""
+
+		if self.pool is not None:
+			result = self.pool.run(code)
+		else:
+			assert self._slots is not None
+			with self._slots:
+				result = self._run_once(code)
+
+		if config.get("reformat", False):
+			return result
+		else:
+			return code
+
+	def _run_once(self, code: str) -> str:
+		try:
+			process = subprocess.run(self.command, input=code.encode("UTF-8"), capture_output=True)
+		except OSError as e:
+			raise CommandError(f"Unable to run {self.command[0]!r}: {e}") from None
+
+		if process.returncode:
+			message = process.stderr.decode("UTF-8", "replace").strip()
+			raise CommandError(message or f"{self.command[0]} exited with status {process.returncode}")
+
+		return process.stdout.decode("UTF-8")
+
+	def format_many(self, codes: Sequence[str], **config: Any) -> List[Union[str, Exception]]:
+		r"""
+		Check the syntax of, and reformat, the given code snippets, up to ``max_workers`` at once.
+
+		:param codes: The code snippets to check and reformat.
+		:param \*\*config: The language-specific configuration.
+
+		:returns: For each snippet, in order, either the reformatted code or the exception raised when formatting it.
+		"""
+
+		def format_one(code: str) -> Union[str, Exception]:
+			try:
+				return self(code, **config)
+			except Exception as e:
+				return e
+
+		if self.max_workers == 1 or len(codes) <= 1:
+			return [format_one(code) for code in codes]
+
+		with ThreadPoolExecutor(max_workers=min(self.max_workers, len(codes))) as executor:
+			return list(executor.map(format_one, codes))
+
+
+_instances: Dict[Tuple[Any, ...], CommandFormatter] = {}
+_instances_lock = threading.Lock()
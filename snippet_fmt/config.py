@@ -27,14 +27,25 @@ Read and parse ``snippet-fmt`` configuration.
 #
 
 # stdlib
-from typing import Any, Dict, List
+import hashlib
+import json
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Any, Dict, List, Mapping, Optional, Tuple
 
 # 3rd party
-import dom_toml
 from domdf_python_tools.typing import PathLike
 from typing_extensions import TypedDict
 
-__all__ = ("SnippetFmtConfigDict", "load_toml")
+if TYPE_CHECKING:
+	# this package
+	from snippet_fmt.budget import SnippetBudget
+	from snippet_fmt.formatters import Formatter
+	from snippet_fmt.scanner import DirectiveScanner
+
+__all__ = ("CompiledConfig", "SnippetFmtConfigDict", "load_toml")
+
+# The options returned by :meth:`CompiledConfig.get_formatter` for languages which aren't configured.
+_no_options: Mapping[str, Any] = MappingProxyType({})
 
 
 class SnippetFmtConfigDict(TypedDict):
@@ -80,6 +91,9 @@ def load_toml(filename: PathLike) -> SnippetFmtConfigDict:
 	:param filename:
 	"""
 
+	# 3rd party
+	import dom_toml
+
 	config = dom_toml.load(filename)
 
 	if "snippet-fmt" in config:
@@ -111,4 +125,162 @@ def load_toml(filename: PathLike) -> SnippetFmtConfigDict:
 				"JSON": {},
 				}
 
+	# Limits set at the top level apply to every language which doesn't set its own.
+	budget = {key: config[key] for key in ("max-size", "timeout") if key in config}
+	if budget:
+		snippet_fmt_config["languages"] = {
+				language: {**budget, **lang_config}
+				for language, lang_config in snippet_fmt_config["languages"].items()
+				}
+
 	return snippet_fmt_config
+
+
+class CompiledConfig:
+	"""
+	An immutable, preprocessed form of :class:`~.SnippetFmtConfigDict`.
+
+	The directive scanner and the formatter for each language are worked out once, up front.
+	Languages with a ``command`` option are formatted with a :class:`~snippet_fmt.command.CommandFormatter`.
+	Instances are hashable, and are pickled as just their configuration,
+	so they are cheap to send to worker processes.
+
+	:param config: The ``snippet_fmt`` configuration, parsed from a TOML file (or similar).
+	:param formatters: Mapping of language names (in lowercase) to formatters.
+		Defaults to those from :data:`~snippet_fmt.registry.formatter_registry`.
+
+	.. versionadded:: 0.4.0
+	"""
+
+	__slots__ = ("directives", "languages", "fingerprint", "scanner", "_formatters", "_table", "_budgets")
+
+	#: The directive types to reformat.
+	directives: Tuple[str, ...]
+
+	#: The languages to reformat, and their options, as read-only mappings.
+	languages: Mapping[str, Mapping[str, Any]]
+
+	#: A stable hash of the configuration, which can be used as a cache key.
+	fingerprint: str
+
+	#: The scanner for the configured directives.
+	scanner: "DirectiveScanner"
+
+	def __init__(self, config: SnippetFmtConfigDict, formatters: Optional[Mapping[str, "Formatter"]] = None):
+		# this package
+		from snippet_fmt.budget import BUDGET_KEYS, SnippetBudget
+		from snippet_fmt.command import CommandFormatter
+		from snippet_fmt.formatters import noformat
+		from snippet_fmt.registry import formatter_registry
+		from snippet_fmt.scanner import DirectiveScanner
+
+		languages = {language: dict(lang_config) for language, lang_config in config["languages"].items()}
+
+		fingerprint_data = {"directives": list(config["directives"]), "languages": languages}
+		fingerprint = json.dumps(fingerprint_data, sort_keys=True, default=str).encode("UTF-8")
+
+		if formatters is not None:
+			formatters = dict(formatters)
+			lookup = formatters
+		else:
+			lookup = formatter_registry.get_formatters()
+
+		table = {}
+		budgets = {}
+		for language, lang_config in languages.items():
+			# The budget is enforced by the reformatter, so isn't passed to the formatter.
+			budgets[language] = SnippetBudget.from_config(lang_config)
+			formatter_config = {key: value for key, value in lang_config.items() if key not in BUDGET_KEYS}
+
+			if "command" in lang_config:
+				formatter = CommandFormatter.from_config(lang_config)
+			else:
+				formatter = lookup.get(language.lower(), noformat)
+
+			table[language] = (formatter, MappingProxyType(formatter_config))
+
+		_set = object.__setattr__
+		_set(self, "directives", tuple(config["directives"]))
+		# Read-only views, so the configuration can't be changed once the formatters are worked out.
+		_set(self, "languages", MappingProxyType({key: MappingProxyType(value) for key, value in languages.items()}))
+		_set(self, "fingerprint", hashlib.sha256(fingerprint).hexdigest())
+		_set(self, "scanner", DirectiveScanner(self.directives))
+		_set(self, "_formatters", formatters)
+		_set(self, "_table", table)
+		_set(self, "_budgets", budgets)
+
+	@classmethod
+	def from_toml(cls, filename: PathLike) -> "CompiledConfig":
+		"""
+		Load and compile the ``snippet-fmt`` configuration from the given TOML file.
+
+		:param filename:
+		"""
+
+		return cls(load_toml(filename))
+
+	def get_formatter(self, lang: Optional[str]) -> Tuple["Formatter", Mapping[str, Any]]:
+		"""
+		Returns the formatter and its options for the given language.
+
+		Languages which aren't configured are given :func:`~.noformat` and no options.
+
+		:param lang: The language given in the directive, if any.
+		"""
+
+		try:
+			return self._table[lang]  # type: ignore[index]
+		except KeyError:
+			# this package
+			from snippet_fmt.formatters import noformat
+
+			return noformat, _no_options
+
+	def get_budget(self, lang: Optional[str]) -> "SnippetBudget":
+		"""
+		Returns the limits on code snippets in the given language.
+
+		Languages which aren't configured have no limits.
+
+		:param lang: The language given in the directive, if any.
+		"""
+
+		try:
+			return self._budgets[lang]  # type: ignore[index]
+		except KeyError:
+			# this package
+			from snippet_fmt.budget import SnippetBudget
+
+			return SnippetBudget()
+
+	def to_dict(self) -> SnippetFmtConfigDict:
+		"""
+		Returns the configuration as a new :class:`~.SnippetFmtConfigDict`.
+		"""
+
+		return {
+				"languages": {language: dict(lang_config) for language, lang_config in self.languages.items()},
+				"directives": list(self.directives),
+				}
+
+	def __setattr__(self, name: str, value: Any) -> None:
+		raise AttributeError(f"{self.__class__.__name__!r} object is immutable")
+
+	def __delattr__(self, name: str) -> None:
+		raise AttributeError(f"{self.__class__.__name__!r} object is immutable")
+
+	def __hash__(self) -> int:
+		return hash(self.fingerprint)
+
+	def __eq__(self, other: object) -> bool:
+		if isinstance(other, CompiledConfig):
+			return self.fingerprint == other.fingerprint and self._formatters == other._formatters
+		return NotImplemented
+
+	def __repr__(self) -> str:
+		return f"<{self.__class__.__name__} {self.fingerprint[:12]}: {list(self.languages)!r}>"
+
+	def __reduce__(self) -> Tuple[type, Tuple[SnippetFmtConfigDict, Optional[Dict[str, "Formatter"]]]]:
+		# The scanner and formatters are looked up again when unpickled.
+		return (self.__class__, (self.to_dict(), self._formatters))
+
@@ -29,26 +29,51 @@ Docstring processing for formatting.
 #
 
 # stdlib
-import difflib
+import ast
+import re
 import string
+import sys
 from collections import deque
-from typing import Container, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+from typing import TYPE_CHECKING, Container, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple, Union
 
-# 3rd party
-import tokenize_rt  # type: ignore[import-untyped]
-from consolekit import terminal_colours
-from domdf_python_tools.stringlist import StringList
+# this package
+from snippet_fmt.scanner import LineIndex
 
-__all__ = ["dedent", "diff", "get_parts", "get_tokens"]
+if TYPE_CHECKING:
+	# 3rd party
+	import tokenize_rt  # type: ignore[import-untyped]
+
+__all__ = ["DocstringToken", "dedent", "diff", "find_docstrings", "get_parts", "get_tokens"]
 
 
 class DocstringToken(NamedTuple):
+	"""
+	A docstring in a Python source file.
+
+	.. versionchanged:: 0.4.0  Added the ``offset`` and ``end`` attributes.
+	"""
+
+	#: Always ``'DOCSTRING'``.
 	name: str
+
+	#: The string literal, including any prefix characters and the quotes.
 	src: str
+
+	#: The line number of the start of the docstring.
 	line: Optional[int] = None
+
+	#: The column, in UTF-8 bytes, of the start of the docstring.
 	utf8_byte_offset: Optional[int] = None
+
+	#: The name of the function or class the docstring belongs to, or :py:obj:`None` for module docstrings.
 	function_name: Optional[str] = None
 
+	#: The character offset of the start of the docstring in the source.
+	offset: Optional[int] = None
+
+	#: The character offset of the end of the docstring in the source.
+	end: Optional[int] = None
+
 	# @property
 	# def offset(self) -> tokenize_rt.Offset:
 	# 	return tokenize_rt.Offset(self.line, self.utf8_byte_offset)
@@ -133,27 +158,139 @@ def get_parts(docstring: str) -> Tuple[str, str, str, str]:
 	return prefix_char, quote_char, indent, docstring
 
 
-def get_tokens(source: str) -> List[tokenize_rt.Token]:
+# Matches a single string literal, which is known to be valid as the file has been parsed.
+_string_literal = re.compile(
+		r"""[A-Za-z]{0,2}(?:"""
+		r'"""(?:[^"\\]+|\\.|"(?!""))*"""|'
+		r"'''(?:[^'\\]+|\\.|'(?!''))*'''|"
+		r'"(?:[^"\\\n]+|\\.)*"|'
+		r"'(?:[^'\\\n]+|\\.)*'"
+		r")",
+		re.DOTALL,
+		)
+
+
+def _iter_docstring_nodes(tree: ast.Module) -> Iterator[Tuple[Optional[str], ast.expr]]:
+	# Yields the name of the function or class (or :py:obj:`None` for the module) and the docstring node.
+
+	for node in ast.walk(tree):
+		if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+			name: Optional[str] = node.name
+		elif isinstance(node, ast.Module):
+			name = None
+		else:
+			continue
+
+		if not node.body or not isinstance(node.body[0], ast.Expr):
+			continue
+
+		value = node.body[0].value
+		if isinstance(value, ast.Constant) and isinstance(value.value, str):
+			yield name, value
+		elif sys.version_info < (3, 8) and isinstance(value, ast.Str):  # pragma: no cover (py38+)
+			yield name, value
+
+
+def _multiline_string_starts(source: str) -> Dict[int, Tuple[int, int]]:  # pragma: no cover (py38+)
+	# On Python 3.7 the position of a multi-line string in the AST is (last line, -1).
+	# Returns a mapping of the last line of each string to the line and (character) column of its start.
+
+	# stdlib
+	import io
+	import tokenize
+
+	starts: Dict[int, Tuple[int, int]] = {}
+
+	for token in tokenize.generate_tokens(io.StringIO(source).readline):
+		if token.type == tokenize.STRING:
+			starts.setdefault(token.end[0], token.start)
+
+	return starts
+
+
+def find_docstrings(source: str) -> List[DocstringToken]:
+	"""
+	Locate the module, class and function docstrings in the given Python source, in the order they appear.
+
+	Only the first string literal is included for docstrings made up of several implicitly concatenated literals.
+
+	:param source:
+
+	:raises SyntaxError: If the source isn't valid Python.
+
+	.. versionadded:: 0.4.0
+	"""
+
+	tree = ast.parse(source)
+	lines = LineIndex(source)
+
+	multiline_starts: Optional[Dict[int, Tuple[int, int]]] = None
+	docstrings = []
+
+	for function_name, node in _iter_docstring_nodes(tree):
+		line, col = node.lineno, node.col_offset
+
+		if col < 0:  # pragma: no cover (py38+)
+			if multiline_starts is None:
+				multiline_starts = _multiline_string_starts(source)
+			line, char_col = multiline_starts[line]
+			utf8_col = len(lines.line(line)[:char_col].encode("UTF-8"))
+		else:
+			# The AST gives the column in UTF-8 bytes.
+			line_text = lines.line(line)
+			if line_text.isascii():
+				char_col = col
+			else:
+				char_col = len(line_text.encode("UTF-8")[:col].decode("UTF-8"))
+			utf8_col = col
+
+		offset = lines.offset(line) + char_col
+		match = _string_literal.match(source, offset)
+		assert match is not None, (line, char_col)
+
+		docstrings.append(
+				DocstringToken(
+						name="DOCSTRING",
+						src=match.group(),
+						line=line,
+						utf8_byte_offset=utf8_col,
+						function_name=function_name,
+						offset=offset,
+						end=match.end(),
+						)
+				)
+
+	docstrings.sort(key=lambda token: token.offset)  # type: ignore[arg-type,return-value]
+	return docstrings
+
+
+def get_tokens(source: str) -> List["tokenize_rt.Token"]:
 	"""
 	Tokenize the given Python source, including special ``"DOCSTRING"`` tokens for function and class docstrings.
 
 	:param source:
+
+	.. versionchanged:: 0.4.0
+
+		No longer used by ``snippet_fmt``, which locates docstrings with :func:`~.find_docstrings` instead.
+		Module docstrings are not included.
 	"""
 
-	# TODO: module docstrings
+	# 3rd party
+	import tokenize_rt  # type: ignore[import-untyped]
 
 	original_tokens = deque(tokenize_rt.src_to_tokens(source))
 
-	tokens: List[tokenize_rt.Token] = []
+	tokens: List["tokenize_rt.Token"] = []
 
-	def _readahead_in(next_token: tokenize_rt.Token, names: Container[str]) -> tokenize_rt.Token:
+	def _readahead_in(next_token: "tokenize_rt.Token", names: Container[str]) -> "tokenize_rt.Token":
 		while next_token.name in names:
 			tokens.append(next_token)
 			next_token = original_tokens.popleft()
 
 		return next_token
 
-	def _readahead_not_in(next_token: tokenize_rt.Token, names: Container[str]) -> tokenize_rt.Token:
+	def _readahead_not_in(next_token: "tokenize_rt.Token", names: Container[str]) -> "tokenize_rt.Token":
 		while next_token.name not in names:
 			tokens.append(next_token)
 			next_token = original_tokens.popleft()
@@ -200,45 +337,8 @@ def get_tokens(source: str) -> List[tokenize_rt.Token]:
 	return tokens
 
 
-def _unified_diff(a: Sequence[str], b: Sequence[str], filename: str, offset: int) -> Iterator[str]:
-
-	difflib._check_types(a, b, filename)  # type: ignore[attr-defined]
-
-	started = False
-	for group in difflib.SequenceMatcher(None, a, b).get_grouped_opcodes(3):
-		if not started:
-			started = True
-			yield f"--- {filename}\t(original)"
-			yield f"+++ {filename}\t(reformatted)"
-
-		first, last = group[0], group[-1]
-		file1_range = difflib._format_range_unified(  # type: ignore[attr-defined]
-			first[1] + offset,
-			last[2] + offset,
-		)
-		file2_range = difflib._format_range_unified(  # type: ignore[attr-defined]
-			first[3] + offset,
-			last[4] + offset,
-		)
-		yield f'@@ -{file1_range} +{file2_range} @@'
-
-		for tag, i1, i2, j1, j2 in group:
-			if tag == "equal":
-				for line in a[i1:i2]:
-					yield ' ' + line
-				continue
-
-			if tag in {"replace", "delete"}:
-				for line in a[i1:i2]:
-					yield '-' + line
-
-			if tag in {"replace", "insert"}:
-				for line in b[j1:j2]:
-					yield '+' + line
-
-
 def diff(
-		token: tokenize_rt.Token,
+		token: Union["tokenize_rt.Token", DocstringToken],
 		reformatted: Sequence[str],
 		filename: str,
 		) -> str:
@@ -250,17 +350,7 @@ def diff(
 	:param filename:
 	"""
 
-	buf = StringList()
-	diff = _unified_diff(token.src.split('\n'), reformatted, filename, token.line - 1)
-
-	for line in diff:
-		if line.startswith('+'):
-			buf.append(terminal_colours.Fore.GREEN(line))
-		elif line.startswith('-'):
-			buf.append(terminal_colours.Fore.RED(line))
-		else:
-			buf.append(line)
-
-	buf.blankline(ensure_single=True)
+	# this package
+	from snippet_fmt._diff import colour_diff, unified_diff
 
-	return str(buf)
+	return colour_diff(unified_diff(token.src.split('\n'), reformatted, filename, token.line - 1))
@@ -28,31 +28,55 @@ Formatters and syntax checkers.
 
 # stdlib
 import ast
+import functools
 import json
 import os
 from configparser import ConfigParser
 from io import StringIO
-from typing import Any, List, NamedTuple, Optional
+from typing import (
+		TYPE_CHECKING,
+		Any,
+		Callable,
+		Dict,
+		List,
+		Mapping,
+		NamedTuple,
+		Optional,
+		Sequence,
+		Tuple,
+		TypeVar,
+		Union
+		)
 
 # 3rd party
-import dom_toml
-from domdf_python_tools.stringlist import StringList
-import formate
-from domdf_python_tools.paths import PathPlus
+from domdf_python_tools.typing import PathLike
 
 __all__ = (
+		"COST_CLASSES",
+		"BatchFormatter",
+		"FormateConfigCache",
 		"Formatter",
+		"FormatterCapabilities",
+		"PythonSnippetPipeline",
+		"declare_capabilities",
+		"formate_config_cache",
 		"format_toml",
 		"format_ini",
 		"format_json",
+		"format_many",
 		"format_python",
+		"get_capabilities",
 		"noformat",
+		"supports_batching",
 		)
 
 # 3rd party
-from formate.config import get_hooks_for_filetype, parse_hooks
 from typing_extensions import Protocol
 
+if TYPE_CHECKING:
+	# 3rd party
+	import formate
+
 
 class Formatter(Protocol):
 	"""
@@ -62,6 +86,167 @@ class Formatter(Protocol):
 	def __call__(self, code: str, **config: Any) -> str: ...  # noqa: D102
 
 
+class BatchFormatter(Formatter, Protocol):
+	"""
+	:class:`typing.Protocol` for formatters which can also format many snippets in a single call.
+
+	:meth:`~.format_many` is given every snippet for the language in a file,
+	allowing expensive setup (such as starting a subprocess) to be shared between them.
+
+	.. versionadded:: 0.4.0
+	"""
+
+	def format_many(self, codes: Sequence[str], **config: Any) -> List[Union[str, Exception]]:
+		r"""
+		Format the given code snippets.
+
+		:param codes: The code snippets to check and reformat.
+		:param \*\*config: The language-specific configuration.
+
+		:returns: For each snippet, in order, either the reformatted code or the exception raised when formatting it.
+		"""
+
+
+def supports_batching(formatter: Formatter) -> bool:
+	"""
+	Returns whether the given formatter implements :class:`~.BatchFormatter`.
+
+	:param formatter:
+
+	.. versionadded:: 0.4.0
+	"""
+
+	return callable(getattr(formatter, "format_many", None))
+
+
+def format_many(formatter: Formatter, codes: Sequence[str], **config: Any) -> List[Union[str, Exception]]:
+	r"""
+	Format several code snippets with the given formatter.
+
+	If the formatter implements :class:`~.BatchFormatter` the snippets are formatted in a single call,
+	otherwise the formatter is called for each one in turn.
+
+	:param formatter:
+	:param codes: The code snippets to check and reformat.
+	:param \*\*config: The language-specific configuration.
+
+	:returns: For each snippet, in order, either the reformatted code or the exception raised when formatting it.
+		If a batch as a whole fails, the exception is returned for every snippet.
+
+	.. versionadded:: 0.4.0
+	"""
+
+	results: List[Union[str, Exception]]
+
+	if not supports_batching(formatter):
+		results = []
+
+		for code in codes:
+			try:
+				results.append(formatter(code, **config))
+			except Exception as e:
+				results.append(e)
+
+		return results
+
+	try:
+		results = list(formatter.format_many(codes, **config))  # type: ignore[attr-defined]
+		if len(results) != len(codes):
+			raise ValueError(f"Expected {len(codes)} results from 'format_many', got {len(results)}")
+	except Exception as e:
+		return [e] * len(codes)
+
+	return results
+
+
+#: The values for :attr:`FormatterCapabilities.cost`, from least to most expensive.
+COST_CLASSES = ("cheap", "moderate", "expensive")
+
+
+class FormatterCapabilities(NamedTuple):
+	"""
+	Properties of a formatter which determine whether its results can be cached, and how it can be run.
+
+	Formatters declare their capabilities with :func:`~.declare_capabilities`.
+	The defaults are conservative, and apply to formatters which don't declare anything.
+
+	.. versionadded:: 0.4.0
+	"""
+
+	#: Whether the output depends only on the code and the configuration, so the results can be cached.
+	pure: bool = False
+
+	#: Whether the formatter can be called from several threads at once.
+	thread_safe: bool = False
+
+	#: Whether the formatter can be used in worker processes.
+	process_safe: bool = False
+
+	#: A rough indication of the time taken to format a snippet. One of :data:`~.COST_CLASSES`.
+	cost: str = "expensive"
+
+
+_F = TypeVar("_F", bound=Callable)
+
+
+def declare_capabilities(
+		*,
+		pure: bool = False,
+		thread_safe: bool = False,
+		process_safe: bool = False,
+		cost: str = "expensive",
+		) -> Callable[[_F], _F]:
+	"""
+	Decorator to declare the :class:`~.FormatterCapabilities` of a formatter.
+
+	The capabilities are stored in the formatter's ``capabilities`` attribute.
+	Formatters which don't depend on ``snippet-fmt`` can set that attribute to a dictionary instead.
+
+	:param pure: Whether the output depends only on the code and the configuration.
+	:param thread_safe: Whether the formatter can be called from several threads at once.
+	:param process_safe: Whether the formatter can be used in worker processes.
+	:param cost: A rough indication of the time taken to format a snippet. One of :data:`~.COST_CLASSES`.
+
+	.. versionadded:: 0.4.0
+	"""
+
+	if cost not in COST_CLASSES:
+		raise ValueError(f"Unknown cost class {cost!r}")
+
+	capabilities = FormatterCapabilities(pure, thread_safe, process_safe, cost)
+
+	def deco(formatter: _F) -> _F:
+		formatter.capabilities = capabilities  # type: ignore[attr-defined]
+		return formatter
+
+	return deco
+
+
+def get_capabilities(formatter: Formatter) -> FormatterCapabilities:
+	"""
+	Returns the :class:`~.FormatterCapabilities` declared by the given formatter.
+
+	Formatters which don't declare anything, or whose declaration can't be understood, get the defaults.
+
+	:param formatter:
+
+	.. versionadded:: 0.4.0
+	"""
+
+	capabilities = getattr(formatter, "capabilities", None)
+
+	if isinstance(capabilities, FormatterCapabilities):
+		return capabilities
+
+	if isinstance(capabilities, Mapping):
+		declared = {field: capabilities[field] for field in FormatterCapabilities._fields if field in capabilities}
+		if declared.get("cost", "expensive") in COST_CLASSES:
+			return FormatterCapabilities(**declared)
+
+	return FormatterCapabilities()
+
+
+@declare_capabilities(pure=True, thread_safe=True, process_safe=True, cost="cheap")
 def noformat(code: str, **config) -> str:
 	r"""
 	A no-op formatter.
@@ -75,44 +260,202 @@ def noformat(code: str, **config) -> str:
 	return code
 
 
-class StringReformatter(formate.Reformatter):
+class FormateConfigCache:
+	"""
+	Caches parsed ``formate`` configuration files, so each file is only read once per process.
 
-	def __init__(self, code: str, config: formate.FormateConfigDict, sort_imports: bool = True):
-		self.file_to_format = PathPlus(os.devnull)  # in case someone tries to write to the file
-		self.filename = "snippet.py"
-		self.filetype = ".py"
-		self.config = config
-		self._unformatted_source = code
-		self._reformatted_source: Optional[str] = None
-		self.sort_imports = sort_imports
+	Entries are keyed by the file's resolved path, and are reloaded if the file's modification time or size changes.
+
+	.. versionadded:: 0.4.0
+	"""
+
+	#: The number of times a configuration was returned from the cache.
+	hits: int
 
-	def to_file(self) -> None:  # pragma: no cover
+	#: The number of times a configuration file had to be parsed.
+	misses: int
+
+	def __init__(self):
+		self._configs: Dict[str, Tuple[Tuple[int, int], "formate.FormateConfigDict"]] = {}
+		self._pipelines: Dict[str, Tuple["formate.FormateConfigDict", "PythonSnippetPipeline"]] = {}
+		self.hits = 0
+		self.misses = 0
+
+	def load(self, filename: PathLike) -> "formate.FormateConfigDict":
 		"""
-		Write the reformatted source to the original file.
+		Returns the parsed ``formate`` configuration from the given file.
+
+		The returned dictionary is shared between callers and must not be modified.
+
+		:param filename:
 		"""
 
-		raise NotImplementedError(f"Unsupported by {self.__class__!r}")
+		path = os.path.realpath(filename)
+		st = os.stat(path)
+		stamp = (st.st_mtime_ns, st.st_size)
 
-	def run(self) -> bool:
+		cached = self._configs.get(path)
+		if cached is not None and cached[0] == stamp:
+			self.hits += 1
+			return cached[1]
+
+		# 3rd party
+		import formate.config
+
+		self.misses += 1
+		formate_config = formate.config.load_toml(path)
+		self._configs[path] = (stamp, formate_config)
+		return formate_config
+
+	def pipeline(self, filename: PathLike) -> "PythonSnippetPipeline":
+		"""
+		Returns the :class:`~.PythonSnippetPipeline` for the ``formate`` configuration in the given file.
+
+		The pipeline is only rebuilt when the configuration is reloaded.
+
+		:param filename:
 		"""
-		Run the reformatter.
 
-		:return: Whether the file was changed.
+		formate_config = self.load(filename)
+		path = os.path.realpath(filename)
+
+		cached = self._pipelines.get(path)
+		if cached is not None and cached[0] is formate_config:
+			return cached[1]
+
+		pipeline = PythonSnippetPipeline(formate_config)
+		self._pipelines[path] = (formate_config, pipeline)
+		return pipeline
+
+	def clear(self) -> None:
+		"""
+		Remove all configurations from the cache and reset the counters.
 		"""
 
-		hooks = parse_hooks(self.config)
-		hooks = get_hooks_for_filetype(self.filetype, hooks)
+		self._configs.clear()
+		self._pipelines.clear()
+		self.hits = 0
+		self.misses = 0
+
+
+#: The :class:`~.FormateConfigCache` used by :func:`~.format_python`.
+formate_config_cache = FormateConfigCache()
+
+
+class PythonSnippetPipeline:
+	"""
+	The ``formate`` hooks for Python code, resolved once for a given configuration
+	and then applied to any number of snippets.
+
+	:param config: The parsed ``formate`` configuration.
+
+	.. versionadded:: 0.4.0
+	"""
+
+	#: The filename passed to hooks which ask for one.
+	filename: str = "snippet.py"
+
+	#: The first line prepended to the snippet, depending on whether imports should be sorted.
+	#: ``isort`` skips the whole snippet if it begins with ``# isort: skip_file``.
+	header = {True: '#', False: "# isort: skip_file"}
 
-		isort_comment = '#' if self.sort_imports else "# isort: skip_file"
+	def __init__(self, config: "formate.FormateConfigDict"):
+		# 3rd party
+		from formate.config import get_hooks_for_filetype, parse_hooks
 
-		unformatted_source = f"{isort_comment}\n" + self._unformatted_source
-		reformatted_source = StringList(formate.call_hooks(hooks, unformatted_source, self.filename))
+		self.config = config
+
+		hooks = get_hooks_for_filetype(".py", parse_hooks(config))
+		self.hooks: Tuple[Callable[[str], str], ...] = tuple(map(self._bind_hook, hooks))
+
+	def __repr__(self) -> str:
+		return f"<{self.__class__.__name__}: {len(self.hooks)} hooks>"
+
+	def _bind_hook(self, hook: "formate.Hook") -> Callable[[str], str]:
+		# Equivalent to ``Hook.__call__``, but with the arguments worked out up front.
+		hook_func = hook.entry_point.obj  # type: ignore[union-attr]
+		kwargs = hook.kwargs.copy()
+
+		if getattr(hook_func, "wants_global_config", False):
+			kwargs["formate_global_config"] = hook.global_config
+		if getattr(hook_func, "wants_filename", False):
+			kwargs["formate_filename"] = self.filename
+
+		return functools.partial(hook_func, *hook.args, **kwargs)
+
+	def __call__(self, code: str, sort_imports: bool = True) -> str:
+		"""
+		Reformat the given Python code.
+
+		:param code:
+		:param sort_imports: Whether imports should be sorted with ``isort`` (if the hook is enabled).
+
+		:returns: The reformatted code.
+		"""
+
+		# 3rd party
+		from domdf_python_tools.stringlist import StringList
+
+		header = self.header[sort_imports]
+
+		source = f"{header}\n{code}"
+		for hook in self.hooks:
+			source = hook(source)
+
+		reformatted_source = StringList(source)
 		reformatted_source.blankline(ensure_single=True)
-		assert reformatted_source.pop(0) == isort_comment
+		assert reformatted_source.pop(0) == header
+
+		return str(reformatted_source)
+
+
+@functools.lru_cache(maxsize=None)
+def _string_reformatter() -> type:
+	# ``StringReformatter`` subclasses ``formate.Reformatter``, so is only created when it is first used.
+
+	# 3rd party
+	import formate
+	from domdf_python_tools.paths import PathPlus
 
-		self._reformatted_source = str(reformatted_source)
+	class StringReformatter(formate.Reformatter):
 
-		return self._reformatted_source != self._unformatted_source
+		def __init__(self, code: str, config: formate.FormateConfigDict, sort_imports: bool = True):
+			self.file_to_format = PathPlus(os.devnull)  # in case someone tries to write to the file
+			self.filename = "snippet.py"
+			self.filetype = ".py"
+			self.config = config
+			self._unformatted_source = code
+			self._reformatted_source: Optional[str] = None
+			self.sort_imports = sort_imports
+
+		def to_file(self) -> None:  # pragma: no cover
+			"""
+			Write the reformatted source to the original file.
+			"""
+
+			raise NotImplementedError(f"Unsupported by {self.__class__!r}")
+
+		def run(self) -> bool:
+			"""
+			Run the reformatter.
+
+			:return: Whether the file was changed.
+			"""
+
+			pipeline = PythonSnippetPipeline(self.config)
+			self._reformatted_source = pipeline(self._unformatted_source, self.sort_imports)
+
+			return self._reformatted_source != self._unformatted_source
+
+	StringReformatter.__module__ = __name__
+	return StringReformatter
+
+
+def __getattr__(name: str) -> Any:
+	if name == "StringReformatter":
+		return _string_reformatter()
+
+	raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 class _ConsoleBlock(NamedTuple):
@@ -154,18 +497,89 @@ def _format_pycon(code_lines: List[str], **config) -> str:
 			else:
 				blocks[-1].lines.append(line)
 
+	pipeline = _get_pipeline(config)
+	code_blocks = [block.as_python() for block in blocks if block.is_code]
+	reformatted_code: Optional[List[str]]
+
+	if pipeline is None:
+		for code in code_blocks:
+			ast.parse(code)
+		reformatted_code = code_blocks
+	else:
+		reformatted_code = _format_console_code(pipeline, code_blocks)
+		if reformatted_code is None:
+			# Reformat the code from each prompt on its own instead, which also gives the correct error.
+			reformatted_code = [pipeline(code, sort_imports=False) for code in code_blocks]
+
+	reformatted_iter = iter(reformatted_code)
+
 	reformatted_blocks: List[_ConsoleBlock] = []
 	for block in blocks:
 		if block.is_code:
-			config = {**config, "sort_imports": False}
-			reformatted_code = format_python(block.as_python(), **config)
-			reformatted_blocks.append(_ConsoleBlock(True, reformatted_code.splitlines()))
+			reformatted_blocks.append(_ConsoleBlock(True, next(reformatted_iter).splitlines()))
 		else:
 			reformatted_blocks.append(block)
 
 	return '\n'.join(block.as_pycon() for block in reformatted_blocks)
 
 
+_CONSOLE_MARKER = "# snippet-fmt: prompt "
+
+
+def _format_console_code(pipeline: PythonSnippetPipeline, code_blocks: List[str]) -> Optional[List[str]]:
+	# Reformat the code from every prompt of a console session together,
+	# with a comment marking where each prompt starts.
+	# Returns ``None`` if the code can't safely be reformatted in one go.
+
+	if len(code_blocks) < 2:
+		return None
+
+	for code in code_blocks:
+		if _CONSOLE_MARKER in code:
+			return None
+
+		try:
+			# Each prompt must be valid on its own, not just once joined together.
+			ast.parse(code)
+		except SyntaxError:
+			return None
+
+	source = '\n'.join(f"{_CONSOLE_MARKER}{idx}\n{code}" for idx, code in enumerate(code_blocks))
+
+	try:
+		lines = pipeline(source, sort_imports=False).splitlines()
+	except Exception:  # pylint: disable=broad-except
+		return None
+
+	chunks: List[List[str]] = []
+
+	for line in lines:
+		if line == f"{_CONSOLE_MARKER}{len(chunks)}":
+			chunks.append([])
+		elif chunks:
+			chunks[-1].append(line)
+		elif line:
+			# The hooks moved code before the first marker.
+			return None
+
+	if len(chunks) != len(code_blocks):
+		return None
+
+	reformatted = []
+
+	for chunk in chunks:
+		# The blank lines between prompts depend on the surrounding code, so aren't part of either.
+		while chunk and not chunk[0]:
+			chunk.pop(0)
+		while chunk and not chunk[-1]:
+			chunk.pop()
+
+		reformatted.append(''.join(f"{line}\n" for line in chunk))
+
+	return reformatted
+
+
+@declare_capabilities(pure=True, process_safe=True, cost="expensive")
 def format_python(code: str, **config) -> str:
 	r"""
 	Check the syntax of, and reformat, the given Python code.
@@ -180,18 +594,26 @@ def format_python(code: str, **config) -> str:
 	is_console = any(line.startswith(">>> ") for line in code_lines)
 
 	if is_console and not config.get("__internal_no_console", False):
-		return _format_pycon(code_lines, __internal_no_console=True, **config)
+		return _format_pycon(code_lines, **config)
 
-	if config.get("reformat", False):
-		formate_config = formate.config.load_toml(config.get("config-file", "formate.toml"))
-		r = StringReformatter(code, formate_config, config.get("sort_imports", True))
-		r.run()
-		return r.to_string()
-	else:
+	pipeline = _get_pipeline(config)
+
+	if pipeline is None:
 		ast.parse(code)
 		return code
+	else:
+		return pipeline(code, config.get("sort_imports", True))
 
 
+def _get_pipeline(config: Dict[str, Any]) -> Optional[PythonSnippetPipeline]:
+	# Returns ``None`` if the code should only be syntax checked.
+	if config.get("reformat", False):
+		return formate_config_cache.pipeline(config.get("config-file", "formate.toml"))
+	else:
+		return None
+
+
+@declare_capabilities(pure=True, thread_safe=True, process_safe=True, cost="cheap")
 def format_toml(code: str, **config) -> str:
 	r"""
 	Check the syntax of, and reformat, the given TOML configuration.
@@ -202,6 +624,9 @@ def format_toml(code: str, **config) -> str:
 	:returns: The original code unchanged.
 	"""
 
+	# 3rd party
+	import dom_toml
+
 	toml_content = dom_toml.loads(code)
 
 	if config.get("reformat", False):
@@ -210,6 +635,7 @@ def format_toml(code: str, **config) -> str:
 		return code
 
 
+@declare_capabilities(pure=True, thread_safe=True, process_safe=True, cost="cheap")
 def format_ini(code: str, **config) -> str:
 	r"""
 	Check the syntax of, and reformat, the given INI configuration.
@@ -233,6 +659,7 @@ def format_ini(code: str, **config) -> str:
 		return code
 
 
+@declare_capabilities(pure=True, thread_safe=True, process_safe=True, cost="cheap")
 def format_json(code: str, **config) -> str:
 	r"""
 	Check the syntax of, and reformat, the given JSON source.
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+#
+#  index.py
+"""
+List the code blocks in files and docstrings, without reformatting them.
+
+.. versionadded:: 0.4.0
+"""
+#
+#  Copyright © 2026 Dominic Davis-Foster <dominic@davis-foster.co.uk>
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+#  EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+#  MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+#  IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+#  DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+#  OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE
+#  OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+# stdlib
+from typing import Iterator, Optional, Union
+
+# 3rd party
+from domdf_python_tools.paths import PathPlus
+from domdf_python_tools.typing import PathLike
+
+# this package
+from snippet_fmt.config import CompiledConfig, SnippetFmtConfigDict
+from snippet_fmt.scanner import LineIndex
+from snippet_fmt.session import FormattingSession
+
+__all__ = ("Snippet", "iter_snippets", "iter_source_snippets")
+
+
+class Snippet:
+	"""
+	A code block found by :func:`~.iter_snippets`.
+
+	:param language: The language of the code block, if given.
+	:param directive: The name of the directive, e.g. ``'code-block'``.
+	:param line: The (1-based) line number of the directive.
+	:param size: The length of the code, in characters, including any trailing blank lines.
+	:param function_name: The name of the function or class whose docstring contains the code block.
+	:param start: The character offset of the start of the directive line.
+	:param end: The character offset of the end of the code block.
+	"""
+
+	__slots__ = ("language", "directive", "line", "size", "function_name", "start", "end")
+
+	#: The language of the code block, if given.
+	language: Optional[str]
+
+	#: The name of the directive, e.g. ``'code-block'``.
+	directive: str
+
+	#: The (1-based) line number of the directive.
+	line: int
+
+	#: The length of the code, in characters, including any trailing blank lines.
+	#: For docstrings, the indentation of the docstring itself isn't included.
+	size: int
+
+	#: The name of the function or class whose docstring contains the code block.
+	#: :py:obj:`None` for reStructuredText files and module docstrings.
+	function_name: Optional[str]
+
+	#: The character offset of the start of the directive line, in the file.
+	start: int
+
+	#: The character offset of the end of the code block, including any trailing blank lines, in the file.
+	end: int
+
+	def __init__(
+			self,
+			language: Optional[str],
+			directive: str,
+			line: int,
+			size: int,
+			function_name: Optional[str],
+			start: int,
+			end: int,
+			):
+		self.language = language
+		self.directive = directive
+		self.line = line
+		self.size = size
+		self.function_name = function_name
+		self.start = start
+		self.end = end
+
+	def __repr__(self) -> str:
+		attributes = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+		return f"{self.__class__.__name__}({attributes})"
+
+	def __eq__(self, other: object) -> bool:
+		if isinstance(other, Snippet):
+			return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+		return NotImplemented
+
+
+def iter_snippets(
+		filename: PathLike,
+		config: Union[SnippetFmtConfigDict, CompiledConfig],
+		session: Optional[FormattingSession] = None,
+		) -> Iterator[Snippet]:
+	"""
+	Returns an iterator over the code blocks in a reStructuredText or Python file, in order.
+
+	The code blocks are found in the same way as when reformatting,
+	but none of the formatters are called.
+	Code blocks in all languages are included, not just the configured ones.
+
+	:param filename: The file to index.
+	:param config: The ``snippet_fmt`` configuration, parsed from a TOML file (or similar), or already compiled.
+	:param session: State shared with other files indexed with the same configuration.
+
+	:raises SyntaxError: If the file is a Python file which can't be parsed.
+
+	.. seealso:: :func:`~.iter_source_snippets`, for reStructuredText which isn't in a file.
+	"""
+
+	if session is None:
+		session = FormattingSession(config)
+
+	path = PathPlus(filename)
+
+	# Files which can't contain any code blocks aren't decoded.
+	if not session.scanner.file_has_markers(path):
+		return
+
+	source = path.read_text()
+
+	if path.suffix == ".py":
+		yield from _iter_docstring_snippets(source, path.as_posix(), session)
+	else:
+		yield from _iter_rst_snippets(source, session)
+
+
+def iter_source_snippets(
+		source: str,
+		config: Union[SnippetFmtConfigDict, CompiledConfig],
+		session: Optional[FormattingSession] = None,
+		) -> Iterator[Snippet]:
+	"""
+	Returns an iterator over the code blocks in the given reStructuredText source, in order.
+
+	The code blocks are found in the same way as by :func:`~.iter_snippets`.
+
+	:param source: The reStructuredText source.
+	:param config: The ``snippet_fmt`` configuration, parsed from a TOML file (or similar), or already compiled.
+	:param session: State shared with other files indexed with the same configuration.
+	"""
+
+	if session is None:
+		session = FormattingSession(config)
+
+	return _iter_rst_snippets(source, session)
+
+
+def _iter_rst_snippets(source: str, session: FormattingSession) -> Iterator[Snippet]:
+	# Yields the code blocks in the given reStructuredText source.
+
+	# this package
+	from snippet_fmt import _normalise_whitespace
+
+	content = _normalise_whitespace(source)
+
+	# Line numbers are counted as we go, rather than indexing the whole document.
+	line = 1
+	pos = 0
+
+	# Unless whitespace was stripped from the ends of lines, the offsets are the same in the file.
+	# Blank lines at the end of the file may have been removed, or a newline added.
+	file_index = None
+	if content is not source and not source.startswith(content[:-1]):
+		file_index = LineIndex(source)
+
+	for block in session.scanner.iter_blocks(content):
+		line += content.count('\n', pos, block.start)
+		pos = block.start
+
+		if file_index is None:
+			start, end = block.start, min(block.end, len(source))
+		else:
+			start = file_index.offset(line)
+			end = file_index.offset(line + content.count('\n', block.start, block.end))
+
+		yield Snippet(block.lang, block.directive, line, block.end - block.code_start, None, start, end)
+
+
+def _iter_docstring_snippets(source: str, filename: str, session: FormattingSession) -> Iterator[Snippet]:
+	# Yields the code blocks in the docstrings in the given Python source,
+	# found in the same way as :class:`~snippet_fmt.PyReformatter` finds them.
+
+	# this package
+	from snippet_fmt import DocstringReformatter
+	from snippet_fmt.docstring import find_docstrings
+
+	file_index = LineIndex(source)
+	config = session.compiled.to_dict()
+
+	for token in find_docstrings(source):
+		if '\n' not in token.src:
+			continue
+
+		r = DocstringReformatter(token, filename, config, session)
+		content = r.get_normalised_source()
+		docstring_index = LineIndex(content)
+
+		for block in session.scanner.iter_blocks(content):
+			line = docstring_index.lineno(block.start) + token.line - 1
+			end_line = docstring_index.lineno(block.end) + token.line - 1
+
+			yield Snippet(
+					block.lang,
+					block.directive,
+					line,
+					block.end - block.code_start,
+					token.function_name,
+					file_index.offset(line),
+					min(file_index.offset(end_line), token.end),
+					)
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+#
+#  profiling.py
+"""
+Record how long each step of reformatting takes, and export the timings as a report or a timeline.
+
+.. versionadded:: 0.4.0
+"""
+#
+#  Copyright © 2026 Dominic Davis-Foster <dominic@davis-foster.co.uk>
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+#  EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+#  MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+#  IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+#  DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+#  OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE
+#  OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+# stdlib
+import contextlib
+import json
+import math
+import os
+import threading
+import time
+from typing import Any, Callable, ContextManager, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence
+
+# 3rd party
+from domdf_python_tools.typing import PathLike
+
+__all__ = ("Profiler", "Span", "format_report", "percentile", "profiler", "trace", "write_trace")
+
+# Returned by :meth:`Profiler.span` when profiling is disabled.
+_nullcontext: ContextManager[None] = contextlib.nullcontext()
+
+
+class Span(NamedTuple):
+	"""
+	A single timed step.
+	"""
+
+	#: The step which was timed, such as ``'format'`` or ``'read'``.
+	phase: str
+
+	#: The language of the code block, for steps which call a formatter.
+	language: Optional[str]
+
+	#: The file being reformatted, if any.
+	filename: Optional[str]
+
+	#: The value of :func:`time.perf_counter` when the step started.
+	start: float
+
+	#: How long the step took, in seconds.
+	duration: float
+
+	#: The ID of the process the step ran in.
+	pid: int
+
+	#: The ID of the thread the step ran in.
+	tid: int
+
+
+class Profiler:
+	"""
+	Records the time taken by each step of reformatting, when enabled.
+
+	When disabled, :meth:`~.span` returns a shared do-nothing context manager,
+	so leaving the calls in place costs next to nothing.
+
+	The steps recorded by ``snippet-fmt`` are:
+
+	* ``'load_formatters'`` -- loading custom formatters from entry points.
+	* ``'file'`` -- reformatting each file, from start to finish.
+	* ``'read'`` -- reading a file.
+	* ``'scan'`` -- finding the code blocks in a file or docstring.
+	* ``'find_docstrings'`` -- finding the docstrings in a Python file.
+	* ``'docstring'`` -- reformatting each docstring in a Python file.
+	* ``'format'`` -- each call to a formatter.
+	* ``'format_many'`` -- each call to a formatter for a batch of code blocks.
+	* ``'get_diff'`` -- constructing a diff.
+	* ``'to_file'`` -- writing a file.
+	"""
+
+	#: Whether spans are being recorded.
+	enabled: bool
+
+	#: The spans recorded so far.
+	spans: List[Span]
+
+	def __init__(self):
+		self.enabled = False
+		self.spans = []
+
+	def __repr__(self) -> str:
+		state = "enabled" if self.enabled else "disabled"
+		return f"<{self.__class__.__name__}: {state}, {len(self.spans)} spans>"
+
+	def span(
+			self,
+			phase: str,
+			language: Optional[str] = None,
+			filename: Optional[str] = None,
+			) -> ContextManager[None]:
+		"""
+		Returns a context manager which records how long its body takes, if profiling is enabled.
+
+		:param phase: The step being timed.
+		:param language: The language of the code block, for steps which call a formatter.
+		:param filename: The file being reformatted, if any.
+		"""
+
+		if not self.enabled:
+			return _nullcontext
+
+		return self._span(phase, language, filename)
+
+	@contextlib.contextmanager
+	def _span(self, phase: str, language: Optional[str], filename: Optional[str]) -> Iterator[None]:
+		start = time.perf_counter()
+
+		try:
+			yield
+		finally:
+			duration = time.perf_counter() - start
+			self.spans.append(Span(phase, language, filename, start, duration, os.getpid(), threading.get_ident()))
+
+	def take(self) -> List[Span]:
+		"""
+		Returns the spans recorded so far, and forgets them.
+		"""
+
+		spans, self.spans = self.spans, []
+		return spans
+
+	def clear(self) -> None:
+		"""
+		Forget the spans recorded so far.
+		"""
+
+		self.spans = []
+
+
+def format_report(spans: Iterable[Span]) -> str:
+	"""
+	Returns a summary of the given spans, as tables by step, by language and by file.
+
+	Each table shows the number of spans, their total duration, and the median and 95th percentile durations,
+	with the largest total first. Only formatter calls are included in the tables by language and by file.
+
+	:param spans:
+	"""
+
+	spans = list(spans)
+	formatter_calls = [span for span in spans if span.phase in {"format", "format_many"}]
+
+	tables = [
+			_table("Step", spans, lambda span: span.phase),
+			_table("Language", formatter_calls, lambda span: span.language or "<none>"),
+			_table("File", formatter_calls, lambda span: span.filename or "<unknown>"),
+			]
+
+	return "\n\n".join(tables) + '\n'
+
+
+def write_trace(spans: Iterable[Span], filename: PathLike) -> None:
+	"""
+	Write the given spans to a file in the Chrome trace event format,
+	which can be viewed in ``chrome://tracing`` or `Perfetto <https://ui.perfetto.dev>`_.
+
+	Each process (such as the worker processes used with ``--jobs``) and thread is shown on its own row.
+
+	:param spans:
+	:param filename: The JSON file to write.
+	"""
+
+	spans = list(spans)
+
+	# Timestamps are in microseconds, from the start of the earliest span.
+	origin = min((span.start for span in spans), default=0)
+	main_pid = os.getpid()
+
+	events: List[Dict[str, Any]] = []
+
+	for pid in sorted({span.pid for span in spans}):
+		process_name = "snippet-fmt" if pid == main_pid else f"worker {pid}"
+		events.append({"name": "process_name", "ph": 'M', "pid": pid, "tid": 0, "args": {"name": process_name}})
+
+	for span in spans:
+		args = {}
+		if span.filename is not None:
+			args["file"] = span.filename
+		if span.language is not None:
+			args["language"] = span.language
+
+		events.append({
+				"name": span.phase if span.language is None else f"{span.phase} ({span.language})",
+				"cat": span.phase,
+				"ph": 'X',
+				"ts": round((span.start - origin) * 1e6, 3),
+				"dur": round(span.duration * 1e6, 3),
+				"pid": span.pid,
+				"tid": span.tid,
+				"args": args,
+				})
+
+	with open(filename, 'w', encoding="UTF-8") as fp:
+		json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, fp)
+
+
+@contextlib.contextmanager
+def trace(filename: PathLike) -> Iterator[Profiler]:
+	"""
+	Context manager to enable :data:`~.profiler` for the duration of the :keyword:`with` block,
+	and then write the spans recorded in it to a Chrome trace event file with :func:`~.write_trace`.
+
+	.. code-block:: python
+
+		with trace("out.json"):
+			reformat_file("README.rst", config)
+
+	:param filename: The JSON file to write.
+	"""
+
+	was_enabled = profiler.enabled
+	first_span = len(profiler.spans)
+	profiler.enabled = True
+
+	try:
+		yield profiler
+	finally:
+		profiler.enabled = was_enabled
+		write_trace(profiler.spans[first_span:], filename)
+
+
+def percentile(values: Sequence[float], p: float) -> float:
+	"""
+	Returns the given percentile of the values, using the nearest-rank method.
+
+	:param values: The values, sorted from smallest to largest.
+	:param p: The percentile, between 0 and 100.
+	"""
+
+	rank = max(1, math.ceil(p / 100 * len(values)))
+	return values[rank - 1]
+
+
+def _table(heading: str, spans: Iterable[Span], key: Callable[[Span], str]) -> str:
+	# Returns a table of the total, count, and median and 95th percentile durations of the spans in each group.
+
+	groups: Dict[str, List[float]] = {}
+	for span in spans:
+		groups.setdefault(key(span), []).append(span.duration)
+
+	headings = [heading, "Count", "Total (ms)", "p50 (ms)", "p95 (ms)"]
+	rows = []
+
+	for name, durations in sorted(groups.items(), key=lambda item: sum(item[1]), reverse=True):
+		durations.sort()
+		rows.append([
+				name,
+				str(len(durations)),
+				f"{sum(durations) * 1000:.3f}",
+				f"{percentile(durations, 50) * 1000:.3f}",
+				f"{percentile(durations, 95) * 1000:.3f}",
+				])
+
+	widths = [max(len(row[idx]) for row in [headings, *rows]) for idx in range(len(headings))]
+
+	lines = []
+	for row in [headings, *rows]:
+		cells = [row[0].ljust(widths[0])] + [cell.rjust(width) for cell, width in zip(row[1:], widths[1:])]
+		lines.append("  ".join(cells))
+
+	lines.insert(1, "  ".join('-' * width for width in widths))
+	return '\n'.join(lines)
+
+
+#: The :class:`~.Profiler` used by ``snippet-fmt``, enabled with the ``--profile`` option.
+profiler = Profiler()
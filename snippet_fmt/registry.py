@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+#
+#  registry.py
+"""
+The formatters available to ``snippet-fmt``, shared by every reformatter in the process.
+
+.. versionadded:: 0.4.0
+"""
+#
+#  Copyright © 2026 Dominic Davis-Foster <dominic@davis-foster.co.uk>
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+#  EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+#  MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+#  IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+#  DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+#  OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE
+#  OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+
+# stdlib
+import contextlib
+import sys
+from typing import Dict, Mapping, Optional, Tuple
+
+# this package
+from snippet_fmt.cache import get_entry_points
+from snippet_fmt.formatters import Formatter, format_ini, format_json, format_python, format_toml, noformat
+from snippet_fmt.profiling import profiler
+
+__all__ = ("FormatterRegistry", "formatter_registry")
+
+#: The entry point group for custom formatters.
+ENTRY_POINT_GROUP = "snippet_fmt.formatters"
+
+
+class FormatterRegistry:
+	"""
+	Maps language names to formatters.
+
+	Custom formatters defined via entry points are loaded the first time they are needed,
+	and then reused until :py:obj:`sys.path` changes.
+
+	:param builtin: The formatters included with ``snippet-fmt``.
+	"""
+
+	def __init__(self, builtin: Mapping[str, Formatter]):
+		self.builtin: Dict[str, Formatter] = dict(builtin)
+
+		# The formatters from entry points, and the value of ``sys.path`` they were loaded with.
+		self._extra: Optional[Tuple[Tuple[str, ...], Dict[str, Formatter]]] = None
+
+	def __repr__(self) -> str:
+		return f"<{self.__class__.__name__}: {len(self.builtin)} builtin formatters>"
+
+	def load_extra(self) -> Dict[str, Formatter]:
+		"""
+		Returns the custom formatters defined via entry points.
+
+		Entry points which can't be loaded are ignored.
+		Later distributions on :py:obj:`sys.path` take precedence over earlier ones.
+		"""
+
+		path = tuple(sys.path)
+		if self._extra is not None and self._extra[0] == path:
+			return self._extra[1]
+
+		with profiler.span("load_formatters"):
+			# 3rd party
+			import entrypoints  # type: ignore[import-untyped]
+
+			extra: Dict[str, Formatter] = {}
+
+			for group, name, epstr, *_ in get_entry_points():
+				if group != ENTRY_POINT_GROUP:
+					continue
+
+				with contextlib.suppress(entrypoints.BadEntryPoint, ImportError):  # pylint: disable=W8205
+					# TODO: show warning for bad entry point if verbose, or "strict"?
+					ep = entrypoints.EntryPoint.from_string(epstr, name)
+					extra[name] = ep.load()
+
+		self._extra = (path, extra)
+		return extra
+
+	def get_formatters(self) -> Dict[str, Formatter]:
+		"""
+		Returns a new mapping of language names to formatters, including any custom formatters.
+		"""
+
+		return {**self.builtin, **self.load_extra()}
+
+	def clear(self) -> None:
+		"""
+		Forget the custom formatters, so they are loaded again next time.
+		"""
+
+		self._extra = None
+
+
+#: The :class:`~.FormatterRegistry` used by :class:`snippet_fmt.Reformatter`.
+formatter_registry = FormatterRegistry({
+		"bash": noformat,
+		"python": format_python,
+		"python3": format_python,
+		"pycon": format_python,
+		"toml": format_toml,
+		"ini": format_ini,
+		"json": format_json,
+		})
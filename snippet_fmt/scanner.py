@@ -0,0 +1,392 @@
+#!/usr/bin/env python3
+#
+#  scanner.py
+"""
+Locate code block directives in reStructuredText.
+
+.. versionadded:: 0.4.0
+"""
+#
+#  Copyright © 2026 Dominic Davis-Foster <dominic@davis-foster.co.uk>
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+#  EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+#  MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+#  IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+#  DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+#  OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE
+#  OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+# stdlib
+import mmap
+import os
+import re
+from bisect import bisect_right
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+# 3rd party
+from domdf_python_tools.typing import PathLike
+
+__all__ = ("CodeBlockSpan", "DirectiveScanner", "LineIndex")
+
+#: Files at least this large are memory-mapped by :meth:`DirectiveScanner.file_has_markers`
+#: rather than read into memory.
+MMAP_THRESHOLD = 1024 * 1024
+
+
+class CodeBlockSpan(NamedTuple):
+	"""
+	The location of a code block directive within a document.
+
+	All offsets are character offsets into :attr:`~.source`.
+
+	.. code-block:: rst
+
+		.. code-block:: python       <-- start
+			:caption: Example        <-- options_start
+		                             <-- options_end
+			print("Hello World")     <-- code_start
+		                             <-- end
+	"""
+
+	#: The document containing the code block.
+	source: str
+
+	#: The offset of the start of the directive line.
+	start: int
+
+	#: The offset of the end of the code, including any trailing blank lines.
+	end: int
+
+	#: The indentation of the directive.
+	indent: str
+
+	#: The indentation of the code relative to the directive.
+	body_indent: str
+
+	#: The name of the directive, e.g. ``'code-block'``.
+	directive: str
+
+	#: The language of the code block, if given.
+	lang: Optional[str]
+
+	#: The offset of the start of the directive's options.
+	options_start: int
+
+	#: The offset of the end of the directive's options.
+	options_end: int
+
+	#: The offset of the start of the code.
+	code_start: int
+
+	def __repr__(self) -> str:
+		return (
+				f"{self.__class__.__name__}(start={self.start}, end={self.end}, indent={self.indent!r}, "
+				f"body_indent={self.body_indent!r}, directive={self.directive!r}, lang={self.lang!r}, "
+				f"options_start={self.options_start}, options_end={self.options_end}, code_start={self.code_start})"
+				)
+
+	@property
+	def before(self) -> str:
+		"""
+		The directive, its options, and any blank lines before the code.
+		"""
+
+		return self.source[self.start:self.code_start]
+
+	@property
+	def code(self) -> str:
+		"""
+		The indented code, including any trailing blank lines.
+		"""
+
+		return self.source[self.code_start:self.end]
+
+
+class DirectiveScanner:
+	"""
+	Finds code block directives in reStructuredText, in a single pass over the document.
+
+	A code block consists of a directive line such as ``.. code-block:: python``,
+	optionally followed by option lines (e.g. ``:caption: Example``) which share the body indentation,
+	blank lines, and finally the code, which is indented relative to the directive.
+	The code continues until the first non-blank line with less indentation.
+
+	:param directives: The directive types to find, such as ``'code-block'`` for ``.. code-block::``.
+	"""
+
+	def __init__(self, directives: Iterable[str]):
+		self.directives = tuple(directives)
+
+		# Longest names first, so e.g. ``code-block`` is tried before ``code``.
+		alternation = '|'.join(re.escape(d) for d in sorted(self.directives, key=len, reverse=True))
+
+		# Only matches a single line, so cannot backtrack catastrophically.
+		self._directive_line = re.compile(
+				rf"^(?P<indent>[ \t]*)\.\.[ \t]*(?P<directive>{alternation})::[ \t]*(?P<lang>[A-Za-z0-9_-]+)?[ \t]*$",
+				re.MULTILINE,
+				)
+
+		# Matches anything which might be the start of a directive, in the raw bytes of a file.
+		self._marker = re.compile(rb"\.\.[ \t]*(?:" + alternation.encode("UTF-8") + rb")::")
+
+	def __repr__(self) -> str:
+		return f"{self.__class__.__name__}({list(self.directives)!r})"
+
+	def __reduce__(self) -> Tuple[type, Tuple[Tuple[str, ...]]]:
+		return (self.__class__, (self.directives, ))
+
+	def iter_blocks(self, source: str) -> Iterator[CodeBlockSpan]:
+		"""
+		Returns an iterator over the code blocks in the given document, in order.
+
+		:param source:
+		"""
+
+		if not self.directives:
+			return
+
+		length = len(source)
+		pos = 0
+
+		while True:
+			match = self._search(source, pos)
+			if match is None:
+				return
+
+			line_end = match.end()
+			if line_end == length:
+				# The directive must be followed by a newline.
+				return
+
+			block = self._read_block(source, match, line_end + 1)
+
+			if block is None:
+				pos = line_end + 1
+			else:
+				yield block
+				pos = block.end
+
+	def _search(self, source: str, pos: int) -> Optional["re.Match[str]"]:
+		# Equivalent to ``self._directive_line.search(source, pos)`` where ``pos`` is the start of a line.
+		# The regular expression is only tried on lines where ``..`` follows the indentation,
+		# which are found with :meth:`str.find` much faster than the regular expression could search.
+
+		find = source.find
+		match = self._directive_line.match
+
+		while True:
+			dots = find("..", pos)
+			if dots == -1:
+				return None
+
+			line_start = source.rfind('\n', pos, dots) + 1 or pos
+			if _skip_whitespace(source, line_start, dots) == dots:
+				directive = match(source, line_start)
+				if directive is not None:
+					return directive
+
+			# Only the first ``..`` on a line can follow the indentation.
+			pos = find('\n', dots) + 1
+			if not pos:
+				return None
+
+	def has_markers(self, data: Union[bytes, mmap.mmap]) -> bool:
+		"""
+		Returns whether the given bytes contain anything which looks like one of the directives.
+
+		This is much cheaper than :meth:`~.iter_blocks`, and can be used to skip documents which
+		can't contain any code blocks. A return value of :py:obj:`True` does not guarantee that there are any.
+
+		:param data: The UTF-8 encoded document.
+		"""
+
+		if not self.directives:
+			return False
+
+		return self._marker.search(data) is not None
+
+	def file_has_markers(self, filename: PathLike) -> bool:
+		"""
+		Returns whether the given file contains anything which looks like one of the directives.
+
+		The file isn't decoded, and large files are memory-mapped rather than read into memory.
+
+		:param filename:
+		"""
+
+		with open(filename, "rb") as fp:
+			size = os.fstat(fp.fileno()).st_size
+
+			if size < MMAP_THRESHOLD:
+				return self.has_markers(fp.read())
+
+			with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as data:
+				return self.has_markers(data)
+
+	@staticmethod
+	def _read_block(source: str, match: "re.Match[str]", pos: int) -> Optional[CodeBlockSpan]:
+		indent = match["indent"]
+		indent_length = len(indent)
+		options_start = pos
+
+		# Options, with the body indentation of the first option line.
+		option_indent: Optional[str] = None
+
+		while True:
+			line_end = source.find('\n', pos)
+			if line_end == -1 or not source.startswith(indent, pos):
+				break
+
+			ws_end = _skip_whitespace(source, pos + indent_length, line_end)
+			if ws_end == pos + indent_length or ws_end == line_end or source[ws_end] != ':':
+				break
+
+			line_indent = source[pos + indent_length:ws_end]
+			if option_indent is None:
+				option_indent = line_indent
+			elif line_indent != option_indent:
+				break
+
+			pos = line_end + 1
+
+		options_end = pos
+
+		# Blank lines between the options and the code.
+		while True:
+			line_end = source.find('\n', pos)
+			if line_end == -1 or _skip_whitespace(source, pos, line_end) != line_end:
+				break
+			pos = line_end + 1
+
+		# The first line of code determines the indentation of the code.
+		code_start = pos
+		line_end = source.find('\n', pos)
+		if line_end == -1 or not source.startswith(indent, pos):
+			return None
+
+		ws_end = _skip_whitespace(source, pos + indent_length, line_end)
+		if ws_end == pos + indent_length or ws_end == line_end:
+			return None
+
+		body_indent = source[pos + indent_length:ws_end]
+		if option_indent is not None and not body_indent.startswith(option_indent):
+			return None
+
+		prefix = indent + body_indent
+		pos = line_end + 1
+
+		while True:
+			line_end = source.find('\n', pos)
+			if line_end == -1:
+				break
+			if not source.startswith(prefix, pos) and _skip_whitespace(source, pos, line_end) != line_end:
+				break
+			pos = line_end + 1
+
+		return CodeBlockSpan(
+				source=source,
+				start=match.start(),
+				end=pos,
+				indent=indent,
+				body_indent=body_indent,
+				directive=match["directive"],
+				lang=match["lang"],
+				options_start=options_start,
+				options_end=options_end,
+				code_start=code_start,
+				)
+
+
+class LineIndex:
+	"""
+	Converts between character offsets in a document and line numbers.
+
+	The offset of the start of each line is found once, in a single pass over the document,
+	and each lookup is then a binary search.
+
+	:param source: The document.
+
+	.. versionadded:: 0.4.0
+	"""
+
+	__slots__ = ("source", "_starts")
+
+	#: The document.
+	source: str
+
+	def __init__(self, source: str):
+		self.source = source
+
+		starts: List[int] = [0]
+		find = source.find
+		pos = find('\n')
+
+		while pos != -1:
+			starts.append(pos + 1)
+			pos = find('\n', pos + 1)
+
+		self._starts = starts
+
+	def __repr__(self) -> str:
+		return f"<{self.__class__.__name__}: {len(self)} lines>"
+
+	def __len__(self) -> int:
+		"""
+		Returns the number of lines in the document.
+
+		A trailing newline starts a final, empty, line.
+		"""
+
+		return len(self._starts)
+
+	def lineno(self, offset: int) -> int:
+		"""
+		Returns the (1-based) number of the line containing the given character offset.
+
+		:param offset:
+		"""
+
+		return bisect_right(self._starts, offset)
+
+	def offset(self, lineno: int) -> int:
+		"""
+		Returns the character offset of the start of the given line.
+
+		:param lineno: The 1-based line number. Numbers past the end of the document give its length.
+		"""
+
+		if lineno > len(self._starts):
+			return len(self.source)
+
+		return self._starts[lineno - 1]
+
+	def line(self, lineno: int) -> str:
+		"""
+		Returns the given line, without its newline.
+
+		:param lineno: The 1-based line number.
+		"""
+
+		start = self.offset(lineno)
+		end = self.source.find('\n', start)
+		return self.source[start:] if end == -1 else self.source[start:end]
+
+
+_whitespace = re.compile(r"[ \t]*")
+
+
+def _skip_whitespace(source: str, pos: int, end: int) -> int:
+	# Returns the offset of the first character which isn't a space or tab, or ``end``.
+	return _whitespace.match(source, pos, end).end()  # type: ignore[union-attr]
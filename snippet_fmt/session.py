@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+#
+#  session.py
+"""
+State shared by the reformatters for the files and docstrings in a single run.
+
+.. versionadded:: 0.4.0
+"""
+#
+#  Copyright © 2026 Dominic Davis-Foster <dominic@davis-foster.co.uk>
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+#  EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+#  MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+#  IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+#  DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+#  OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE
+#  OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+
+# stdlib
+from typing import Any, Dict, Mapping, Optional, Tuple, Union
+
+# this package
+from snippet_fmt.budget import SnippetBudget
+from snippet_fmt.config import CompiledConfig, SnippetFmtConfigDict
+from snippet_fmt.formatters import Formatter
+from snippet_fmt.scanner import DirectiveScanner
+
+__all__ = ("FormattingSession", )
+
+
+class FormattingSession:
+	"""
+	Everything about a ``snippet-fmt`` configuration which can be worked out once and
+	then reused for every file and docstring reformatted with it.
+
+	:param config: The ``snippet_fmt`` configuration, either parsed from a TOML file (or similar) or already compiled.
+	"""
+
+	#: The compiled ``snippet_fmt`` configuration.
+	compiled: CompiledConfig
+
+	#: The scanner for the configured directives.
+	scanner: DirectiveScanner
+
+	#: Mapping of language names to the hash of the formatter's configuration, for the snippet cache.
+	config_hashes: Dict[str, str]
+
+	def __init__(self, config: Union[SnippetFmtConfigDict, CompiledConfig]):
+		if not isinstance(config, CompiledConfig):
+			config = CompiledConfig(config)
+
+		self.compiled = config
+		self.scanner = config.scanner
+		self.config_hashes = {}
+
+	def __repr__(self) -> str:
+		return f"<{self.__class__.__name__}: {self.compiled!r}>"
+
+	def get_formatter(self, lang: Optional[str]) -> Tuple[Formatter, Mapping[str, Any]]:
+		"""
+		Returns the formatter and its configuration for the given language.
+
+		Languages which aren't configured are given :func:`~.noformat`.
+
+		:param lang: The language given in the directive, if any.
+		"""
+
+		return self.compiled.get_formatter(lang)
+
+	def get_budget(self, lang: Optional[str]) -> SnippetBudget:
+		"""
+		Returns the limits on code snippets in the given language.
+
+		:param lang: The language given in the directive, if any.
+
+		.. versionadded:: 0.4.0
+		"""
+
+		return self.compiled.get_budget(lang)
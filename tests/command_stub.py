@@ -0,0 +1,48 @@
+# Stub external formatter for testing :mod:`snippet_fmt.command`.
+# Uppercases code, fails on snippets containing "error", exits on snippets containing "crash",
+# and hangs on snippets containing "sleep".
+
+# stdlib
+import sys
+import time
+
+
+def _format(code: str) -> str:
+	if "crash" in code:
+		sys.exit(3)
+	if "sleep" in code:
+		time.sleep(60)
+	if "error" in code:
+		raise ValueError(f"invalid code: {code.strip()}")
+	return code.upper()
+
+
+def main() -> None:
+	if sys.argv[1:] != ["--persistent"]:
+		try:
+			sys.stdout.write(_format(sys.stdin.read()))
+		except ValueError as e:
+			sys.exit(str(e))
+		return
+
+	stdin, stdout = sys.stdin.buffer, sys.stdout.buffer
+
+	while True:
+		header = stdin.readline()
+		if not header:
+			return
+
+		code = stdin.read(int(header)).decode("UTF-8")
+
+		try:
+			status, reply = b"ok", _format(code).encode("UTF-8")
+		except ValueError as e:
+			status, reply = b"error", str(e).encode("UTF-8")
+
+		stdout.write(b"%s %d\n" % (status, len(reply)))
+		stdout.write(reply)
+		stdout.flush()
+
+
+if __name__ == "__main__":
+	main()
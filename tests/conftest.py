@@ -1,4 +1,38 @@
+# stdlib
+from typing import Iterator
+
+# 3rd party
+import pytest
+from domdf_python_tools.paths import PathPlus, TemporaryPathPlus
+
 pytest_plugins = (
 		"coincidence",
 		"consolekit.testing",
 		)
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(monkeypatch) -> Iterator[PathPlus]:
+	# Don't read or pollute the user's cache
+	with TemporaryPathPlus() as tmpdir:
+		monkeypatch.setenv("SNIPPET_FMT_CACHE_DIR", str(tmpdir))
+		yield tmpdir
+
+
+def pytest_addoption(parser):
+	parser.addoption("--benchmark", action="store_true", default=False, help="Run the wall-clock benchmarks.")
+
+
+def pytest_configure(config):
+	config.addinivalue_line("markers", "benchmark: compares wall-clock timings, so only run with --benchmark")
+
+
+def pytest_collection_modifyitems(config, items):
+	# Timings vary too much on busy machines for the benchmarks to be run by default.
+	if config.getoption("--benchmark"):
+		return
+
+	skip_benchmark = pytest.mark.skip(reason="wall-clock benchmark; run with --benchmark")
+	for item in items:
+		if item.get_closest_marker("benchmark") is not None:
+			item.add_marker(skip_benchmark)
@@ -0,0 +1,186 @@
+# stdlib
+import sys
+import threading
+import time
+from typing import List
+
+# 3rd party
+import pytest
+from domdf_python_tools.paths import PathPlus
+
+# this package
+import snippet_fmt
+from snippet_fmt import Reformatter, SnippetFmtConfigDict
+from snippet_fmt._runner import iter_results
+from snippet_fmt.budget import SnippetBudget, SnippetTimeout, SnippetTooLarge, call_with_timeout
+from snippet_fmt.config import CompiledConfig, load_toml
+from snippet_fmt.session import FormattingSession
+
+STUB = [sys.executable, str(PathPlus(__file__).parent / "command_stub.py")]
+
+
+def slow(code: str, **config) -> str:
+	# Busy loop, as the yapf hook would be.
+	end = time.perf_counter() + 30
+	while time.perf_counter() < end:
+		pass
+	return code
+
+
+def test_snippet_budget():
+	assert SnippetBudget.from_config({}) == SnippetBudget(None, None)
+	assert SnippetBudget.from_config({"max-size": 10, "timeout": 1}) == SnippetBudget(10, 1.0)
+
+	assert SnippetBudget().batch_timeout is None
+	assert SnippetBudget(timeout=2).batch_timeout == 3
+
+	SnippetBudget(max_size=5).check_size("12345")
+	with pytest.raises(SnippetTooLarge, match="code block of 6 characters, as it exceeds the limit of 5"):
+		SnippetBudget(max_size=5).check_size("123456")
+
+
+def test_call_with_timeout():
+	assert call_with_timeout(None, str.upper, "hello") == "HELLO"
+	assert call_with_timeout(1, str.upper, "hello") == "HELLO"
+
+	with pytest.raises(SnippetTimeout, match="took longer than 0.2 seconds"):
+		call_with_timeout(0.2, slow, "code")
+
+	with pytest.raises(ValueError, match="invalid literal"):
+		call_with_timeout(1, int, "hello")
+
+
+def test_call_with_timeout_thread():
+	# Outside the main thread the formatter is run in another thread, and abandoned if it takes too long.
+	errors: List[BaseException] = []
+
+	def target() -> None:
+		try:
+			call_with_timeout(0.2, time.sleep, 30)
+		except BaseException as e:
+			errors.append(e)
+
+	thread = threading.Thread(target=target)
+	thread.start()
+	# Well before the 30 seconds the formatter would take if it wasn't abandoned.
+	thread.join(20)
+
+	assert not thread.is_alive()
+	assert len(errors) == 1
+	assert isinstance(errors[0], SnippetTimeout)
+
+
+def test_load_toml(tmp_pathplus: PathPlus):
+	(tmp_pathplus / "pyproject.toml").write_text(
+			"[tool.snippet-fmt]\n"
+			"max-size = 1000\n"
+			"timeout = 10\n"
+			"[tool.snippet-fmt.languages.python]\n"
+			"timeout = 2.5\n"
+			"[tool.snippet-fmt.languages.toml]\n"
+			)
+
+	compiled = CompiledConfig(load_toml(tmp_pathplus / "pyproject.toml"))
+	assert compiled.get_budget("python") == SnippetBudget(1000, 2.5)
+	assert compiled.get_budget("toml") == SnippetBudget(1000, 10)
+	assert compiled.get_budget("ini") == SnippetBudget()
+
+	# The budget isn't passed on to the formatter.
+	assert compiled.get_formatter("python")[1] == {}
+
+
+def test_reformatter(capsys):
+	source = ".. code-block:: python\n\n    x = 1\n\n.. code-block:: python\n\n    x = 1234567890\n\nText\n"
+	config: SnippetFmtConfigDict = {
+			"languages": {"python": {"max-size": 10, "timeout": 0.2}},
+			"directives": ["code-block"],
+			}
+
+	r = Reformatter(source, "example.rst", config, FormattingSession(config))
+	assert not r.run()
+	assert capsys.readouterr().err == (
+			"example.rst:5: SnippetTooLarge: Skipped code block of 16 characters, as it exceeds the limit of 10\n"
+			)
+
+	compiled = CompiledConfig(config, formatters={"python": slow})
+	r = Reformatter(source, "example.rst", config, FormattingSession(compiled))
+	assert not r.run()
+	assert capsys.readouterr().err.splitlines() == [
+			"example.rst:1: SnippetTimeout: Skipped code block, as formatting it took longer than 0.2 seconds",
+			"example.rst:5: SnippetTooLarge: Skipped code block of 16 characters, as it exceeds the limit of 10",
+			]
+
+
+class HangingFormatter:
+
+	def __call__(self, code: str, **config) -> str:
+		return slow(code) if "sleep" in code else code.upper()
+
+	def format_many(self, codes: List[str], **config) -> List[str]:
+		return [self(code) for code in codes]
+
+
+def test_reformatter_batch_timeout(monkeypatch, capsys):
+	timeouts = []
+
+	def recording_call_with_timeout(timeout, func, *args, **kwargs):
+		timeouts.append(timeout)
+		return call_with_timeout(timeout, func, *args, **kwargs)
+
+	monkeypatch.setattr(snippet_fmt, "call_with_timeout", recording_call_with_timeout)
+
+	sleep = ".. code-block:: python\n\n    sleep\n"
+	source = ''.join(f".. code-block:: python\n\n    x = {idx}\n\n" for idx in range(10)) + sleep
+	formatted = ''.join(f".. code-block:: python\n\n    X = {idx}\n\n" for idx in range(10)) + sleep
+	config: SnippetFmtConfigDict = {"languages": {"python": {"timeout": 0.2}}, "directives": ["code-block"]}
+
+	compiled = CompiledConfig(config, formatters={"python": HangingFormatter()})
+	r = Reformatter(source, "example.rst", config, FormattingSession(compiled))
+	assert r.run()
+	assert r.to_string() == formatted
+	assert capsys.readouterr().err == (
+			"example.rst:41: SnippetTimeout: Skipped code block, as formatting it took longer than 0.2 seconds\n"
+			)
+
+	# The batch of 11 snippets isn't given 11 times as long, so the hanging snippet is given up on quickly.
+	assert timeouts == [pytest.approx(0.3)] + [0.2] * 11
+
+
+@pytest.mark.parametrize("persistent", [False, True])
+def test_worker_processes(tmp_pathplus: PathPlus, persistent: bool):
+	config: SnippetFmtConfigDict = {
+			"languages": {
+					"sql": {
+							"reformat": True,
+							"command": [*STUB, "--persistent"] if persistent else STUB,
+							"persistent": persistent,
+							# Long enough that starting the command is never mistaken for it hanging.
+							"timeout": 2,
+							},
+					},
+			"directives": ["code-block"],
+			}
+
+	select = ".. code-block:: sql\n\n    select 1\n"
+	formatted = ".. code-block:: sql\n\n    SELECT 1\n"
+	sleep = "\n.. code-block:: sql\n\n    sleep\n"
+
+	# Only one of the files contains a snippet which hangs.
+	paths = []
+	for idx in range(8):
+		paths.append(tmp_pathplus / f"example{idx}.rst")
+		paths[-1].write_text(select + sleep if idx == 5 else select)
+
+	results = {result.path.name: result for result in iter_results(paths, config, jobs=2)}
+	assert len(results) == 8
+
+	for idx, path in enumerate(paths):
+		result = results[path.name]
+		assert result.changed
+
+		if idx == 5:
+			assert "SnippetTimeout" in result.messages
+			assert path.read_text() == formatted + sleep
+		else:
+			assert "SnippetTimeout" not in result.messages
+			assert path.read_text() == formatted
@@ -0,0 +1,348 @@
+# stdlib
+import os
+
+# 3rd party
+import dom_toml
+import pytest
+from consolekit.testing import CliRunner
+from domdf_python_tools.paths import PathPlus, in_directory
+
+# this package
+import snippet_fmt.cache
+from snippet_fmt import PyReformatter, Reformatter, SnippetFmtConfigDict, reformat_file
+from snippet_fmt.__main__ import main
+from snippet_fmt.cache import Cache, SnippetCache, get_cache_key
+from snippet_fmt.config import CompiledConfig
+from snippet_fmt.formatters import FormatterCapabilities
+from snippet_fmt.session import FormattingSession
+
+source_dir = PathPlus(__file__).parent
+
+CONFIG: SnippetFmtConfigDict = {
+		"languages": {"python": {"reformat": True}, "toml": {"reformat": True}},
+		"directives": ["code-block"],
+		}
+
+
+def test_cache_key(tmp_pathplus: PathPlus):
+	(tmp_pathplus / "formate.toml").write_text((source_dir / "example_formate.toml").read_text())
+
+	with in_directory(tmp_pathplus):
+		key = get_cache_key(CONFIG)
+		assert get_cache_key(CONFIG) == key
+
+		assert get_cache_key({"languages": {}, "directives": ["code-block"]}) != key
+		assert get_cache_key({**CONFIG, "directives": ["code"]}) != key
+
+		# Changing the formate config invalidates the cache
+		(tmp_pathplus / "formate.toml").write_text("[hooks]\nisort = 50\n")
+		assert get_cache_key(CONFIG) != key
+
+
+def test_cache(tmp_pathplus: PathPlus, cache_dir: PathPlus):
+	filename = tmp_pathplus / "example.rst"
+	filename.write_text(".. code-block:: python\n\n    print('hello world')\n")
+
+	cache = Cache("abcdefg", cache_dir)
+	assert not cache.is_clean(filename)
+
+	cache.mark_clean(filename)
+	assert cache.is_clean(filename)
+	cache.write()
+
+	cache = Cache("abcdefg", cache_dir)
+	assert not cache.is_clean(filename)
+
+	with in_directory(tmp_pathplus):
+		cache = Cache.read(CONFIG, cache_dir)
+		cache.mark_clean(filename)
+		cache.write()
+		assert Cache.read(CONFIG, cache_dir).is_clean(filename)
+
+		# Same content, different mtime
+		st = filename.stat()
+		os.utime(filename, (st.st_atime + 10, st.st_mtime + 10))
+		assert Cache.read(CONFIG, cache_dir).is_clean(filename)
+
+		filename.write_text(".. code-block:: python\n\n    print('hello  world')\n")
+		assert not Cache.read(CONFIG, cache_dir).is_clean(filename)
+
+
+def test_cache_corrupt(tmp_pathplus: PathPlus, cache_dir: PathPlus):
+	filename = tmp_pathplus / "example.rst"
+	filename.write_text("Hello World\n")
+
+	cache = Cache.read(CONFIG, cache_dir)
+	cache.cache_file.write_text("{not json")
+
+	cache = Cache.read(CONFIG, cache_dir)
+	assert not cache.is_clean(filename)
+	cache.mark_clean(filename)
+	cache.write()
+
+	assert Cache.read(CONFIG, cache_dir).is_clean(filename)
+
+
+def test_reformat_file_cache(tmp_pathplus: PathPlus, cache_dir: PathPlus, capsys):
+	config: SnippetFmtConfigDict = {"languages": {"python": {}}, "directives": ["code-block"]}
+	filename = tmp_pathplus / "example.rst"
+	filename.write_text(".. code-block:: python\n\n    print('hello world'\n")
+
+	with in_directory(tmp_pathplus):
+		cache = Cache.read(config, cache_dir)
+
+		# Files with errors aren't cached, so the errors are reported every time.
+		assert not reformat_file(filename, config, cache=cache)
+		assert "SyntaxError" in capsys.readouterr().err
+		assert not cache.is_clean(filename)
+
+		filename.write_text(".. code-block:: python\n\n    print('hello world')\n")
+		assert not reformat_file(filename, config, cache=cache)
+		assert cache.is_clean(filename)
+
+
+def test_cli_cache(tmp_pathplus: PathPlus):
+	(tmp_pathplus / "formate.toml").write_text((source_dir / "example_formate.toml").read_text())
+	dom_toml.dump({"tool": {"snippet-fmt": CONFIG}}, tmp_pathplus / "pyproject.toml")
+	filename = tmp_pathplus / "example.rst"
+	filename.write_text('.. code-block:: python\n\n    print("hello world")\n')
+
+	with in_directory(tmp_pathplus):
+		runner = CliRunner(mix_stderr=False)
+
+		result = runner.invoke(main, args=["example.rst", "-vv"])
+		assert result.exit_code == 0
+		assert result.stdout == f"Checking {filename.as_posix()}\n"
+
+		result = runner.invoke(main, args=["example.rst", "-vv"])
+		assert result.exit_code == 0
+		assert result.stdout == f"Skipping {filename.as_posix()} as it is unchanged since it was last checked\n"
+
+		result = runner.invoke(main, args=["example.rst", "-vv", "--no-cache"])
+		assert result.exit_code == 0
+		assert result.stdout == f"Checking {filename.as_posix()}\n"
+
+		# Changing the formate configuration invalidates the cache
+		(tmp_pathplus / "formate.toml").write_text("[hooks]\nisort = 50\n")
+		result = runner.invoke(main, args=["example.rst", "-vv"])
+		assert result.exit_code == 0
+		assert result.stdout == f"Checking {filename.as_posix()}\n"
+
+
+class CountingFormatter:
+	capabilities = FormatterCapabilities(pure=True)
+
+	def __init__(self):
+		self.calls = 0
+
+	def __call__(self, code: str, **config) -> str:
+		self.calls += 1
+		if "error" in code:
+			raise SyntaxError("invalid syntax", ("<unknown>", 1, 1, code))
+		return code.upper()
+
+
+def test_snippet_cache():
+	formatter = CountingFormatter()
+	cache = SnippetCache(maxsize=2)
+	config_hash = cache.config_hash(formatter, {})
+
+	assert cache.format("python", config_hash, "hello", formatter, {}) == "HELLO"
+	assert cache.format("python", config_hash, "hello", formatter, {}) == "HELLO"
+	assert formatter.calls == 1
+	assert (cache.hits, cache.misses) == (1, 1)
+
+	# Different language or config
+	assert cache.format("python3", config_hash, "hello", formatter, {}) == "HELLO"
+	other_hash = cache.config_hash(formatter, {"indent": 2})
+	assert other_hash != config_hash
+	assert cache.format("python", other_hash, "hello", formatter, {}) == "HELLO"
+	assert formatter.calls == 3
+
+	# Least recently used entry was evicted
+	assert cache.format("python", config_hash, "hello", formatter, {}) == "HELLO"
+	assert formatter.calls == 4
+
+
+def test_snippet_cache_versions(tmp_pathplus: PathPlus, monkeypatch):
+	formatter = CountingFormatter()
+	db = tmp_pathplus / "snippets.sqlite3"
+
+	def format_hello() -> SnippetCache:
+		cache = SnippetCache(filename=db)
+		assert cache.format("python", cache.config_hash(formatter, {}), "hello", formatter, {}) == "HELLO"
+		cache.close()
+		return cache
+
+	monkeypatch.setattr(snippet_fmt.cache, "get_tool_versions", lambda: {"isort": "5.0.0"})
+	format_hello()
+	assert format_hello().hits == 1
+
+	# Upgrading a tool run by a formate hook, or snippet-fmt itself, means old results aren't reused.
+	monkeypatch.setattr(snippet_fmt.cache, "get_tool_versions", lambda: {"isort": "6.0.0"})
+	assert format_hello().misses == 1
+
+	monkeypatch.setattr(snippet_fmt, "__version__", "99.0.0")
+	assert format_hello().misses == 1
+
+	assert formatter.calls == 3
+
+
+def test_snippet_cache_exception():
+	formatter = CountingFormatter()
+	cache = SnippetCache()
+	config_hash = cache.config_hash(formatter, {})
+
+	for filename in ["a.rst", "b.rst"]:
+		with pytest.raises(SyntaxError, match="invalid syntax") as e:
+			cache.format("python", config_hash, "error", formatter, {})
+
+		assert e.value.filename == "<unknown>"
+		e.value.filename = filename
+
+	assert formatter.calls == 1
+
+
+def test_snippet_cache_sqlite(tmp_pathplus: PathPlus):
+	formatter = CountingFormatter()
+	db = tmp_pathplus / "snippets.sqlite3"
+
+	cache = SnippetCache(filename=db)
+	config_hash = cache.config_hash(formatter, {})
+	assert cache.format("python", config_hash, "hello", formatter, {}) == "HELLO"
+	with pytest.raises(SyntaxError):
+		cache.format("python", config_hash, "error", formatter, {})
+	cache.close()
+
+	cache = SnippetCache(filename=db)
+	assert cache.format("python", config_hash, "hello", formatter, {}) == "HELLO"
+	with pytest.raises(SyntaxError):
+		cache.format("python", config_hash, "error", formatter, {})
+	assert formatter.calls == 2
+	assert cache.hits == 2
+	cache.close()
+
+	# Shrinking the size limit evicts old entries.
+	cache = SnippetCache(filename=db, max_file_size=1)
+	assert cache.format("python", config_hash, "hello", formatter, {}) == "HELLO"
+	assert formatter.calls == 3
+	cache.close()
+
+
+def test_reformatter_snippet_cache(monkeypatch):
+	formatter = CountingFormatter()
+	monkeypatch.setattr(Reformatter, "snippet_cache", SnippetCache())
+
+	source = ".. code-block:: python\n\n    hello\n\n.. code-block:: python\n\n    hello\n\nText\n"
+	config: SnippetFmtConfigDict = {"languages": {"python": {}}, "directives": ["code-block"]}
+	compiled = CompiledConfig(config, formatters={"python": formatter})
+
+	r = Reformatter(source, "example.rst", config, FormattingSession(compiled))
+	assert r.run()
+	assert r.to_string() == source.replace("hello", "HELLO")
+	assert formatter.calls == 1
+
+	monkeypatch.setattr(Reformatter, "snippet_cache", None)
+	r = Reformatter(source, "example.rst", config, FormattingSession(compiled))
+	r.run()
+	assert formatter.calls == 3
+
+	# Formatters which aren't pure, or are cheap, aren't cached.
+	monkeypatch.setattr(Reformatter, "snippet_cache", SnippetCache())
+	for capabilities in [FormatterCapabilities(), FormatterCapabilities(pure=True, cost="cheap")]:
+		monkeypatch.setattr(CountingFormatter, "capabilities", capabilities)
+		formatter.calls = 0
+		r = Reformatter(source, "example.rst", config, FormattingSession(compiled))
+		r.run()
+		assert formatter.calls == 2
+
+
+class BatchFormatter(CountingFormatter):
+
+	def __init__(self):
+		super().__init__()
+		self.batches = []
+
+	def format_many(self, codes, **config):
+		self.batches.append(list(codes))
+		return [SyntaxError("invalid syntax") if "error" in code else code.upper() for code in codes]
+
+
+def test_snippet_cache_format_many():
+	formatter = BatchFormatter()
+	cache = SnippetCache()
+	config_hash = cache.config_hash(formatter, {})
+
+	assert cache.format("python", config_hash, "hello", formatter, {}) == "HELLO"
+
+	results = cache.format_many("python", config_hash, ["hello", "world", "error", "world"], formatter, {})
+	assert results[:2] == ["HELLO", "WORLD"]
+	assert isinstance(results[2], SyntaxError)
+	assert results[3] == "WORLD"
+	assert formatter.batches == [["world", "error"]]
+	assert (cache.hits, cache.misses) == (2, 3)
+
+	# Cached exceptions are copied, so they can be modified by the caller.
+	assert cache.format_many("python", config_hash, ["error"], formatter, {})[0] is not results[2]
+	assert len(formatter.batches) == 1
+
+
+@pytest.mark.parametrize("use_cache", [True, False])
+def test_reformatter_format_many(monkeypatch, use_cache: bool, capsys):
+	formatter = BatchFormatter()
+	monkeypatch.setattr(Reformatter, "snippet_cache", SnippetCache() if use_cache else None)
+
+	source = "".join([
+			".. code-block:: python\n\n    hello\n\n",
+			".. code-block:: python\n\n    error\n\n",
+			".. code-block:: toml\n\n    key = 'value'\n\n",
+			".. code-block:: python\n\n    world\n\n",
+			"Text\n",
+			])
+	config: SnippetFmtConfigDict = {"languages": {"python": {}, "toml": {}}, "directives": ["code-block"]}
+	compiled = CompiledConfig(config, formatters={"python": formatter})
+
+	r = Reformatter(source, "example.rst", config, FormattingSession(compiled))
+	assert r.run()
+	assert r.to_string() == source.replace("hello", "HELLO").replace("world", "WORLD")
+	assert formatter.batches == [["hello\n\n", "error\n\n", "world\n\n"]]
+	assert formatter.calls == 0
+
+	# Errors are reported for the block which caused them.
+	assert [error.offset for error in r.errors] == [source.index(".. code-block:: python\n\n    error")]
+	assert capsys.readouterr().err == "example.rst:5: SyntaxError: invalid syntax\n"
+
+
+def test_py_reformatter_format_many(tmp_pathplus: PathPlus):
+	formatter = BatchFormatter()
+	config: SnippetFmtConfigDict = {"languages": {"python": {}}, "directives": ["code-block"]}
+	compiled = CompiledConfig(config, formatters={"python": formatter})
+
+	filename = tmp_pathplus / "example.py"
+	filename.write_text(
+			'def foo():\n\t"""\n\t.. code-block:: python\n\n\t\thello\n\t"""\n\n\n'
+			'def bar():\n\t"""\n\t.. code-block:: python\n\n\t\tworld\n\t"""\n'
+			)
+
+	r = PyReformatter(filename, config, FormattingSession(compiled))
+	assert r.run()
+	assert "HELLO" in r.to_string()
+	assert "WORLD" in r.to_string()
+	assert formatter.batches == [["hello\n", "world\n"]]
+
+
+def test_py_reformatter_no_batching(tmp_pathplus: PathPlus, monkeypatch):
+	formatter = CountingFormatter()
+	config: SnippetFmtConfigDict = {"languages": {"python": {}}, "directives": ["code-block"]}
+	compiled = CompiledConfig(config, formatters={"python": formatter})
+
+	filename = tmp_pathplus / "example.py"
+	filename.write_text('def foo():\n\t"""\n\t.. code-block:: python\n\n\t\thello\n\t"""\n')
+
+	# The docstrings aren't scanned up front unless a formatter supports batching.
+	monkeypatch.setattr(PyReformatter, "_format_batches", lambda self, blocks: pytest.fail("Formatted in batches"))
+
+	r = PyReformatter(filename, config, FormattingSession(compiled))
+	assert r.run()
+	assert "HELLO" in r.to_string()
+	assert formatter.calls == 1
@@ -0,0 +1,112 @@
+# stdlib
+import sys
+
+# 3rd party
+import pytest
+from domdf_python_tools.paths import PathPlus
+
+# this package
+from snippet_fmt import Reformatter, SnippetFmtConfigDict
+from snippet_fmt.command import CommandError, CommandFormatter, WorkerPool
+from snippet_fmt.config import CompiledConfig
+from snippet_fmt.formatters import get_capabilities
+from snippet_fmt.session import FormattingSession
+
+STUB = [sys.executable, str(PathPlus(__file__).parent / "command_stub.py")]
+
+
+@pytest.mark.parametrize("persistent", [False, True])
+def test_command_formatter(persistent: bool):
+	argv = [*STUB, "--persistent"] if persistent else STUB
+	formatter = CommandFormatter(argv, persistent=persistent)
+
+	assert formatter("print('hello')\n", reformat=True) == "PRINT('HELLO')\n"
+	assert formatter("print('hello')\n") == "print('hello')\n"
+	assert formatter("ünïcödé", reformat=True) == "ÜNÏCÖDÉ"
+
+	with pytest.raises(CommandError, match="invalid code: error"):
+		formatter("error\n", reformat=True)
+
+	assert formatter('', reformat=True) == ''
+
+	if persistent:
+		assert formatter.pool is not None
+		assert formatter.pool.started == 1
+		formatter.pool.close()
+
+
+def test_command_formatter_missing():
+	with pytest.raises(CommandError, match="Unable to run 'snippet-fmt-no-such-command'"):
+		CommandFormatter("snippet-fmt-no-such-command")("code")
+
+	with pytest.raises(ValueError, match="The command must not be empty"):
+		CommandFormatter('')
+
+
+def test_worker_pool_restart():
+	pool = WorkerPool([*STUB, "--persistent"])
+
+	assert pool.run("hello") == "HELLO"
+	assert pool.started == 1
+
+	# The worker crashes each time, so gives up after restarting once.
+	with pytest.raises(CommandError, match="exited unexpectedly"):
+		pool.run("crash")
+	assert pool.started == 2
+
+	# A new worker is started for the next snippet.
+	assert pool.run("world") == "WORLD"
+	assert pool.started == 3
+	assert pool.run("again") == "AGAIN"
+	assert pool.started == 3
+
+	# Workers which die while idle are replaced transparently.
+	pool._idle[0].process.kill()
+	assert pool.run("restarted") == "RESTARTED"
+	assert pool.started == 4
+
+	pool.close()
+
+
+def test_format_many():
+	formatter = CommandFormatter([*STUB, "--persistent"], persistent=True, max_workers=2)
+
+	results = formatter.format_many(["a", "error", "b", "c", "d"], reformat=True)
+	assert [result if isinstance(result, str) else type(result) for result in results] == [
+			'A', CommandError, 'B', 'C', 'D'
+			]
+
+	assert formatter.pool is not None
+	assert 1 <= formatter.pool.started <= 2
+	formatter.pool.close()
+
+
+def test_from_config():
+	lang_config = {"command": STUB, "persistent": False, "reformat": True}
+	formatter = CommandFormatter.from_config(lang_config)
+	assert CommandFormatter.from_config(dict(lang_config)) is formatter
+	assert CommandFormatter.from_config({**lang_config, "max-workers": 2}) is not formatter
+
+	assert not get_capabilities(formatter).pure
+	assert get_capabilities(CommandFormatter.from_config({**lang_config, "pure": True})).pure
+
+
+def test_reformatter(capsys):
+	source = ".. code-block:: sql\n\n    select 1\n\n.. code-block:: sql\n\n    error\n\nText\n"
+	config: SnippetFmtConfigDict = {
+			"languages": {"sql": {"reformat": True, "command": [*STUB, "--persistent"], "persistent": True}},
+			"directives": ["code-block"],
+			}
+
+	r = Reformatter(source, "example.rst", config, FormattingSession(CompiledConfig(config)))
+	assert r.run()
+	assert r.to_string() == source.replace("select 1", "SELECT 1")
+	assert capsys.readouterr().err == "example.rst:5: CommandError: invalid code: error\n"
+
+	# The worker is shared between files.
+	r = Reformatter(source, "example.rst", config, FormattingSession(CompiledConfig(config)))
+	r.run()
+	formatter = CompiledConfig(config).get_formatter("sql")[0]
+	assert isinstance(formatter, CommandFormatter)
+	assert formatter.pool is not None
+	assert formatter.pool.started == 1
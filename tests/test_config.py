@@ -1,10 +1,14 @@
+# stdlib
+import pickle
+
 # 3rd party
 import pytest
 from coincidence import AdvancedDataRegressionFixture
 from domdf_python_tools.paths import PathPlus
 
 # this package
-from snippet_fmt.config import load_toml
+from snippet_fmt.config import CompiledConfig, SnippetFmtConfigDict, load_toml
+from snippet_fmt.formatters import format_json, format_python, noformat
 
 STANDALONE_LANGUAGES_A = """\
 [languages.toml]
@@ -139,3 +143,43 @@ def test_load_toml(
 		):
 	(tmp_pathplus / "config.toml").write_text(config)
 	advanced_data_regression.check(load_toml(tmp_pathplus / "config.toml"))
+
+
+def test_compiled_config(tmp_pathplus: PathPlus):
+	(tmp_pathplus / "pyproject.toml").write_text(PYPROJECT_LANGUAGES_A)
+	config = CompiledConfig.from_toml(tmp_pathplus / "pyproject.toml")
+
+	assert config.directives == ("code", "code-block", "sourcecode")
+	assert config.to_dict() == load_toml(tmp_pathplus / "pyproject.toml")
+	assert config.get_formatter("python") == (format_python, {"reformat": True, "config-file": "formate.toml"})
+	assert config.get_formatter("json") == (format_json, {"reformat": True, "indent": 2})
+	assert config.get_formatter("JSON") == (format_json, {"reformat": True})
+	assert config.get_formatter("bash") == (noformat, {})
+	assert config.get_formatter(None) == (noformat, {})
+	assert [block.lang for block in config.scanner.iter_blocks(".. code:: python\n\n    pass\n")] == ["python"]
+
+	with pytest.raises(AttributeError, match="immutable"):
+		config.directives = ("code", )  # type: ignore[misc]
+
+	# The options can't be changed either.
+	with pytest.raises(TypeError):
+		config.languages["python"] = {}  # type: ignore[index]
+	with pytest.raises(TypeError):
+		config.languages["python"]["reformat"] = False  # type: ignore[index]
+	with pytest.raises(TypeError):
+		config.get_formatter("python")[1]["reformat"] = False  # type: ignore[index]
+	with pytest.raises(TypeError):
+		config.get_formatter("bash")[1]["reformat"] = True  # type: ignore[index]
+
+	other = CompiledConfig(load_toml(tmp_pathplus / "pyproject.toml"))
+	assert other == config
+	assert hash(other) == hash(config)
+	assert other.fingerprint == config.fingerprint
+	assert len({config, other}) == 1
+
+	different: SnippetFmtConfigDict = {**config.to_dict(), "directives": ["code"]}  # type: ignore[misc]
+	assert CompiledConfig(different).fingerprint != config.fingerprint
+
+	unpickled = pickle.loads(pickle.dumps(config))
+	assert unpickled == config
+	assert unpickled.get_formatter("python") == config.get_formatter("python")
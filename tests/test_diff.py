@@ -0,0 +1,93 @@
+# stdlib
+import difflib
+import random
+from typing import List, Tuple
+
+# 3rd party
+import pytest
+
+# this package
+from snippet_fmt._diff import span_opcodes, unified_diff
+
+
+def _random_document(rng: random.Random) -> Tuple[List[str], List[str], List[Tuple[int, int, int, int]]]:
+	# A document with lots of repeated lines, and a few spans of lines replaced.
+	words = [f"line {idx}" for idx in range(rng.choice([3, 10, 50, 1000]))]
+	a = [rng.choice(words) if rng.random() < 0.7 else '' for _ in range(rng.choice([20, 100, 300, 1000]))]
+
+	b: List[str] = []
+	spans = []
+	pos = 0
+
+	for start in sorted(rng.sample(range(len(a)), rng.randint(1, 4))):
+		if start < pos:
+			continue
+
+		end = min(len(a), start + rng.randint(1, 8))
+		b.extend(a[pos:start])
+
+		if rng.random() < 0.5:
+			new = a[start:end]
+			new[rng.randrange(len(new))] = f"changed {rng.randint(0, 3)}"
+		else:
+			new = [rng.choice([*words, "new", '']) for _ in range(rng.randint(0, 10))]
+
+		spans.append((start, end, len(b), len(b) + len(new)))
+		b.extend(new)
+		pos = end
+
+	b.extend(a[pos:])
+	return a, b, spans
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_span_opcodes(seed: int):
+	rng = random.Random(seed)
+	compared = 0
+
+	for _ in range(250):
+		a, b, spans = _random_document(rng)
+		opcodes = span_opcodes(a, b, spans)
+
+		if opcodes is not None:
+			assert opcodes == difflib.SequenceMatcher(None, a, b).get_opcodes()
+			compared += 1
+
+	assert compared > 50
+
+
+def test_span_opcodes_unique_lines():
+	a = [f"line {idx}" for idx in range(1000)]
+	b = a[:500] + ["new"] + a[502:]
+
+	opcodes = span_opcodes(a, b, [(500, 502, 500, 501)])
+	assert opcodes == [("equal", 0, 500, 0, 500), ("replace", 500, 502, 500, 501), ("equal", 502, 1000, 501, 999)]
+
+
+@pytest.mark.parametrize(
+		"spans",
+		[
+				pytest.param([(5, 6, 5, 7), (4, 5, 4, 5)], id="out_of_order"),
+				pytest.param([(5, 6, 6, 7)], id="misaligned"),
+				pytest.param([(5, 6, 5, 6)], id="wrong_length"),
+				],
+		)
+def test_span_opcodes_invalid(spans: List[Tuple[int, int, int, int]]):
+	a = [f"line {idx}" for idx in range(10)]
+	b = a[:5] + ["new", "new"] + a[6:]
+	assert span_opcodes(a, b, spans) is None
+
+
+@pytest.mark.parametrize("offset", [0, 10])
+def test_unified_diff(offset: int):
+	a = [f"line {idx}" for idx in range(20)]
+	b = a[:3] + a[4:15] + ["new"] + a[15:]
+
+	expected = list(difflib.unified_diff(a, b, "f.rst", "f.rst", "(original)", "(reformatted)", lineterm=''))
+	if offset:
+		expected[2] = "@@ -11,7 +11,6 @@"
+		expected[10] = "@@ -23,6 +22,7 @@"
+
+	assert list(unified_diff(a, b, "f.rst", offset)) == expected
+	assert list(unified_diff(a, b, "f.rst", offset, difflib.SequenceMatcher(None, a, b).get_opcodes())) == expected
+	assert list(unified_diff(a, a, "f.rst")) == []
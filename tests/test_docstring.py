@@ -0,0 +1,162 @@
+# stdlib
+from typing import List, Optional
+
+# 3rd party
+import pytest
+from domdf_python_tools.paths import PathPlus
+
+# this package
+import snippet_fmt
+from snippet_fmt import PyReformatter, SnippetFmtConfigDict, reformat_docstrings
+from snippet_fmt.docstring import find_docstrings
+from snippet_fmt.session import FormattingSession
+
+CONFIG: SnippetFmtConfigDict = {"languages": {"json": {"reformat": True}}, "directives": ["code-block"]}
+
+SOURCE = '''\
+"""
+Module docstring.
+"""
+
+import os
+
+
+def foo():
+	r\'\'\'
+	Function docstring, with "quotes" and a \\\'\'\' escape.
+	\'\'\'
+
+
+class Bar:  # Comment with ünïcödé
+	"Class docstring."
+
+	async def baz(self): "First" "Second"
+
+	def qux(self):
+		x = 1
+		"Not a docstring."
+'''
+
+
+def test_find_docstrings():
+	docstrings = find_docstrings(SOURCE)
+
+	assert [token.function_name for token in docstrings] == [None, "foo", "Bar", "baz"]
+	assert [token.line for token in docstrings] == [1, 9, 15, 17]
+	assert [token.utf8_byte_offset for token in docstrings] == [0, 1, 1, 22]
+
+	for token in docstrings:
+		assert token.name == "DOCSTRING"
+		assert SOURCE[token.offset:token.end] == token.src
+
+	assert docstrings[0].src == '"""\nModule docstring.\n"""'
+	assert docstrings[1].src.startswith("r'''") and docstrings[1].src.endswith("escape.\n\t'''")
+	assert docstrings[2].src == '"Class docstring."'
+
+	# Only the first of several concatenated strings.
+	assert docstrings[3].src == '"First"'
+
+
+@pytest.mark.parametrize(
+		"source, names",
+		[
+				pytest.param('', [], id="empty"),
+				pytest.param("import os\n", [], id="no_docstrings"),
+				pytest.param("x = 1\n'''Not a docstring.'''\n", [], id="not_first"),
+				pytest.param("def foo():\n\tb'''Bytes.'''\n", [], id="bytes"),
+				pytest.param("def foo():\n\tf'''{x}'''\n", [], id="fstring"),
+				pytest.param("def foo():\n\tdef bar():\n\t\t'Bar.'\n", ["bar"], id="nested"),
+				],
+		)
+def test_find_docstrings_none(source: str, names: List[Optional[str]]):
+	assert [token.function_name for token in find_docstrings(source)] == names
+
+
+def test_find_docstrings_syntax_error():
+	with pytest.raises(SyntaxError):
+		find_docstrings("def foo(:\n")
+
+
+MODULE_SOURCE = '''\
+"""
+Module docstring.
+
+.. code-block:: json
+
+	{"key":   "value"}
+"""
+
+
+def foo():
+	"""
+	.. code-block:: json
+
+		[1,   2]
+	"""
+'''
+
+
+def test_module_docstring(tmp_pathplus: PathPlus, capsys):
+	filename = tmp_pathplus / "example.py"
+	filename.write_text(MODULE_SOURCE)
+
+	assert reformat_docstrings(filename, CONFIG)
+	assert filename.read_text() == MODULE_SOURCE.replace("   ", ' ')
+
+	# A diff is shown for each docstring.
+	assert capsys.readouterr().out.count("(reformatted)") == 2
+
+
+def test_module_docstring_session(tmp_pathplus: PathPlus, monkeypatch):
+	filename = tmp_pathplus / "example.py"
+	filename.write_text(MODULE_SOURCE)
+
+	sessions: List[FormattingSession] = []
+
+	class RecordingSession(FormattingSession):
+
+		def __init__(self, config):
+			super().__init__(config)
+			sessions.append(self)
+
+	monkeypatch.setattr(snippet_fmt, "FormattingSession", RecordingSession)
+
+	# The configuration is compiled once for the whole file, not once per docstring.
+	assert reformat_docstrings(filename, CONFIG)
+	assert len(sessions) == 1
+
+
+def test_unchanged_file_not_rebuilt(tmp_pathplus: PathPlus):
+	filename = tmp_pathplus / "example.py"
+	filename.write_text(MODULE_SOURCE.replace("   ", ' '))
+
+	r = PyReformatter(filename, CONFIG)
+	assert not r.run()
+	assert r.to_string() is r._unformatted_source
+
+
+def test_only_changed_docstrings_spliced(tmp_pathplus: PathPlus):
+	filename = tmp_pathplus / "example.py"
+
+	# Odd formatting outside the docstrings is left alone.
+	source = MODULE_SOURCE.replace("def foo():", "def  foo( ) :  # ü").replace("[1,   2]", "[1, 2]")
+	filename.write_bytes(source.encode("UTF-8"))
+
+	r = PyReformatter(filename, CONFIG)
+	assert r.changed_docstrings == []
+	assert r.run()
+	assert [docstring.token.function_name for docstring in r.changed_docstrings] == [None]
+	output = r.to_string()
+	assert output.startswith('"""\nModule docstring.\n\n.. code-block:: json\n\n\t{"key": "value"}\n"""\n')
+	assert output[output.index("def  foo( ) :  # ü"):] == source[source.index("def  foo( ) :  # ü"):]
+
+
+def test_syntax_error(tmp_pathplus: PathPlus, capsys):
+	filename = tmp_pathplus / "example.py"
+	filename.write_text('"""\n.. code-block:: json\n\n\t{}\n"""\n\ndef foo(:\n\tpass\n')
+
+	r = PyReformatter(filename, CONFIG)
+	assert not r.run()
+	assert r.errors[0].offset == filename.read_text().index("def foo")
+	assert r.to_string() == filename.read_text()
+	assert capsys.readouterr().err.startswith(f"{filename.as_posix()}:7: SyntaxError: ")
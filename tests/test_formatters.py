@@ -1,10 +1,27 @@
+# stdlib
+import os
+import time
+from typing import List
+
 # 3rd party
 import pytest as pytest
 from coincidence import AdvancedFileRegressionFixture
 from domdf_python_tools.paths import PathPlus, in_directory
 
 # this package
-from snippet_fmt import format_ini, format_json, format_python, format_toml, noformat
+from snippet_fmt import SnippetFmtConfigDict, format_ini, format_json, format_python, format_toml, noformat
+from snippet_fmt._runner import _process_safe
+from snippet_fmt.config import CompiledConfig
+from snippet_fmt.formatters import (
+		FormateConfigCache,
+		FormatterCapabilities,
+		_format_console_code,
+		declare_capabilities,
+		format_many,
+		formate_config_cache,
+		get_capabilities,
+		supports_batching
+		)
 
 
 @pytest.mark.parametrize(
@@ -21,6 +38,77 @@ def test_noformat(code: str):
 	assert noformat(code, reformat=True) == code
 
 
+class UpperBatchFormatter:
+
+	def __init__(self):
+		self.batches = []
+
+	def __call__(self, code: str, **config) -> str:
+		raise NotImplementedError
+
+	def format_many(self, codes, **config):
+		self.batches.append(list(codes))
+		return [ValueError(code) if "error" in code else code.upper() for code in codes]
+
+
+def test_format_many():
+	assert not supports_batching(format_python)
+	assert supports_batching(UpperBatchFormatter())
+
+	formatter = UpperBatchFormatter()
+	results = format_many(formatter, ["hello", "error", "world"])
+	assert results[0] == "HELLO"
+	assert isinstance(results[1], ValueError)
+	assert results[2] == "WORLD"
+	assert formatter.batches == [["hello", "error", "world"]]
+
+	# Plain callables are called for each snippet.
+	results = format_many(format_json, ['{"a": 1}', "{", "[]"])
+	assert results[0] == '{"a": 1}'
+	assert isinstance(results[1], ValueError)
+	assert results[2] == "[]"
+
+	# The whole batch failing, or returning the wrong number of results, fails each snippet.
+	formatter.format_many = lambda codes, **config: ["HELLO"]
+	results = format_many(formatter, ["hello", "world"])
+	assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_capabilities():
+	for formatter in [noformat, format_toml, format_ini, format_json]:
+		assert get_capabilities(formatter) == FormatterCapabilities(True, True, True, "cheap")
+
+	assert get_capabilities(format_python) == FormatterCapabilities(pure=True, process_safe=True)
+
+	# Formatters which declare nothing get conservative defaults.
+	def plugin(code: str, **config) -> str:
+		return code
+
+	assert get_capabilities(plugin) == FormatterCapabilities(False, False, False, "expensive")
+
+	plugin.capabilities = {"pure": True, "cost": "moderate", "unknown": 1}  # type: ignore[attr-defined]
+	assert get_capabilities(plugin) == FormatterCapabilities(pure=True, cost="moderate")
+
+	plugin.capabilities = {"pure": True, "cost": "free"}  # type: ignore[attr-defined]
+	assert get_capabilities(plugin) == FormatterCapabilities()
+
+	assert declare_capabilities(thread_safe=True)(plugin) is plugin
+	assert get_capabilities(plugin) == FormatterCapabilities(thread_safe=True)
+
+	with pytest.raises(ValueError, match="Unknown cost class 'free'"):
+		declare_capabilities(cost="free")
+
+
+def test_capabilities_process_safe():
+	config: SnippetFmtConfigDict = {"languages": {"python": {}, "toml": {}}, "directives": ["code-block"]}
+	assert _process_safe(CompiledConfig(config))
+
+	def plugin(code: str, **config) -> str:
+		return code
+
+	assert not _process_safe(CompiledConfig(config, formatters={"python": plugin}))
+
+
 @pytest.mark.parametrize("sort_imports", [True, False])
 def test_reformat_python(
 		tmp_pathplus: PathPlus,
@@ -107,3 +195,130 @@ def test_format_ini(code: str, expected: str):
 	assert format_ini(code) == code
 	assert format_ini(code, reformat=False) == code
 	assert format_ini(code, reformat=True) == expected
+
+
+def test_formate_config_cache(tmp_pathplus: PathPlus):
+	formate_toml = tmp_pathplus / "formate.toml"
+	formate_toml.write_text("[hooks]\nisort = 50\n")
+
+	cache = FormateConfigCache()
+	config = cache.load(formate_toml)
+	assert config["hooks"] == {"isort": 50}
+
+	with in_directory(tmp_pathplus):
+		assert cache.load("formate.toml") is config
+	assert (cache.hits, cache.misses) == (1, 1)
+
+	# Changing the file invalidates the entry.
+	formate_toml.write_text("[hooks]\ncollections-import-rewrite = 20\n")
+	st = formate_toml.stat()
+	os.utime(formate_toml, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+	assert cache.load(formate_toml)["hooks"] == {"collections-import-rewrite": 20}
+	assert (cache.hits, cache.misses) == (1, 2)
+
+	cache.clear()
+	assert (cache.hits, cache.misses) == (0, 0)
+
+	with pytest.raises(FileNotFoundError):
+		cache.load(tmp_pathplus / "missing.toml")
+
+
+def test_format_python_config_cache(tmp_pathplus: PathPlus):
+	(tmp_pathplus / "formate.toml").write_text("[hooks]\nisort = 50\n")
+	formate_config_cache.clear()
+
+	with in_directory(tmp_pathplus):
+		code = ">>> import os\n>>> import sys\n>>> print(sys.argv)\n['']"
+		assert format_python(code, reformat=True) == code
+
+	# The configuration is loaded once for the whole console session.
+	assert (formate_config_cache.hits, formate_config_cache.misses) == (0, 1)
+
+
+def test_python_snippet_pipeline(tmp_pathplus: PathPlus):
+	example_formate_toml = PathPlus(__file__).parent / "example_formate.toml"
+	(tmp_pathplus / "formate.toml").write_text(example_formate_toml.read_text())
+	formate_config_cache.clear()
+
+	with in_directory(tmp_pathplus):
+		pipeline = formate_config_cache.pipeline("formate.toml")
+		assert formate_config_cache.pipeline("formate.toml") is pipeline
+		assert pipeline.hooks
+
+		code = "import sys\nimport os\nprint( 'hello world' )"
+		assert pipeline(code) == '# stdlib\nimport os\nimport sys\n\nprint("hello world")\n'
+		assert pipeline(code, sort_imports=False) == 'import sys\nimport os\n\nprint("hello world")\n'
+
+		assert format_python(code, reformat=True) == pipeline(code)
+		assert format_python(">>> import sys\n>>> import os", reformat=True) == ">>> import sys\n>>> import os"
+		assert formate_config_cache.pipeline("formate.toml") is pipeline
+
+
+CONSOLE_PROMPTS = [
+		"import os",
+		"def f(x):\n    return x",
+		"f( 1 )",
+		"class A:\n  x=1",
+		"x = {'a':1,  'b' : 2}  # comment",
+		"for i in range(3): print(i)",
+		"# just a comment",
+		"   ",
+		"if True:\n    pass\nelse:\n    pass",
+		]
+
+
+def test_format_console_code(tmp_pathplus: PathPlus):
+	example_formate_toml = PathPlus(__file__).parent / "example_formate.toml"
+	(tmp_pathplus / "formate.toml").write_text(example_formate_toml.read_text())
+
+	with in_directory(tmp_pathplus):
+		pipeline = formate_config_cache.pipeline("formate.toml")
+
+	expected = [pipeline(code, sort_imports=False) for code in CONSOLE_PROMPTS]
+	calls: List[str] = []
+
+	def counting_pipeline(code: str, **kwargs) -> str:
+		calls.append(code)
+		return pipeline(code, **kwargs)
+
+	# All the prompts are reformatted with a single call to the pipeline.
+	assert _format_console_code(counting_pipeline, CONSOLE_PROMPTS) == expected  # type: ignore[arg-type]
+	assert len(calls) == 1
+
+	# Prompts which are only valid together, and prompts containing the marker, are left to be done one by one.
+	assert _format_console_code(pipeline, ["x = (", "1)"]) is None
+	assert _format_console_code(pipeline, ["x = 1", "# snippet-fmt: prompt 0"]) is None
+
+	with in_directory(tmp_pathplus):
+		session = "\n".join([">>> import os", ">>> print( os.sep )", '/', ">>> x = (", "... 1 +", '2'])
+		with pytest.raises(SyntaxError):
+			format_python(session, reformat=True)
+
+		session = "\n".join([">>> import os", ">>> print( os.sep )", '/', ">>> x = {'a':1,", "... 'b' : 2}"])
+		assert format_python(session, reformat=True) == "\n".join([
+				">>> import os",
+				'>>> print(os.sep)',
+				'/',
+				">>> x = {'a': 1, 'b': 2}",
+				])
+
+
+@pytest.mark.benchmark
+def test_format_console_code_benchmark(tmp_pathplus: PathPlus):
+	example_formate_toml = PathPlus(__file__).parent / "example_formate.toml"
+	(tmp_pathplus / "formate.toml").write_text(example_formate_toml.read_text())
+
+	with in_directory(tmp_pathplus):
+		pipeline = formate_config_cache.pipeline("formate.toml")
+
+	prompts = CONSOLE_PROMPTS * 20
+
+	start = time.perf_counter()
+	expected = [pipeline(code, sort_imports=False) for code in prompts]
+	one_by_one = time.perf_counter() - start
+
+	start = time.perf_counter()
+	assert _format_console_code(pipeline, prompts) == expected
+	batched = time.perf_counter() - start
+
+	assert batched < one_by_one / 2
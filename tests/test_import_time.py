@@ -0,0 +1,71 @@
+# stdlib
+import subprocess
+import sys
+from typing import Dict, List
+
+# 3rd party
+import dom_toml
+import pytest
+from domdf_python_tools.paths import PathPlus
+
+#: Modules which should only be imported when they are needed.
+HEAVY_MODULES = ("formate", "consolekit", "click", "tokenize_rt", "entrypoints", "dom_toml", "isort", "yapf")
+
+#: The maximum time, in seconds, ``import snippet_fmt`` may take.
+#: It took over 0.4s on a slow machine when everything was imported up front, and around 0.13s with lazy imports.
+IMPORT_TIME_BUDGET = 0.3
+
+
+def _import_times(args: List[str]) -> Dict[str, float]:
+	# Returns a mapping of module names to the cumulative time taken to import them, from ``-X importtime``.
+	process = subprocess.run(
+			[sys.executable, "-X", "importtime", *args],
+			stdout=subprocess.PIPE,
+			stderr=subprocess.PIPE,
+			universal_newlines=True,
+			)
+
+	times = {}
+	for line in process.stderr.splitlines():
+		if not line.startswith("import time:") or "|" not in line:
+			continue
+
+		_, cumulative, name = line.split('|')
+		if cumulative.strip().isdigit():
+			times[name.strip()] = int(cumulative) / 1e6
+
+	return times
+
+
+@pytest.mark.parametrize("module", ["snippet_fmt", "snippet_fmt.config", "snippet_fmt.formatters"])
+def test_no_heavy_imports(module: str):
+	times = _import_times(["-c", f"import {module}"])
+	assert module in times
+
+	for name in times:
+		assert name.split('.')[0] not in HEAVY_MODULES, f"{module} imports {name}"
+
+
+@pytest.mark.benchmark
+def test_import_time_budget():
+	# Take the best of a few runs, as the first may have to populate the filesystem cache.
+	best = min(_import_times(["-c", "import snippet_fmt"])["snippet_fmt"] for _ in range(5))
+	assert best < IMPORT_TIME_BUDGET
+
+
+def test_cli_rst_json_only(tmp_pathplus: PathPlus):
+	dom_toml.dump(
+			{"tool": {"snippet-fmt": {"languages": {"json": {}}, "directives": ["code-block"]}}},
+			tmp_pathplus / "pyproject.toml",
+			)
+	(tmp_pathplus / "example.rst").write_text('.. code-block:: json\n\n    {"a": 1}\n')
+
+	times = _import_times([
+			"-c",
+			"import os, sys; from snippet_fmt.__main__ import main; os.chdir(sys.argv[1]); main(['example.rst'])",
+			tmp_pathplus.as_posix(),
+			])
+
+	assert "snippet_fmt._runner" in times
+	for name in ("formate", "tokenize_rt", "snippet_fmt.docstring"):
+		assert name not in times
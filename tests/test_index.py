@@ -0,0 +1,197 @@
+# stdlib
+import time
+from typing import List
+
+# 3rd party
+import pytest
+from domdf_python_tools.paths import PathPlus, in_directory
+
+# this package
+import snippet_fmt.index
+from snippet_fmt.config import CompiledConfig, SnippetFmtConfigDict
+from snippet_fmt.index import Snippet, iter_snippets, iter_source_snippets
+from snippet_fmt.scanner import LineIndex
+
+source_dir = PathPlus(__file__).parent
+
+CONFIG: SnippetFmtConfigDict = {"languages": {"python": {}}, "directives": ["code-block", "code"]}
+
+SOURCE = """\
+Title
+=====
+
+.. code-block:: python
+    :caption: Example
+
+    print("hello world")
+
+Text
+
+  .. code:: JSON
+
+    {"key": "value"}
+
+
+.. code-block::
+
+\tcode
+"""
+
+
+def test_iter_source_snippets():
+	snippets = list(iter_source_snippets(SOURCE, CONFIG))
+
+	assert [s.language for s in snippets] == ["python", "JSON", None]
+	assert [s.directive for s in snippets] == ["code-block", "code", "code-block"]
+	assert [s.line for s in snippets] == [4, 11, 16]
+	assert [s.function_name for s in snippets] == [None, None, None]
+	assert [s.size for s in snippets] == [26, 23, 6]
+
+	assert SOURCE[snippets[0].start:snippets[0].end] == (
+			'.. code-block:: python\n    :caption: Example\n\n    print("hello world")\n\n'
+			)
+	assert SOURCE[snippets[1].start:snippets[1].end] == '  .. code:: JSON\n\n    {"key": "value"}\n\n\n'
+	assert snippets[2].end == len(SOURCE)
+
+
+def test_iter_source_snippets_trailing_whitespace():
+	source = SOURCE.replace("Text", "Text  ").replace("hello world\")", "hello world\")\t")
+	snippets = list(iter_source_snippets(source, CONFIG))
+
+	# The offsets are into the file as it is, rather than after the whitespace is stripped.
+	assert [s.line for s in snippets] == [4, 11, 16]
+	assert source[snippets[0].start:snippets[0].end].endswith("print(\"hello world\")\t\n\n")
+	assert source[snippets[1].start:].startswith("  .. code:: JSON\n")
+
+
+def test_snippet():
+	snippet = Snippet("python", "code-block", 4, 26, None, 13, 75)
+	assert repr(snippet) == (
+			"Snippet(language='python', directive='code-block', line=4, size=26, function_name=None, start=13, end=75)"
+			)
+	assert snippet == Snippet("python", "code-block", 4, 26, None, 13, 75)
+	assert snippet != Snippet("python", "code-block", 5, 26, None, 13, 75)
+
+	with pytest.raises(AttributeError):
+		snippet.lang = "python"  # type: ignore[attr-defined]
+
+
+def test_iter_snippets_file(tmp_pathplus: PathPlus):
+	filename = tmp_pathplus / "example.rst"
+	filename.write_text(SOURCE)
+	assert list(iter_snippets(filename, CONFIG)) == list(iter_source_snippets(SOURCE, CONFIG))
+
+	# A string is a filename, as elsewhere.
+	with in_directory(tmp_pathplus):
+		assert list(iter_snippets("example.rst", CONFIG)) == list(iter_source_snippets(SOURCE, CONFIG))
+
+	# Files without any of the directives aren't read.
+	filename.write_text("Title\n=====\n\n.. sourcecode:: python\n\n    print()\n")
+	assert list(iter_snippets(filename, CONFIG)) == []
+
+
+def test_iter_snippets_python(tmp_pathplus: PathPlus):
+	source = '''\
+"""
+.. code-block:: python
+
+\tprint()
+"""
+
+
+class Foo:
+
+\tdef bar(self):
+\t\t"""
+\t\tDocstring.
+
+\t\t.. code:: toml
+
+\t\t\tkey = "value"
+\t\t"""
+
+\tdef baz(self):
+\t\t"Not a multi-line docstring. .. code:: python"
+'''
+	filename = tmp_pathplus / "example.py"
+	filename.write_text(source)
+
+	snippets = list(iter_snippets(filename, CONFIG))
+	assert [s.function_name for s in snippets] == [None, "bar"]
+	assert [s.line for s in snippets] == [2, 14]
+	assert source[snippets[0].start:snippets[0].end] == ".. code-block:: python\n\n\tprint()\n"
+	assert source[snippets[1].start:snippets[1].end] == '\t\t.. code:: toml\n\n\t\t\tkey = "value"\n'
+
+	filename.write_text(source + "def foo(:\n\t'.. code:: python'\n")
+	with pytest.raises(SyntaxError):
+		list(iter_snippets(filename, CONFIG))
+
+
+def _explode(code: str, **config) -> str:
+	raise AssertionError("The formatter shouldn't be called")
+
+
+def test_iter_snippets_no_formatting():
+	compiled = CompiledConfig({**CONFIG, "languages": {"python": {"reformat": True}}}, formatters={"python": _explode})
+	assert len(list(iter_source_snippets(SOURCE, compiled))) == 3
+
+
+def _large_document() -> str:
+	# Mostly prose, with a code block in each section.
+	paragraph = "Lorem ipsum dolor sit amet, consectetur adipiscing elit.\n" * 40
+	block = '.. code-block:: python\n\n    print("hello world")\n\n'
+	return f"Title\n=====\n\n{paragraph}\n{block}" * 50
+
+
+def test_iter_snippets_large_document(tmp_pathplus: PathPlus, monkeypatch):
+	filename = tmp_pathplus / "example.rst"
+	filename.write_text(_large_document())
+
+	indexes: List[LineIndex] = []
+
+	class RecordingLineIndex(LineIndex):
+
+		def __init__(self, source: str):
+			super().__init__(source)
+			indexes.append(self)
+
+	monkeypatch.setattr(snippet_fmt.index, "LineIndex", RecordingLineIndex)
+
+	snippets = list(iter_snippets(filename, CONFIG))
+	assert [snippet.line for snippet in snippets] == [45 + 48 * idx for idx in range(50)]
+
+	# Line numbers are counted while scanning, so a document with no whitespace to strip is never indexed.
+	assert indexes == []
+
+
+@pytest.mark.benchmark
+def test_iter_snippets_speed(tmp_pathplus: PathPlus):
+	document = _large_document()
+
+	filenames: List[PathPlus] = []
+	for idx in range(50):
+		filenames.append(tmp_pathplus / f"{idx}.rst")
+		filenames[-1].write_text(document)
+
+	def read() -> None:
+		for filename in filenames:
+			filename.read_text().splitlines()
+
+	def index() -> None:
+		for filename in filenames:
+			for _ in iter_snippets(filename, CONFIG):
+				pass
+
+	timings = []
+	for func in (read, index):
+		best = float("inf")
+
+		for _ in range(3):
+			start = time.perf_counter()
+			func()
+			best = min(best, time.perf_counter() - start)
+
+		timings.append(best)
+
+	# Finding the code blocks takes a small multiple of the time taken to read the files and split them into lines.
+	assert timings[1] < timings[0] * 15
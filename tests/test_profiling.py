@@ -0,0 +1,262 @@
+# stdlib
+import json
+import os
+import threading
+from typing import List
+
+# 3rd party
+import dom_toml
+import pytest
+from consolekit.testing import CliRunner
+from domdf_python_tools.paths import PathPlus, in_directory
+
+# this package
+from snippet_fmt import PyReformatter, Reformatter, SnippetFmtConfigDict, reformat_file
+from snippet_fmt.__main__ import main
+from snippet_fmt.profiling import Profiler, Span, format_report, percentile, profiler, trace, write_trace
+from snippet_fmt.registry import formatter_registry
+
+CONFIG: SnippetFmtConfigDict = {"languages": {"json": {"reformat": True}}, "directives": ["code-block"]}
+
+
+@pytest.fixture()
+def enabled_profiler():
+	# Otherwise the first test to compile a configuration would also time loading the entry points.
+	formatter_registry.load_extra()
+
+	profiler.clear()
+	profiler.enabled = True
+
+	try:
+		yield profiler
+	finally:
+		profiler.enabled = False
+		profiler.clear()
+
+
+def test_profiler():
+	p = Profiler()
+
+	with p.span("format", "python", "example.rst"):
+		pass
+
+	assert p.spans == []
+	assert repr(p) == "<Profiler: disabled, 0 spans>"
+
+	p.enabled = True
+	with p.span("format", "python", "example.rst"):
+		pass
+
+	with pytest.raises(ValueError, match="error"):
+		with p.span("read"):
+			raise ValueError("error")
+
+	assert [(span.phase, span.language, span.filename) for span in p.spans] == [
+			("format", "python", "example.rst"),
+			("read", None, None),
+			]
+	assert all(span.duration >= 0 for span in p.spans)
+	assert {(span.pid, span.tid) for span in p.spans} == {(os.getpid(), threading.get_ident())}
+	assert repr(p) == "<Profiler: enabled, 2 spans>"
+
+	assert len(p.take()) == 2
+	assert p.spans == []
+
+
+def test_percentile():
+	values = [float(value) for value in range(1, 21)]
+
+	assert percentile(values, 50) == 10
+	assert percentile(values, 95) == 19
+	assert percentile(values, 100) == 20
+	assert percentile(values, 0) == 1
+	assert percentile([5.0], 95) == 5
+
+
+def test_format_report():
+	spans = [
+			Span("format", "python", "a.rst", 0, 0.001, 1, 1),
+			Span("format", "python", "b.rst", 0, 0.003, 1, 1),
+			Span("format", None, "b.rst", 0, 0.0005, 1, 1),
+			Span("format_many", "json", "b.rst", 0, 0.01, 1, 1),
+			Span("read", None, "a.rst", 0, 0.002, 1, 1),
+			]
+
+	report = format_report(spans)
+	step_table, language_table, file_table = report.rstrip('\n').split("\n\n")
+
+	assert step_table.splitlines() == [
+			"Step         Count  Total (ms)  p50 (ms)  p95 (ms)",
+			"-----------  -----  ----------  --------  --------",
+			"format_many      1      10.000    10.000    10.000",
+			"format           3       4.500     1.000     3.000",
+			"read             1       2.000     2.000     2.000",
+			]
+
+	assert [line.split()[0] for line in language_table.splitlines()[2:]] == ["json", "python", "<none>"]
+	assert [line.split()[:2] for line in file_table.splitlines()[2:]] == [["b.rst", '3'], ["a.rst", '1']]
+
+
+def test_reformatter_spans(enabled_profiler: Profiler):
+	source = '.. code-block:: json\n\n    {"key":   "value"}\n\n.. code-block:: json\n\n    [1,   2]\n'
+
+	r = Reformatter(source, "example.rst", CONFIG)
+	assert r.run()
+	r.get_diff()
+
+	phases = [span.phase for span in enabled_profiler.spans]
+	assert phases == ["scan", "format", "format", "get_diff"]
+	assert {span.filename for span in enabled_profiler.spans} == {"example.rst"}
+	assert [span.language for span in enabled_profiler.spans if span.phase == "format"] == ["json", "json"]
+
+
+def test_docstring_spans(tmp_pathplus: PathPlus, enabled_profiler: Profiler):
+	filename = tmp_pathplus / "example.py"
+	filename.write_text('def foo():\n\t"""\n\t.. code-block:: json\n\n\t\t[1,   2]\n\t"""\n')
+
+	r = PyReformatter(filename, CONFIG)
+	assert r.run()
+
+	phases = [span.phase for span in enabled_profiler.spans]
+	assert phases == ["read", "find_docstrings", "scan", "format", "docstring"]
+
+
+def test_write_trace(tmp_pathplus: PathPlus):
+	spans = [
+			Span("file", None, "a.rst", 10.5, 0.25, 100, 1),
+			Span("format", "python", "a.rst", 10.625, 0.001, 100, 1),
+			Span("file", None, "b.rst", 10.5, 0.5, os.getpid(), 2),
+			]
+
+	write_trace(spans, tmp_pathplus / "out.json")
+	trace_data = json.loads((tmp_pathplus / "out.json").read_text())
+
+	assert trace_data["displayTimeUnit"] == "ms"
+	metadata = [event for event in trace_data["traceEvents"] if event["ph"] == 'M']
+	events = [event for event in trace_data["traceEvents"] if event["ph"] == 'X']
+
+	assert {event["pid"]: event["args"]["name"] for event in metadata} == {
+			100: "worker 100",
+			os.getpid(): "snippet-fmt",
+			}
+
+	assert events[0] == {
+			"name": "file",
+			"cat": "file",
+			"ph": 'X',
+			"ts": 0,
+			"dur": 250000,
+			"pid": 100,
+			"tid": 1,
+			"args": {"file": "a.rst"},
+			}
+	assert events[1]["name"] == "format (python)"
+	assert events[1]["args"] == {"file": "a.rst", "language": "python"}
+	assert (events[1]["ts"], events[1]["dur"]) == (125000, 1000)
+	assert (events[2]["pid"], events[2]["tid"]) == (os.getpid(), 2)
+
+
+def test_trace(tmp_pathplus: PathPlus):
+	filename = tmp_pathplus / "example.rst"
+	filename.write_text('.. code-block:: json\n\n    {"key":   "value"}\n')
+	trace_file = tmp_pathplus / "out.json"
+	formatter_registry.load_extra()
+
+	with trace(trace_file) as p:
+		assert p is profiler
+		assert profiler.enabled
+		reformat_file(filename, CONFIG)
+
+	assert not profiler.enabled
+
+	events = json.loads(trace_file.read_text())["traceEvents"]
+	phases = [event["cat"] for event in events if event["ph"] == 'X']
+	assert phases == ["read", "scan", "format", "get_diff", "to_file"]
+	profiler.clear()
+
+
+@pytest.mark.parametrize("jobs", ['1', '2'])
+def test_cli_profile(tmp_pathplus: PathPlus, jobs: str):
+	dom_toml.dump({"tool": {"snippet-fmt": CONFIG}}, tmp_pathplus / "pyproject.toml")
+
+	filenames: List[str] = []
+	for idx in range(8):
+		filenames.append(f"{idx}.rst")
+		(tmp_pathplus / filenames[-1]).write_text('.. code-block:: json\n\n    {"key":   "value"}\n')
+
+	# So the entry points are loaded (just once) in the main process, before any workers are started.
+	formatter_registry.clear()
+
+	with in_directory(tmp_pathplus):
+		runner = CliRunner(mix_stderr=False)
+		result = runner.invoke(main, args=[*filenames, "--profile", "--no-cache", "--jobs", jobs])
+
+	assert result.exit_code == 1
+	assert result.stdout == ''
+
+	step_table, language_table, file_table = result.stderr.rstrip('\n').split("\n\n")
+	steps = {line.split()[0]: int(line.split()[1]) for line in step_table.splitlines()[2:]}
+	assert steps["file"] == steps["read"] == steps["scan"] == steps["format"] == steps["to_file"] == 8
+	assert steps["load_formatters"] == 1
+
+	assert language_table.splitlines()[2].split()[:2] == ["json", '8']
+	assert len(file_table.splitlines()) == 10
+
+	# Profiling is switched off again afterwards.
+	assert not profiler.enabled
+
+
+def test_cli_no_profile(tmp_pathplus: PathPlus):
+	dom_toml.dump({"tool": {"snippet-fmt": CONFIG}}, tmp_pathplus / "pyproject.toml")
+	(tmp_pathplus / "example.rst").write_text('.. code-block:: json\n\n    {"key":   "value"}\n')
+
+	with in_directory(tmp_pathplus):
+		runner = CliRunner(mix_stderr=False)
+		result = runner.invoke(main, args=["example.rst", "--no-cache"])
+
+	assert result.exit_code == 1
+	assert result.stderr == ''
+	assert profiler.spans == []
+
+
+@pytest.mark.parametrize("jobs", ['1', '2'])
+def test_cli_trace_file(tmp_pathplus: PathPlus, jobs: str):
+	dom_toml.dump({"tool": {"snippet-fmt": CONFIG}}, tmp_pathplus / "pyproject.toml")
+
+	filenames: List[str] = []
+	for idx in range(8):
+		filenames.append(f"{idx}.rst")
+		(tmp_pathplus / filenames[-1]).write_text('.. code-block:: json\n\n    {"key":   "value"}\n')
+
+	formatter_registry.clear()
+
+	with in_directory(tmp_pathplus):
+		runner = CliRunner(mix_stderr=False)
+		result = runner.invoke(main, args=[*filenames, "--trace-file", "out.json", "--no-cache", "--jobs", jobs])
+
+	assert result.exit_code == 1
+	assert result.stderr == ''
+
+	events = json.loads((tmp_pathplus / "out.json").read_text())["traceEvents"]
+	files = [event for event in events if event["ph"] == 'X' and event["cat"] == "file"]
+	assert sorted(event["args"]["file"] for event in files) == sorted(
+			(tmp_pathplus / filename).as_posix() for filename in filenames
+			)
+	assert all(event["ts"] >= 0 for event in events if event["ph"] == 'X')
+
+	# Each worker process has its own row.
+	pids = {event["pid"] for event in files}
+	if jobs == '1':
+		assert pids == {os.getpid()}
+	else:
+		assert len(pids) == 2
+		assert os.getpid() not in pids
+
+	# Spans recorded in the main process before the workers started appear exactly once.
+	spans = [event for event in events if event["ph"] == 'X']
+	assert len({(event["cat"], event["ts"], event["dur"]) for event in spans}) == len(spans)
+	main_spans = [event["cat"] for event in spans if event["pid"] == os.getpid()]
+	assert main_spans.count("load_formatters") == 1
+
+	assert not profiler.enabled
+	assert profiler.spans == []
@@ -0,0 +1,94 @@
+# stdlib
+import sys
+from typing import Iterator
+
+# 3rd party
+import pytest
+from domdf_python_tools.paths import PathPlus, TemporaryPathPlus
+
+# this package
+from snippet_fmt import Reformatter, SnippetFmtConfigDict, cache
+from snippet_fmt.formatters import format_python
+from snippet_fmt.registry import formatter_registry
+
+
+@pytest.fixture()
+def demo_distribution(monkeypatch) -> Iterator[PathPlus]:
+	with TemporaryPathPlus() as tmpdir:
+		monkeypatch.syspath_prepend(str(tmpdir))
+
+		dist_info = tmpdir / "snippet_fmt_registry_demo-0.0.0.dist-info"
+		dist_info.maybe_make(parents=True)
+		(dist_info / "entry_points.txt").write_lines([
+				"[snippet_fmt.formatters]",
+				"python3 = snippet_fmt_registry_demo:fake_format",
+				"broken = snippet_fmt_no_such_module:format",
+				])
+
+		(tmpdir / "snippet_fmt_registry_demo.py").write_lines([
+				"def fake_format(*args, **kwargs):",
+				"\treturn 'Hello World'",
+				])
+
+		yield tmpdir
+
+	sys.modules.pop("snippet_fmt_registry_demo", None)
+
+
+def test_get_entry_points(demo_distribution: PathPlus, cache_dir: PathPlus, monkeypatch):
+	records = cache.get_entry_points()
+	assert (
+			"snippet_fmt.formatters",
+			"python3",
+			"snippet_fmt_registry_demo:fake_format",
+			"snippet_fmt_registry_demo",
+			"0.0.0",
+			) in records
+
+	# Cached in memory
+	assert cache.get_entry_points() is records
+
+	# Cached on disk
+	index_files = list(cache_dir.glob("entry_points.*.json"))
+	assert len(index_files) == 1
+
+	monkeypatch.setattr(cache, "_entry_points", None)
+	monkeypatch.setattr(cache, "_scan_entry_points", lambda: pytest.fail("Entry points were rescanned"))
+	assert cache.get_entry_points() == records
+
+
+def test_registry(demo_distribution: PathPlus):
+	config: SnippetFmtConfigDict = {"languages": {"python3": {}}, "directives": ["code-block"]}
+
+	formatters = formatter_registry.get_formatters()
+	assert formatters["python3"].__module__ == "snippet_fmt_registry_demo"
+	assert formatters["python"] is format_python
+	assert "broken" not in formatters
+
+	# Loaded once, and shared by every reformatter.
+	assert formatter_registry.load_extra() is formatter_registry.load_extra()
+	assert Reformatter('', "a.rst", config).session.get_formatter("python3")[0] is formatters["python3"]
+
+	# Callers get their own copy
+	formatters["python3"] = format_python
+	assert formatter_registry.get_formatters()["python3"] is not format_python
+
+
+def test_registry_sys_path_changes():
+	formatter_registry.load_extra()
+
+	with TemporaryPathPlus() as tmpdir:
+		sys.path.insert(0, str(tmpdir))
+		try:
+			dist_info = tmpdir / "snippet_fmt_other_demo-0.0.0.dist-info"
+			dist_info.maybe_make(parents=True)
+			(dist_info / "entry_points.txt").write_lines([
+					"[snippet_fmt.formatters]",
+					"demo-language = snippet_fmt.formatters:noformat",
+					])
+
+			assert "demo-language" in formatter_registry.get_formatters()
+		finally:
+			sys.path.remove(str(tmpdir))
+
+	assert "demo-language" not in formatter_registry.get_formatters()
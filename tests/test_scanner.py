@@ -0,0 +1,275 @@
+# stdlib
+import re
+from typing import Callable, List, Optional
+
+# 3rd party
+import pytest
+from domdf_python_tools.paths import PathPlus
+
+# this package
+from snippet_fmt import PyReformatter, Reformatter, RSTReformatter, SnippetFmtConfigDict
+from snippet_fmt import scanner as scanner_module
+from snippet_fmt.scanner import DirectiveScanner, LineIndex
+
+scanner = DirectiveScanner(["code", "code-block", "sourcecode"])
+
+
+def test_iter_blocks():
+	source = '\n'.join([
+			"Title",
+			"=====",
+			'',
+			"  .. code-block:: python",
+			"      :caption: Example",
+			"      :linenos:",
+			'',
+			"      print('hello world')",
+			'',
+			"          # comment",
+			'',
+			"  Text",
+			".. code:: TOML",
+			'',
+			"\tkey = 'value'",
+			'',
+			])
+
+	blocks = list(scanner.iter_blocks(source))
+	assert len(blocks) == 2
+
+	first, second = blocks
+	assert first.indent == "  "
+	assert first.body_indent == "    "
+	assert first.directive == "code-block"
+	assert first.lang == "python"
+	assert source[first.options_start:first.options_end] == "      :caption: Example\n      :linenos:\n"
+	assert first.before == "  .. code-block:: python\n      :caption: Example\n      :linenos:\n\n"
+	assert first.code == "      print('hello world')\n\n          # comment\n\n"
+
+	assert second.indent == ''
+	assert second.body_indent == '\t'
+	assert second.directive == "code"
+	assert second.lang == "TOML"
+	assert second.options_start == second.options_end
+	assert second.code == "\tkey = 'value'\n"
+	assert second.end == len(source)
+
+
+@pytest.mark.parametrize(
+		"source",
+		[
+				pytest.param("Hi\n\n.. code-block:: python\n\nText\n", id="no_code"),
+				pytest.param(".. code-block:: python\n", id="eof"),
+				pytest.param(".. code-block:: python\n    print()", id="no_trailing_newline"),
+				pytest.param(".. code-block:: c++\n\n    int x;\n", id="invalid_language"),
+				pytest.param(".. code-block :: python\n\n    print()\n", id="space_before_colons"),
+				pytest.param(".. literalinclude:: python\n\n    print()\n", id="other_directive"),
+				pytest.param(".. code-block:: python\n        :caption: Example\n\n    print()\n", id="dedented_code"),
+				],
+		)
+def test_iter_blocks_no_match(source: str):
+	assert list(scanner.iter_blocks(source)) == []
+
+
+def test_iter_blocks_no_language():
+	source = ".. code-block::\n\n\tcode\n\tmore code\n"
+	block, = scanner.iter_blocks(source)
+	assert block.lang is None
+	assert block.code == "\tcode\n\tmore code\n"
+
+
+def test_option_body_indent():
+	# Option lines must share the body indentation.
+	source = ".. code-block:: python\n    :caption: Example\n      :linenos:\n\n    print()\n"
+	block, = scanner.iter_blocks(source)
+	assert source[block.options_start:block.options_end] == "    :caption: Example\n"
+	assert block.code == "      :linenos:\n\n"
+
+	source = ".. code-block:: python\n    :caption: Example\n    :linenos:\n\n    print()\n"
+	block, = scanner.iter_blocks(source)
+	assert block.code == "    print()\n"
+
+
+def test_no_code_doesnt_crash():
+	config: SnippetFmtConfigDict = {"languages": {"python": {}}, "directives": ["code-block"]}
+	source = "Hi\n\n.. code-block:: python\n\nText\n"
+
+	r = Reformatter(source, "example.rst", config)
+	assert not r.run()
+	assert r.to_string() == source
+
+
+@pytest.mark.parametrize(
+		"data, expected",
+		[
+				pytest.param(b".. code-block:: python\n", True, id="code_block"),
+				pytest.param(b"\t..  code::\n", True, id="code"),
+				pytest.param(b"Text .. sourcecode:: and more", True, id="inline"),
+				pytest.param(b".. code-cell:: python\n", False, id="other_directive"),
+				pytest.param(b".. code-block :: python\n", False, id="space_before_colons"),
+				pytest.param(b"code-block::", False, id="no_dots"),
+				pytest.param(b'', False, id="empty"),
+				],
+		)
+def test_has_markers(data: bytes, expected: bool):
+	assert scanner.has_markers(data) is expected
+	assert DirectiveScanner([]).has_markers(data) is False
+
+
+@pytest.mark.parametrize("mmap_threshold", [0, 1024 * 1024])
+def test_file_has_markers(tmp_pathplus: PathPlus, monkeypatch, mmap_threshold: int):
+	monkeypatch.setattr(scanner_module, "MMAP_THRESHOLD", mmap_threshold)
+
+	filename = tmp_pathplus / "example.rst"
+	filename.write_text("Title\n=====\n\n" * 1000 + ".. code-block:: python\n\n    print()\n")
+	assert scanner.file_has_markers(filename)
+
+	filename.write_text("Title\n=====\n\n" * 1000 + ".. note::\n\n    Text\n")
+	assert not scanner.file_has_markers(filename)
+
+
+def test_prefilter(tmp_pathplus: PathPlus):
+	config: SnippetFmtConfigDict = {"languages": {"python": {}}, "directives": ["code-block"]}
+
+	filename = tmp_pathplus / "example.rst"
+	filename.write_text("Title  \n=====\n\n.. code:: python\n\n    print()\n")
+
+	r = RSTReformatter(filename, config)
+	assert r.prefiltered
+	assert r._source is None
+	assert not r.run()
+	assert r._source is None
+	assert r.to_string() == filename.read_text()
+
+	filename = tmp_pathplus / "example.py"
+	filename.write_text('def foo():\n\t"""\n\tDocstring.  \n\t"""\n')
+
+	r = PyReformatter(filename, config)
+	assert r.prefiltered
+	assert not r.run()
+	assert r.to_string() == filename.read_text()
+
+	filename.write_text('def foo():\n\t"""\n\t.. code-block:: python\n\n\t\tprint( )\n\t"""\n')
+	r = PyReformatter(filename, config)
+	assert not r.prefiltered
+
+
+def test_lazy_source():
+	config: SnippetFmtConfigDict = {"languages": {"json": {"reformat": True}}, "directives": ["code-block"]}
+	reads: List[str] = []
+
+	def read() -> str:
+		reads.append("example.rst")
+		return '.. code-block:: json\n\n    [1,   2]\n'
+
+	r = Reformatter(read, "example.rst", config)
+	assert reads == []
+
+	# The source is read the first time it is needed, and only once.
+	assert r.run()
+	assert r.to_string() == '.. code-block:: json\n\n    [1, 2]\n'
+	assert r.get_diff()
+	assert reads == ["example.rst"]
+
+
+def test_line_index():
+	source = "Title\n=====\n\nText ünïcödé\n"
+	index = LineIndex(source)
+
+	assert len(index) == 5
+	assert repr(index) == "<LineIndex: 5 lines>"
+
+	for offset in range(len(source) + 1):
+		assert index.lineno(offset) == source[:offset].count('\n') + 1
+
+	assert [index.offset(lineno) for lineno in range(1, 7)] == [0, 6, 12, 13, len(source), len(source)]
+	assert [index.line(lineno) for lineno in range(1, 6)] == ["Title", "=====", '', "Text ünïcödé", '']
+
+	index = LineIndex("No newline")
+	assert len(index) == 1
+	assert index.lineno(5) == 1
+	assert index.line(1) == "No newline"
+
+
+class _CountingStr(str):
+	# Counts the characters examined by the string methods the scanner uses.
+	# The regular expressions are counted by :class:`~._CountingPattern`.
+
+	examined = 0
+
+	def find(self, sub: str, start: int = 0, end: Optional[int] = None) -> int:  # type: ignore[override]
+		result = super().find(sub, start, end)
+		stop = (len(self) if end is None else end) if result == -1 else result + len(sub)
+		_CountingStr.examined += stop - start
+		return result
+
+	def rfind(self, sub: str, start: int = 0, end: Optional[int] = None) -> int:  # type: ignore[override]
+		result = super().rfind(sub, start, end)
+		_CountingStr.examined += (len(self) if end is None else end) - (start if result == -1 else result)
+		return result
+
+	def startswith(self, prefix: str, start: int = 0) -> bool:  # type: ignore[override]
+		_CountingStr.examined += len(prefix)
+		return super().startswith(prefix, start)
+
+
+class _CountingPattern:
+	# Wraps a compiled regular expression, counting the characters examined by each match.
+
+	def __init__(self, pattern: "re.Pattern[str]"):
+		self.pattern = pattern
+
+	def match(self, source: str, pos: int = 0, endpos: int = -1) -> "Optional[re.Match[str]]":
+		# The patterns only match within a single line, so can't examine more than the rest of the line.
+		line_end = source.find('\n', pos)
+		_CountingStr.examined += (len(source) if line_end == -1 else line_end) - pos
+		return self.pattern.match(source, pos) if endpos == -1 else self.pattern.match(source, pos, endpos)
+
+
+def _deep_options(n: int) -> str:
+	indent = ' ' * 200
+	return f"{indent}.. code-block:: python\n" + f"{indent}    :a:\n" * n + f"{indent}x\n"
+
+
+def _many_directives(n: int) -> str:
+	return ".. code-block:: python\n" * n
+
+
+def _many_unterminated(n: int) -> str:
+	return ".. code-block:: python\n\n" * n + "    print()"
+
+
+def _long_block(n: int) -> str:
+	return ".. code-block:: python\n\n" + "    print()\n\n" * n
+
+
+def _many_blocks(n: int) -> str:
+	return ".. code-block:: python\n    :caption: Example\n\n    print()\n\n" * n
+
+
+@pytest.mark.parametrize(
+		"make_source",
+		[
+				pytest.param(_deep_options, id="deep_options"),
+				pytest.param(_many_directives, id="many_directives"),
+				pytest.param(_many_unterminated, id="many_unterminated"),
+				pytest.param(_long_block, id="long_block"),
+				pytest.param(_many_blocks, id="many_blocks"),
+				],
+		)
+def test_linear_time(make_source: Callable[[int], str], monkeypatch):
+	counting_scanner = DirectiveScanner(scanner.directives)
+	monkeypatch.setattr(counting_scanner, "_directive_line", _CountingPattern(counting_scanner._directive_line))
+	monkeypatch.setattr(scanner_module, "_whitespace", _CountingPattern(scanner_module._whitespace))
+
+	examined: List[int] = []
+
+	for n in (2000, 16000):
+		source = _CountingStr(make_source(n))
+		_CountingStr.examined = 0
+		list(counting_scanner.iter_blocks(source))
+		examined.append(_CountingStr.examined)
+
+	# 8 times the input should need around 8 times as many characters to be examined;
+	# quadratic behaviour would be ~64 times.
+	assert examined[1] < examined[0] * 9
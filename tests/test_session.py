@@ -0,0 +1,60 @@
+# 3rd party
+from domdf_python_tools.paths import PathPlus
+
+# this package
+from snippet_fmt import DocstringReformatter, PyReformatter, SnippetFmtConfigDict
+from snippet_fmt.formatters import format_python, format_toml, noformat
+from snippet_fmt.session import FormattingSession
+
+CONFIG: SnippetFmtConfigDict = {
+		"languages": {"python": {}, "TOML": {"reformat": True}},
+		"directives": ["code-block"],
+		}
+
+
+def test_get_formatter():
+	session = FormattingSession(CONFIG)
+
+	assert session.get_formatter("python") == (format_python, {})
+	assert session.get_formatter("TOML") == (format_toml, {"reformat": True})
+	assert session.get_formatter("toml") == (noformat, {})
+	assert session.get_formatter("json") == (noformat, {})
+	assert session.get_formatter(None) == (noformat, {})
+
+	assert session.get_formatter("TOML") is session.get_formatter("TOML")
+
+
+def test_docstrings_share_session(tmp_pathplus: PathPlus, monkeypatch):
+	filename = tmp_pathplus / "example.py"
+	filename.write_lines([
+			"def foo():",
+			'\t"""',
+			"\t.. code-block:: python",
+			'',
+			"\t\tprint('hello world')",
+			'\t"""',
+			'',
+			"def bar():",
+			'\t"""',
+			"\t.. code-block:: python",
+			'',
+			"\t\tprint('hello world'",
+			'\t"""',
+			])
+
+	sessions = []
+	original_init = DocstringReformatter.__init__
+
+	def init(self, *args, **kwargs):
+		original_init(self, *args, **kwargs)
+		sessions.append(self.session)
+
+	monkeypatch.setattr(DocstringReformatter, "__init__", init)
+
+	session = FormattingSession(CONFIG)
+	r = PyReformatter(filename, CONFIG, session)
+	assert not r.run()
+	assert len(r.errors) == 1
+
+	assert len(sessions) == 2
+	assert all(s is session for s in sessions)
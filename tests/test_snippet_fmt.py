@@ -1,6 +1,9 @@
 # stdlib
+import difflib
 import shutil
 import textwrap
+import time
+import tracemalloc
 from pathlib import Path
 from typing import Dict, Iterator, List, Union, no_type_check
 
@@ -13,12 +16,24 @@ from coincidence.params import param
 from coincidence.selectors import max_version, min_version
 from consolekit.terminal_colours import strip_ansi
 from consolekit.testing import CliRunner, Result
+from consolekit.utils import coloured_diff
 from domdf_python_tools.paths import PathPlus, TemporaryPathPlus, in_directory
+from domdf_python_tools.stringlist import StringList
 
 # this package
-from snippet_fmt import PyReformatter, SnippetFmtConfigDict, reformat_docstrings, reformat_file
+import snippet_fmt._runner
+from snippet_fmt import (
+		PyReformatter,
+		Reformatter,
+		RSTReformatter,
+		SnippetFmtConfigDict,
+		_normalise_whitespace,
+		reformat_docstrings,
+		reformat_file
+		)
 from snippet_fmt.__main__ import main
 from snippet_fmt.config import load_toml
+from snippet_fmt.scanner import LineIndex
 from tests.test_config import PYPROJECT_LANGUAGES_A
 
 source_dir = PathPlus(__file__).parent
@@ -535,6 +550,177 @@ class TestCLI:
 		# mtime should be the same
 		assert py_filename.stat().st_mtime == st.st_mtime
 
+	@pytest.mark.parametrize("jobs", ['2', "auto"])
+	def test_jobs(self, tmp_pathplus_clean: PathPlus, jobs: str):
+		languages = {"python": {"reformat": True}, "toml": {"reformat": True}, "json": {"reformat": True}}
+
+		for directory in ("serial", "parallel"):
+			(tmp_pathplus_clean / directory).maybe_make()
+			(tmp_pathplus_clean / directory / "formate.toml").write_text(
+					(source_dir / "example_formate.toml").read_text()
+					)
+			dom_toml.dump(
+					{"tool": {"snippet-fmt": {"languages": languages, "directives": ["code-block"]}}},
+					tmp_pathplus_clean / directory / "pyproject.toml",
+					)
+
+			filenames = []
+			for idx in range(6):
+				for source in ("example.rst", "py_code.rst"):
+					filenames.append(f"{idx}_{source}")
+					(tmp_pathplus_clean / directory / filenames[-1]).write_text((source_dir / source).read_text())
+
+		results = {}
+
+		for directory, args in [("serial", []), ("parallel", ["--jobs", jobs])]:
+			with in_directory(tmp_pathplus_clean / directory):
+				runner = CliRunner(mix_stderr=False)
+				results[directory] = runner.invoke(
+						main,
+						args=[*filenames, "--no-colour", "--diff", "--verbose", *args],
+						)
+
+		serial, parallel = results["serial"], results["parallel"]
+		assert parallel.exit_code == serial.exit_code == 1
+		assert parallel.stdout.replace("parallel", "serial") == serial.stdout
+		assert parallel.stderr.replace("parallel", "serial") == serial.stderr
+
+		for filename in filenames:
+			serial_file = tmp_pathplus_clean / "serial" / filename
+			assert (tmp_pathplus_clean / "parallel" / filename).read_text() == serial_file.read_text()
+
+	def test_jobs_invalid(self, tmp_pathplus_clean: PathPlus):
+		with in_directory(tmp_pathplus_clean):
+			(tmp_pathplus_clean / "pyproject.toml").write_clean('')
+			runner = CliRunner(mix_stderr=False)
+			result = runner.invoke(main, args=["example.rst", "--jobs", '0'])
+
+		assert result.exit_code == 2
+		assert "Invalid value for '--jobs'" in result.stderr
+
+	def test_prefilter(self, tmp_pathplus_clean: PathPlus):
+		dom_toml.dump(
+				{"tool": {"snippet-fmt": {"languages": {"python": {}}, "directives": ["code-block"]}}},
+				tmp_pathplus_clean / "pyproject.toml",
+				)
+		(tmp_pathplus_clean / "a.rst").write_text("Title\n=====\n\n.. code:: python\n\n    print()\n")
+		(tmp_pathplus_clean / "b.py").write_text('def foo():\n\t"""\n\tDocstring.\n\t"""\n')
+		(tmp_pathplus_clean / "c.rst").write_text(".. code-block:: python\n\n    print()\n")
+
+		with in_directory(tmp_pathplus_clean):
+			runner = CliRunner(mix_stderr=False)
+			result = runner.invoke(main, args=["a.rst", "b.py", "c.rst", "--verbose", "--no-cache"])
+
+		assert result.exit_code == 0
+		assert result.stdout == "Skipped 2 files without any code blocks\n"
+
+	def test_check(self, tmp_pathplus_clean: PathPlus):
+		dom_toml.dump(
+				{"tool": {"snippet-fmt": {"languages": {"json": {"reformat": True}}, "directives": ["code-block"]}}},
+				tmp_pathplus_clean / "pyproject.toml",
+				)
+		source = '.. code-block:: json\n\n    {"key":   "value"}\n'
+		(tmp_pathplus_clean / "a.rst").write_text(source)
+		(tmp_pathplus_clean / "b.rst").write_text(source.replace("   ", ' '))
+
+		with in_directory(tmp_pathplus_clean):
+			runner = CliRunner(mix_stderr=False)
+			result = runner.invoke(main, args=["a.rst", "b.rst", "--check", "--verbose", "--no-colour"])
+			assert result.exit_code == 1
+			assert result.stdout == f"Would reformat {(tmp_pathplus_clean / 'a.rst').as_posix()}\n"
+			assert (tmp_pathplus_clean / "a.rst").read_text() == source
+
+			# Diffs are only constructed when asked for.
+			result = runner.invoke(main, args=["a.rst", "b.rst", "--check", "--diff", "--no-colour"])
+			assert result.exit_code == 1
+			assert '+    {"key": "value"}' in result.stdout
+			assert (tmp_pathplus_clean / "a.rst").read_text() == source
+
+			result = runner.invoke(main, args=["b.rst", "--check"])
+			assert result.exit_code == 0
+
+	def test_streaming(self, tmp_pathplus_clean: PathPlus, monkeypatch):
+		monkeypatch.setattr(snippet_fmt._runner, "STREAMING_THRESHOLD", 0)
+		dom_toml.dump(
+				{"tool": {"snippet-fmt": {"languages": {"json": {"reformat": True}}, "directives": ["code-block"]}}},
+				tmp_pathplus_clean / "pyproject.toml",
+				)
+		source = '.. code-block:: json\n\n    {"key":   "value"}\n'
+		(tmp_pathplus_clean / "a.rst").write_text(source)
+
+		with in_directory(tmp_pathplus_clean):
+			runner = CliRunner(mix_stderr=False)
+			result = runner.invoke(main, args=["a.rst", "--check", "--no-cache"])
+			assert result.exit_code == 1
+			assert (tmp_pathplus_clean / "a.rst").read_text() == source
+
+			result = runner.invoke(main, args=["a.rst", "--no-cache"])
+			assert result.exit_code == 1
+			assert (tmp_pathplus_clean / "a.rst").read_text() == source.replace(":   ", ": ")
+
+	@pytest.mark.parametrize("check", [True, False])
+	def test_fail_fast(self, tmp_pathplus_clean: PathPlus, check: bool):
+		dom_toml.dump(
+				{"tool": {"snippet-fmt": {"languages": {"json": {"reformat": True}}, "directives": ["code-block"]}}},
+				tmp_pathplus_clean / "pyproject.toml",
+				)
+		source = '.. code-block:: json\n\n    {"key":   "value"}\n\n.. code-block:: json\n\n    [1,   2]\n'
+		filenames = [f"{idx}.rst" for idx in range(3)]
+		for filename in filenames:
+			(tmp_pathplus_clean / filename).write_text(source)
+
+		args = [*filenames, "--fail-fast", "--diff", "--verbose", "--no-colour", "--no-cache"]
+		if check:
+			args.append("--check")
+
+		with in_directory(tmp_pathplus_clean):
+			runner = CliRunner(mix_stderr=False)
+			result = runner.invoke(main, args=args)
+
+		assert result.exit_code == 1
+		assert result.stdout.count("(reformatted)") == 1
+
+		if check:
+			# Only the first code block of the first file was checked.
+			assert "Would reformat" in result.stdout
+			assert "[1, 2]" not in result.stdout
+			assert all((tmp_pathplus_clean / filename).read_text() == source for filename in filenames)
+		else:
+			assert "Reformatting" in result.stdout
+			assert "[1, 2]" in result.stdout
+			assert (tmp_pathplus_clean / "0.rst").read_text() == source.replace(":   ", ": ").replace(",   ", ", ")
+			assert (tmp_pathplus_clean / "1.rst").read_text() == source
+
+	@pytest.mark.parametrize("check", [True, False])
+	def test_fail_fast_jobs(self, tmp_pathplus_clean: PathPlus, check: bool):
+		dom_toml.dump(
+				{"tool": {"snippet-fmt": {"languages": {"json": {"reformat": True}}, "directives": ["code-block"]}}},
+				tmp_pathplus_clean / "pyproject.toml",
+				)
+		source = '.. code-block:: json\n\n    {"key":   "value"}\n'
+		filenames = [f"{idx}.rst" for idx in range(40)]
+		for filename in filenames:
+			(tmp_pathplus_clean / filename).write_text(source)
+
+		args = [*filenames, "--fail-fast", "--verbose", "--no-cache", "--jobs", '2']
+		if check:
+			args.append("--check")
+
+		with in_directory(tmp_pathplus_clean):
+			runner = CliRunner(mix_stderr=False)
+			result = runner.invoke(main, args=args)
+
+		assert result.exit_code == 1
+		assert result.stdout.count("reformat" if check else "Reformatting") == 1
+
+		# Only the reported file was written; the workers left the others alone.
+		changed = [filename for filename in filenames if (tmp_pathplus_clean / filename).read_text() != source]
+		if check:
+			assert changed == []
+		else:
+			assert len(changed) == 1
+			assert f"{changed[0]}\n" in result.stdout
+
 
 @no_type_check
 def check_out(
@@ -619,3 +805,251 @@ def baz():
 	r = PyReformatter((tmp_pathplus / "code.py"), config=config)
 	r.run()
 	advanced_file_regression.check(r.to_string(), extension="._py")
+
+
+@pytest.mark.parametrize(
+		"source",
+		[
+				pytest.param('', id="empty"),
+				pytest.param('\n', id="newline"),
+				pytest.param("\n\n \n", id="blank_lines"),
+				pytest.param("Text\n", id="normalised"),
+				pytest.param("Text", id="no_newline"),
+				pytest.param("Text\n\n\n", id="trailing_lines"),
+				pytest.param("Text \t\nMore\n", id="trailing_whitespace"),
+				pytest.param("Text\r\nMore\r\n", id="crlf"),
+				pytest.param("Text\x0c\n\tMore\u3000\n", id="unicode_whitespace"),
+				],
+		)
+def test_normalise_whitespace(source: str):
+	expected = StringList(source)
+	expected.blankline(ensure_single=True)
+	assert _normalise_whitespace(source) == str(expected)
+
+
+def _large_document(blocks: int) -> str:
+	paragraph = "Lorem ipsum dolor sit amet, consectetur adipiscing elit.\n" * 20
+	block = '.. code-block:: json\n\n    {"key": "value", "list": [1, 2, 3]}\n\n'
+	return (paragraph + '\n' + block) * blocks + "End.\n"
+
+
+def _peak_memory(r: Reformatter) -> int:
+	tracemalloc.start()
+	try:
+		r.run()
+		return tracemalloc.get_traced_memory()[1]
+	finally:
+		tracemalloc.stop()
+
+
+def test_unchanged_document_not_copied():
+	config: SnippetFmtConfigDict = {"languages": {"json": {"reformat": True}}, "directives": ["code-block"]}
+	source = _large_document(3000)
+	assert len(source) > 3_000_000
+
+	r = Reformatter(source, "example.rst", config)
+	peak = _peak_memory(r)
+
+	assert r.to_string() is source
+	assert peak < len(source) // 100
+
+
+def test_changed_document_copied_once():
+	config: SnippetFmtConfigDict = {"languages": {"json": {"reformat": True}}, "directives": ["code-block"]}
+	source = _large_document(3000).replace('"key": "value"', '"key":   "value"', 1)
+
+	r = Reformatter(source, "example.rst", config)
+	peak = _peak_memory(r)
+
+	assert r.to_string() == _large_document(3000)
+	# The reformatted document, plus the unchanged parts of the original before they are joined.
+	assert peak < len(source) * 2.5
+
+
+def _many_errors(n: int) -> str:
+	paragraph = "Lorem ipsum dolor sit amet, consectetur adipiscing elit.\n" * 10
+	return (paragraph + "\n.. code-block:: json\n\n    {\n\n") * n
+
+
+def test_many_errors_line_index(capsys, monkeypatch):
+	config: SnippetFmtConfigDict = {"languages": {"json": {}}, "directives": ["code-block"]}
+	indexes: List[LineIndex] = []
+	lookups: List[int] = []
+
+	class CountingLineIndex(LineIndex):
+
+		def __init__(self, source: str):
+			super().__init__(source)
+			indexes.append(self)
+
+		def lineno(self, offset: int) -> int:
+			lookups.append(offset)
+			return super().lineno(offset)
+
+	monkeypatch.setattr(snippet_fmt, "LineIndex", CountingLineIndex)
+
+	n = 1000
+	r = Reformatter(_many_errors(n), "example.rst", config)
+	r.run()
+
+	assert len(r.errors) == n
+	assert capsys.readouterr().err.splitlines()[-1] == (
+			f"example.rst:{n * 15 - 3}: JSONDecodeError: "
+			f"Expecting property name enclosed in double quotes: line 2 column 1 (char 2)"
+			)
+
+	# Finding the line number of each error used to scan the document up to the error, which was quadratic.
+	# The document is now indexed once, and each error looked up in the index.
+	assert len(indexes) == 1
+	assert len(lookups) == n
+
+
+def _full_diff(r: Reformatter) -> str:
+	return coloured_diff(
+			r._unformatted_source.split('\n'),
+			r.to_string().split('\n'),
+			"example.rst",
+			"example.rst",
+			"(original)",
+			"(reformatted)",
+			lineterm='',
+			)
+
+
+_json_block = '.. code-block:: json\n\n    {"key":   "value"}\n\n'
+
+
+@pytest.mark.parametrize(
+		"source",
+		[
+				pytest.param(_json_block, id="single"),
+				pytest.param(_json_block.rstrip('\n'), id="no_trailing_newline"),
+				pytest.param(f"Title\n=====\n\n{_json_block}Text\n\n{_json_block}More\n", id="several"),
+				pytest.param(_json_block * 3, id="adjacent"),
+				pytest.param(f"Text  \n\n{_json_block}", id="trailing_whitespace"),
+				pytest.param(_large_document(10).replace('"key": "value"', '"key":  "value"'), id="repeated"),
+				pytest.param(
+						_large_document(100).replace('"key": "value"', '"key":  "value"', 1) + _json_block,
+						id="first_and_last",
+						),
+				],
+		)
+def test_get_diff(source: str):
+	config: SnippetFmtConfigDict = {"languages": {"json": {"reformat": True}}, "directives": ["code-block"]}
+
+	r = Reformatter(source, "example.rst", config)
+	assert r.run()
+	assert r.get_diff() == _full_diff(r)
+
+
+def test_get_diff_large_document(monkeypatch):
+	config: SnippetFmtConfigDict = {"languages": {"json": {"reformat": True}}, "directives": ["code-block"]}
+	source = _large_document(3000).replace('"key": "value"', '"key":   "value"', 1)
+
+	r = Reformatter(source, "example.rst", config)
+	r.run()
+	expected = _full_diff(r)
+
+	compared: List[int] = []
+	set_seq2 = difflib.SequenceMatcher.set_seq2
+
+	def recording_set_seq2(self, b):
+		compared.append(len(b))
+		set_seq2(self, b)
+
+	monkeypatch.setattr(difflib.SequenceMatcher, "set_seq2", recording_set_seq2)
+	diff = r.get_diff()
+
+	assert diff == expected
+	assert strip_ansi(diff).count("@@ ") == 1
+
+	# Only the changed code block is compared, rather than the whole document.
+	assert compared
+	assert max(compared) < 10
+
+
+@pytest.mark.benchmark
+def test_get_diff_large_document_benchmark():
+	config: SnippetFmtConfigDict = {"languages": {"json": {"reformat": True}}, "directives": ["code-block"]}
+	source = _large_document(3000).replace('"key": "value"', '"key":   "value"', 1)
+
+	r = Reformatter(source, "example.rst", config)
+	r.run()
+	r.get_diff()
+
+	timings = []
+
+	for get_diff in (r.get_diff, lambda: _full_diff(r)):
+		best = float("inf")
+
+		for _ in range(3):
+			start = time.perf_counter()
+			get_diff()
+			best = min(best, time.perf_counter() - start)
+
+		timings.append(best)
+
+	assert timings[0] < timings[1] * 0.75
+
+
+_streaming_sources = [
+		pytest.param(_json_block * 3, id="blocks"),
+		pytest.param(f"Title  \n=====\n\n{_json_block}Text\t\n\n\n", id="trailing_whitespace"),
+		pytest.param(f"Text\n\n  Indented  \n\n  {_json_block}  More\n", id="indented"),
+		pytest.param(f"Text  \n\n{_json_block}.. code-block:: json\n\n    {{\n\n{_json_block}", id="errors"),
+		pytest.param(_json_block.rstrip('\n'), id="no_trailing_newline"),
+		pytest.param("Title\n=====\n\nText\n", id="unchanged"),
+		pytest.param('', id="empty"),
+		]
+
+
+@pytest.mark.parametrize("source", _streaming_sources)
+@pytest.mark.parametrize("chunk_size", [1, 7, 1024])
+def test_run_streaming(tmp_pathplus: PathPlus, source: str, chunk_size: int, capsys):
+	config: SnippetFmtConfigDict = {"languages": {"json": {"reformat": True}}, "directives": ["code-block"]}
+	filename = tmp_pathplus / "example.rst"
+	filename.write_text(source)
+
+	r = Reformatter(source, filename.as_posix(), config)
+	changed = r.run()
+	expected_err = capsys.readouterr().err
+
+	streaming = RSTReformatter(filename, config)
+	streaming.chunk_size = chunk_size
+	assert streaming.run_streaming() is changed
+	assert capsys.readouterr().err == expected_err
+	assert [error.offset for error in streaming.errors] == [error.offset for error in r.errors]
+
+	assert filename.read_text() == r.to_string()
+	assert [p.name for p in tmp_pathplus.iterdir()] == ["example.rst"]
+
+
+def test_run_streaming_no_write(tmp_pathplus: PathPlus):
+	config: SnippetFmtConfigDict = {"languages": {"json": {"reformat": True}}, "directives": ["code-block"]}
+	filename = tmp_pathplus / "example.rst"
+	filename.write_text(_json_block)
+
+	assert RSTReformatter(filename, config).run_streaming(write=False)
+	assert filename.read_text() == _json_block
+	assert [p.name for p in tmp_pathplus.iterdir()] == ["example.rst"]
+
+
+def test_run_streaming_memory(tmp_pathplus: PathPlus):
+	config: SnippetFmtConfigDict = {"languages": {"json": {"reformat": True}}, "directives": ["code-block"]}
+	source = _large_document(3000).replace('"key": "value"', '"key":   "value"')
+	filename = tmp_pathplus / "example.rst"
+	filename.write_text(source)
+
+	r = RSTReformatter(filename, config)
+	r.chunk_size = 16 * 1024
+
+	tracemalloc.start()
+	try:
+		assert r.run_streaming()
+		peak = tracemalloc.get_traced_memory()[1]
+	finally:
+		tracemalloc.stop()
+
+	assert filename.read_text() == _large_document(3000)
+	# A few chunks at a time, rather than several copies of the whole document.
+	assert peak < len(source) // 10